@@ -12,6 +12,9 @@ setup(name='welo',
         "requests",
         "appdirs",
     ],
+    extras_require={
+        "forecast": ["numpy"],
+    },
     entry_points = {
         'console_scripts': ['welo=welo:main'],
     },
@@ -0,0 +1,125 @@
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from collections import OrderedDict as odict
+
+from welo import model
+from welo import check
+
+def food(name, amount, energy):
+    return odict([("name", name), ("amount", amount), ("nutriInfo", odict([("energy", energy)]))])
+
+def total(amount, energy):
+    return odict([("amount", amount), ("nutriInfo", odict([("energy", energy)]))])
+
+def meal(time, items, mealTotal=None):
+    ret = odict([("time", time), ("food", items)])
+    if mealTotal:
+        ret["total"] = mealTotal
+    return ret
+
+def leftovers(time, factor):
+    return odict([("leftovers", time), ("factor", factor)])
+
+# A data file with a problem in almost every entry
+def writeDataFile(path):
+    data = odict([
+        ("version", model.version),
+        ("generation", 7),
+        ("config", odict([("height", "1.85m"), ("sex", "male"), ("weight", "heavy")])),
+        ("weight", [
+            odict([("time", "2018-05-01T08:00:00"), ("weight", "80kg")]),
+            odict([("time", "2018-05-02T08:00:00"), ("weight", "eighty")]),
+        ]),
+        ("workout", [
+            odict([("time", "2018-05-01T18:00:00"), ("name", "run"), ("duration", "30min"), ("energy", "a lot")]),
+        ]),
+        ("meals", [
+            meal("2018-05-01T13:00:00", [food("pasta", "400g", "600kcal"), food("sauce", "5OOg", "200kcal")], total("600g", "800kcal")),
+            meal("2018-05-01T19:00:00", [food("salad", "100g", "20kcal"), food("bread", "50g", "130kcal")], total("150g", "500kcal")),
+            meal("2018-05-02T13:00:00", [leftovers("2018-05-01T13:00:00", 0.5)], total("300g", "400kcal")),
+            meal("2018-05-02T19:00:00", [leftovers("2018-04-01T13:00:00", 1.0)], total("100g", "100kcal")),
+            meal("tomorrow", [food("pasta", "400g", "600kcal")]),
+            meal("2018-05-03T13:00:00", [food("apple", "150g", "some")], total("150g", "80kcal")),
+        ]),
+        ("tags", odict()),
+        ("balance", odict([("start", "2018-05-01"), ("days", [1]), ("intake", [800]), ("bmr", [1800]), ("expenditure", [2500])])),
+        ("dayHashes", odict([("2018-05-01", "0123456789abcdef")])),
+    ])
+    with open(path, "w") as f:
+        json.dump(data, f, indent=4)
+
+def readFile(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+class CheckTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "data.json")
+        writeDataFile(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def check(self, path, repair=False, output=None):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            check.check(path, repair, output)
+        return out.getvalue().splitlines()
+
+    def testProblems(self):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out), self.assertRaises(model.WeloError):
+            check.check(self.path)
+        lines = out.getvalue().splitlines()
+        self.assertIn("config weight: \"heavy\" is not a mass (removed)", lines)
+        self.assertIn("weight[1] @ 02.05.2018 08:00 weight: 'eighty' is not a mass (the weight is removed)", lines)
+        self.assertIn("workout[0] @ 01.05.2018 18:00 energy: 'a lot' is not an energy (removed)", lines)
+        self.assertIn("meals[0] @ 01.05.2018 13:00 food[1].amount: '5OOg' is not a mass (the food item is removed)", lines)
+        self.assertIn("meals[1] @ 01.05.2018 19:00 total: does not match the food items (recomputed)", lines)
+        self.assertIn("meals[2] @ 02.05.2018 13:00 total: includes leftovers of a meal that is repaired (recomputed)", lines)
+        self.assertIn("meals[3] @ 02.05.2018 19:00 food[0]: refers to leftovers of a meal @ 01.04.2018 13:00 that does not exist (removed)", lines)
+        self.assertIn("meals[3] @ 02.05.2018 19:00 food: has no valid food items (the meal is removed)", lines)
+        self.assertIn("meals[4] time: 'tomorrow' is not a time (the entry is removed)", lines)
+        self.assertIn("meals[5] @ 03.05.2018 13:00 food[0].nutriInfo.energy: 'some' is not an energy (removed)", lines)
+        self.assertIn("Checked 9 entries, found 10 problems.", lines)
+
+    def testRepair(self):
+        before = readFile(self.path)
+        output = os.path.join(self.directory, "repaired.json")
+        self.check(self.path, repair=True, output=output)
+        self.assertEqual(readFile(self.path), before)
+        with open(output) as f:
+            data = json.load(f, object_pairs_hook=odict)
+
+        self.assertEqual(data["config"], odict([("height", "1.85m"), ("sex", "male")]))
+        self.assertEqual([entry["weight"] for entry in data["weight"]], ["80kg"])
+        self.assertNotIn("energy", data["workout"][0])
+
+        meals = data["meals"]
+        self.assertEqual([meal["time"] for meal in meals],
+            ["2018-05-01T13:00:00", "2018-05-01T19:00:00", "2018-05-02T13:00:00", "2018-05-03T13:00:00"])
+        self.assertEqual(meals[0]["food"], [food("pasta", "400g", "600kcal")])
+        self.assertEqual(meals[0]["total"], total("400g", "600kcal"))
+        self.assertEqual(meals[1]["total"], total("150g", "150kcal"))
+        # The leftovers refer to what is left of the repaired meal
+        self.assertEqual(meals[2]["food"], [leftovers("2018-05-01T13:00:00", 0.5)])
+        self.assertEqual(meals[2]["total"], total("200g", "300kcal"))
+        self.assertEqual(meals[3]["food"], [odict([("name", "apple"), ("amount", "150g"), ("nutriInfo", odict())])])
+        self.assertEqual(meals[3]["total"], odict([("amount", "150g"), ("nutriInfo", odict())]))
+
+        # Everything that is computed from the entries is computed again
+        self.assertNotIn("balance", data)
+        self.assertNotIn("dayHashes", data)
+        self.assertEqual(data["generation"], 8)
+
+        # The repaired copy has no problems left
+        self.assertIn("Checked 6 entries, found 0 problems.", self.check(output))
+
+if __name__ == "__main__":
+    unittest.main()
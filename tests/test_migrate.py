@@ -0,0 +1,100 @@
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from collections import OrderedDict as odict
+
+from welo import model
+from welo import welo
+
+def food(name, grams, kcal):
+    return odict([("name", name), ("amount", "{:g}g".format(grams)), ("nutriInfo", odict([("energy", "{:g}kcal".format(kcal))]))])
+
+def pasta(factor):
+    return [food("pasta", 400 * factor, 600 * factor), food("sauce", 200 * factor, 200 * factor)]
+
+# Before version 3, leftovers were stored as scaled copies of the food items of the meal they were leftovers of
+meals = [
+    ("01.05.2018 13:00", pasta(1)),
+    # Leftovers only refer to the first meal at a time
+    ("01.05.2018 13:00", [food("rice", 300, 390), food("curry", 300, 450)]),
+    ("02.05.2018 12:00", pasta(0.5)),
+    ("02.05.2018 13:00", [food("rice", 150, 195), food("curry", 150, 225)]),
+    # Leftovers of the leftovers above
+    ("02.05.2018 19:00", pasta(0.25)),
+    ("03.05.2018 12:00", pasta(0.25)),
+    # All of the pasta has been eaten already
+    ("03.05.2018 19:00", pasta(0.25)),
+    ("04.05.2018 19:00", [food("beans", 300, 300), food("meat", 200, 500)]),
+    # Too long after the chili above to be leftovers of it
+    ("08.05.2018 19:00", [food("beans", 150, 150), food("meat", 100, 250)]),
+    # Cooked again, more than three days after the pasta above
+    ("10.05.2018 13:00", pasta(1)),
+    ("11.05.2018 13:00", pasta(0.5) + [food("salad", 100, 20), food("bread", 50, 130)]),
+    # Leftovers of a meal that contains leftovers itself
+    ("12.05.2018 13:00", pasta(0.25) + [food("salad", 50, 10), food("bread", 25, 65)]),
+]
+
+def writeVersion1File(path):
+    data = odict([
+        ("config", odict([("height", "1.85m"), ("sex", "male"), ("birthday", "01.01.1990 00:00"), ("activity", "1.4"), ("weight", "80kg")])),
+        ("weight", []),
+        ("workout", []),
+        ("meals", [odict([("time", time), ("food", items)]) for time, items in meals]),
+    ])
+    with open(path, "w") as f:
+        json.dump(data, f, indent=4)
+
+def leftovers(time, factor):
+    return odict([("leftovers", time), ("factor", factor)])
+
+class MigrateTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "data.json")
+        writeVersion1File(self.path)
+        with open(self.path) as f:
+            data = welo.DataWrapper(json.load(f, object_pairs_hook=odict), self.path)
+        with contextlib.redirect_stdout(io.StringIO()):
+            data.migrate()
+        with open(self.path) as f:
+            self.data = json.load(f, object_pairs_hook=odict)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testVersion(self):
+        self.assertEqual(self.data["version"], model.version)
+        self.assertEqual(self.data["meals"][0]["time"], "2018-05-01T13:00:00")
+
+    def testReferences(self):
+        mealFood = [meal["food"] for meal in self.data["meals"]]
+        self.assertEqual(mealFood[0], pasta(1))
+        self.assertEqual(mealFood[2], [leftovers("2018-05-01T13:00:00", 0.5)])
+        self.assertEqual(mealFood[4], [leftovers("2018-05-01T13:00:00", 0.25)])
+        self.assertEqual(mealFood[5], [leftovers("2018-05-01T13:00:00", 0.25)])
+        self.assertEqual(mealFood[9], pasta(1))
+        self.assertEqual(mealFood[10], [leftovers("2018-05-10T13:00:00", 0.5), food("salad", 100, 20), food("bread", 50, 130)])
+        self.assertEqual(mealFood[11], [leftovers("2018-05-10T13:00:00", 0.25), leftovers("2018-05-11T13:00:00", 0.5)])
+
+    def testNotLeftovers(self):
+        mealFood = [meal["food"] for meal in self.data["meals"]]
+        # The rice of the second meal at 13:00 can not be referred to
+        self.assertEqual(mealFood[3], [food("rice", 150, 195), food("curry", 150, 225)])
+        # More than all of the pasta
+        self.assertEqual(mealFood[6], pasta(0.25))
+        self.assertEqual(mealFood[8], [food("beans", 150, 150), food("meat", 100, 250)])
+
+    # The leftovers stand for the same food items as the copies they replaced
+    def testTotals(self):
+        data = welo.DataWrapper(self.data, self.path)
+        for meal, (time, items) in zip(data.getSection("meals"), meals):
+            total = data.computeMealTotal(meal)
+            self.assertAlmostEqual(total.amount, sum(model.parseQuantity(item["amount"]) for item in items), msg=time)
+            self.assertAlmostEqual(total.nutriInfo["energy"], sum(model.parseQuantity(item["nutriInfo"]["energy"]) for item in items), msg=time)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from collections import OrderedDict as odict
+from datetime import datetime, date, timedelta
+
+from welo import model
+from welo.store import WeloStore
+
+def dayStart(days=0):
+    return datetime.combine(date.today() - timedelta(days=days), datetime.min.time())
+
+# A data file with a meal on every one of the last days, so queries have complete days to compute the energy balance of
+def writeDataFile(path, days=3):
+    meals = []
+    for i in range(days, 0, -1):
+        day = dayStart(i)
+        meals.append(odict([
+            ("time", model.encodeTime(day + timedelta(hours=13))),
+            ("food", [odict([("name", "pasta"), ("amount", "500g"), ("nutriInfo", odict([("energy", "735kcal")]))])]),
+        ]))
+    data = odict([
+        ("version", model.version),
+        ("config", odict([("height", "1.85m"), ("sex", "male"), ("birthday", "1990-01-01"), ("activity", "1.4"), ("weight", "80kg")])),
+        ("weight", []),
+        ("workout", []),
+        ("meals", meals),
+        ("tags", odict()),
+    ])
+    with open(path, "w") as f:
+        json.dump(data, f, indent=4)
+
+def readFile(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+class WeloStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "data.json")
+        writeDataFile(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testQueriesDoNotWrite(self):
+        before = readFile(self.path)
+        store = WeloStore(self.path)
+        store.getMealTotals(dayStart(3), dayStart())
+        store.getBalance(dayStart(3))
+        self.assertEqual(readFile(self.path), before)
+
+    def testRollbackAfterQuery(self):
+        before = readFile(self.path)
+        store = WeloStore(self.path)
+        store.setNutriInfo("pasta", {"energy": "147kcal"})
+        store.eat([("500g", "pasta")], time=datetime.now() - timedelta(days=1))
+        # Queries in the middle of a batch must not persist the pending meal
+        totals = store.getMealTotals(dayStart(1), dayStart())
+        self.assertEqual(len(store.getMeals(dayStart(1), dayStart())), 2)
+        store.getBalance(dayStart(3))
+        self.assertEqual(readFile(self.path), before)
+
+        store.rollback()
+        self.assertEqual(readFile(self.path), before)
+        self.assertEqual(len(store.getMeals(dayStart(1), dayStart())), 1)
+        self.assertEqual(totals["days"], 1)
+
+    def testCommitPersistsBalance(self):
+        store = WeloStore(self.path)
+        store.setConfig("goalWeight", "75kg")
+        store.commit()
+        with open(self.path) as f:
+            series = json.load(f)["balance"]
+        self.assertEqual(series["start"], model.encodeDay(dayStart(3).date()))
+        self.assertEqual(series["days"], [1, 2, 3])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1 +1,3 @@
 from .welo import *
+from .model import WeloError
+from .store import WeloStore
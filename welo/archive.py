@@ -0,0 +1,134 @@
+import gzip
+import json
+import lzma
+import os
+from collections import OrderedDict as odict
+from datetime import datetime
+
+from . import model
+
+sections = ["weight", "workout", "meals"]
+
+compressions = {
+    "gzip": (".json.gz", gzip.open),
+    "lzma": (".json.xz", lzma.open),
+}
+
+def monthStart(dt):
+    return datetime(dt.year, dt.month, 1)
+
+def nextMonthStart(dt):
+    if dt.month == 12:
+        return datetime(dt.year + 1, 1, 1)
+    else:
+        return datetime(dt.year, dt.month + 1, 1)
+
+def getOpenFunc(fileName):
+    for extension, openFunc in compressions.values():
+        if fileName.endswith(extension):
+            return openFunc
+    raise ValueError("'{}' is not an archive segment!".format(fileName))
+
+def openSegment(path, mode):
+    return getOpenFunc(path)(path, mode)
+
+# Old log entries are moved into compressed, immutable segments (one or more per month)
+# in a directory next to the data file. The manifest lists the time range of every segment,
+# so that range queries only have to decompress the segments they actually overlap.
+class Archive(object):
+    def __init__(self, path):
+        self.path = path
+        self.manifestPath = os.path.join(path, "manifest.json")
+        self._manifest = None
+        self.segmentCache = {}
+
+    def getManifest(self):
+        if self._manifest == None:
+            if os.path.isfile(self.manifestPath):
+                with open(self.manifestPath) as f:
+                    self._manifest = json.load(f, object_pairs_hook=odict)
+            else:
+                self._manifest = odict([("segments", [])])
+        return self._manifest
+
+    def saveManifest(self):
+        os.makedirs(self.path, exist_ok=True)
+        tmpPath = self.manifestPath + ".tmp"
+        with open(tmpPath, "w") as f:
+            json.dump(self.getManifest(), f, indent=4)
+        os.replace(tmpPath, self.manifestPath)
+
+    # Returns the segment's sections as lists of model objects
+    def loadSegment(self, segment):
+        fileName = segment["file"]
+        if fileName not in self.segmentCache:
+            with openSegment(os.path.join(self.path, fileName), "rt") as f:
+                items = json.load(f, object_pairs_hook=odict)
+            self.segmentCache[fileName] = odict((section, model.fromJson(section, items.get(section, [])))
+                for section in sections)
+        return self.segmentCache[fileName]
+
+    def getSegments(self, startTime, endTime):
+        for segment in self.getManifest()["segments"]:
+            segmentStart = model.decodeTime(segment["start"])
+            segmentEnd = model.decodeTime(segment["end"])
+            if segmentStart < endTime and segmentEnd > startTime:
+                yield segment
+
+    def getItems(self, section, startTime, endTime):
+        for segment in self.getSegments(startTime, endTime):
+            if segment.get(section, 0) > 0:
+                yield from self.loadSegment(segment)[section]
+
+    def segmentFileName(self, periodStart, extension):
+        existing = set(segment["file"] for segment in self.getManifest()["segments"])
+        base = periodStart.strftime("%Y-%m")
+        fileName = base + extension
+        counter = 1
+        while fileName in existing or os.path.exists(os.path.join(self.path, fileName)):
+            fileName = "{}.{}{}".format(base, counter, extension)
+            counter += 1
+        return fileName
+
+    def addItems(self, items, compression):
+        extension, openFunc = compressions[compression]
+
+        periods = odict()
+        for section in sections:
+            for item in items[section]:
+                periodStart = monthStart(item.time)
+                period = periods.setdefault(periodStart, odict((s, []) for s in sections))
+                period[section].append(item)
+
+        os.makedirs(self.path, exist_ok=True)
+        for periodStart in sorted(periods):
+            period = periods[periodStart]
+            fileName = self.segmentFileName(periodStart, extension)
+            with openFunc(os.path.join(self.path, fileName), "wt") as f:
+                json.dump(odict((section, model.toJson(sectionItems)) for section, sectionItems in period.items()), f)
+
+            segment = odict()
+            segment["file"] = fileName
+            segment["start"] = model.encodeTime(periodStart)
+            segment["end"] = model.encodeTime(nextMonthStart(periodStart))
+            for section in sections:
+                segment[section] = len(period[section])
+            self.getManifest()["segments"].append(segment)
+            print("Wrote archive segment '{}' ({} weights, {} workouts, {} meals)".format(
+                fileName, segment["weight"], segment["workout"], segment["meals"]))
+
+        # The data file references the archive, so the manifest has to be written before it
+        self.saveManifest()
+
+    # Rewrites all segments in the current format (see model.version)
+    def migrate(self):
+        for segment in self.getManifest()["segments"]:
+            items = self.loadSegment(segment)
+            path = os.path.join(self.path, segment["file"])
+            with getOpenFunc(segment["file"])(path + ".tmp", "wt") as f:
+                json.dump(odict((section, model.toJson(sectionItems)) for section, sectionItems in items.items()), f)
+            os.replace(path + ".tmp", path)
+            segment["start"] = model.encodeTime(model.decodeTime(segment["start"]))
+            segment["end"] = model.encodeTime(model.decodeTime(segment["end"]))
+        self.saveManifest()
+        return len(self.getManifest()["segments"])
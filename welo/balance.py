@@ -0,0 +1,155 @@
+from collections import OrderedDict as odict
+from datetime import datetime, date, timedelta, time
+
+from . import quantities as q
+from . import model
+
+# Rough estimate of the energy stored in 1kg of body fat
+kcalPerKg = 7700
+
+# The series is stored as prefix sums over days, so the totals of any range
+# of days are a single subtraction: series[lastDay] - series[firstDay - 1]
+seriesKeys = ["days", "intake", "bmr", "expenditure"]
+
+# Only used to show days, they are stored as ISO 8601 (see model.encodeDay)
+def dayStr(d):
+    return d.strftime(model.dayFormat)
+
+def dayStart(d):
+    return datetime.combine(d, time(0, 0))
+
+def dayRange(firstDay, lastDay):
+    day = firstDay
+    while day <= lastDay:
+        yield day
+        day += timedelta(days=1)
+
+def groupByDay(items):
+    days = {}
+    for item in items:
+        days.setdefault(item.time.date(), []).append(item)
+    return days
+
+# Returns the (time, mass) of the weights before endTime, sorted by time, and the weight before the first of them.
+# The archive is only opened for archived days or if neither the data file nor the archive info (see
+# DataWrapper.archiveLogs) has a weight before startTime, so the balance of recent days never touches it.
+def getWeights(data, startTime, endTime):
+    weights = sorted((item for item in data.getSection("weight") if item.time < endTime), key=lambda item: item.time)
+    archivedUntil = data.getArchivedUntil()
+    lastArchived = data.data["archive"].get("lastWeight") if archivedUntil else None
+    if archivedUntil:
+        # Archives written before the last weight was stored only have to be opened if the data file has none either
+        hasWeightBefore = lastArchived != None or any(item.time < startTime for item in weights)
+        if startTime < archivedUntil or not hasWeightBefore:
+            weights = data.getItems("weight", datetime.min, endTime)
+            weights = sorted((item for item in weights if item.time < endTime), key=lambda item: item.time)
+            lastArchived = None
+    weights = [(item.time, q.Mass(item.weight)) for item in weights]
+    if lastArchived:
+        weight = q.Mass(lastArchived)
+    elif len(weights) > 0:
+        weight = weights[0][1]
+    else:
+        weight = data.getConfig("weight")
+    return weights, weight
+
+# Returns one odict per day with the intake, basal metabolic rate and total energy expenditure in kcal.
+# The expenditure is the basal metabolic rate at that day's weight and age times the configured
+# physical activity level plus the energy of the logged workouts. Days without logged meals are
+# counted as not logged (days = 0) and do not contribute anything.
+def computeDays(data, firstDay, lastDay):
+    startTime, endTime = dayStart(firstDay), dayStart(lastDay + timedelta(days=1))
+    meals = groupByDay(data.getLogs(startTime, "meals", endTime))
+    workouts = groupByDay(data.getLogs(startTime, "workout", endTime))
+
+    weights, weight = getWeights(data, startTime, endTime)
+    activity = data.getActivity()
+
+    weightIndex = 0
+    for day in dayRange(firstDay, lastDay):
+        dayEnd = dayStart(day + timedelta(days=1))
+        while weightIndex < len(weights) and weights[weightIndex][0] < dayEnd:
+            weight = weights[weightIndex][1]
+            weightIndex += 1
+
+        values = odict((key, 0) for key in seriesKeys)
+        bmr = data.getBmr(weight, day) if day in meals else None
+        if bmr and activity:
+            values["days"] = 1
+            for meal in meals[day]:
+                nutriInfo = data.getMealTotal(meal).nutriInfo
+                if "energy" in nutriInfo:
+                    values["intake"] += q.Energy(nutriInfo["energy"]).kcal()
+            values["bmr"] = bmr
+            values["expenditure"] = bmr * activity
+            for workout in workouts.get(day, []):
+                if workout.energy != None:
+                    values["expenditure"] += q.Energy(workout.energy).kcal()
+        yield values
+
+def getFirstDay(data):
+    firstTime = None
+    for item in data.getItems("meals", datetime.min, datetime.max):
+        if firstTime == None or item.time < firstTime:
+            firstTime = item.time
+    return firstTime.date() if firstTime else None
+
+# Extends the prefix sums up to (and including) yesterday. Only complete days are persisted, since today's values
+# will still change. This is called by queries, so the extended sums are only kept in memory and written
+# by the next save (queries never write the data file), which extends them as well (see DataWrapper.save).
+def update(data):
+    series = data.data.get("balance")
+    if series == None:
+        firstDay = getFirstDay(data)
+        if firstDay == None:
+            return None
+        series = odict([("start", model.encodeDay(firstDay))])
+        for key in seriesKeys:
+            series[key] = []
+
+    lastDay = date.today() - timedelta(days=1)
+    firstDay = model.decodeDay(series["start"])
+    nextDay = firstDay + timedelta(days=len(series["days"]))
+    if nextDay <= lastDay:
+        for values in computeDays(data, nextDay, lastDay):
+            for key in seriesKeys:
+                previous = series[key][-1] if len(series[key]) > 0 else 0
+                series[key].append(round(previous + values[key], 1))
+        data.data["balance"] = series
+    return series
+
+# Drops the persisted sums from the day of 'time' on, because something changed on that day
+def invalidate(data, time):
+    series = data.data.get("balance")
+    if series == None:
+        return
+    day = q.Time(time).datetime.date()
+    index = (day - model.decodeDay(series["start"])).days
+    if index <= 0:
+        del data.data["balance"]
+    else:
+        for key in seriesKeys:
+            del series[key][index:]
+
+def getRange(data, firstDay, lastDay):
+    totals = odict((key, 0) for key in seriesKeys)
+    series = update(data)
+    if series == None:
+        return totals
+
+    seriesStart = model.decodeDay(series["start"])
+    seriesEnd = seriesStart + timedelta(days=len(series["days"]) - 1)
+    firstIndex = max((firstDay - seriesStart).days, 0)
+    lastIndex = (min(lastDay, seriesEnd) - seriesStart).days
+    if firstIndex <= lastIndex:
+        for key in seriesKeys:
+            before = series[key][firstIndex - 1] if firstIndex > 0 else 0
+            totals[key] += series[key][lastIndex] - before
+
+    # Today (or anything else not persisted yet) is computed on the fly
+    if lastDay > seriesEnd:
+        for values in computeDays(data, max(firstDay, seriesEnd + timedelta(days=1)), lastDay):
+            for key in seriesKeys:
+                totals[key] += values[key]
+
+    return totals
@@ -0,0 +1,463 @@
+import concurrent.futures
+import functools
+import json
+import os
+from collections import OrderedDict as odict
+from datetime import datetime, timedelta
+
+from . import quantities as q
+from . import model
+from . import nutrients
+from . import archive
+
+# The kinds of the configuration values (see DataWrapper.getConfig)
+configTypes = {
+    "height": q.Length,
+    "weight": q.Mass,
+    "goalWeight": q.Mass,
+    "activity": q.Activity,
+    "birthday": q.Time,
+    "sex": q.Sex,
+}
+
+energyUnits = ["kcal", "kj", "j"]
+
+# The number of entries that are checked at once (by one worker process)
+chunkSize = 2000
+
+# Like model.parseQuantity, but the quantity also has to be a mass or an energy ('kind').
+# The same few values (e.g. "0g") make up most of a data file, so they are only parsed once.
+@functools.lru_cache(maxsize=65536)
+def parseQuantityStr(s, kind):
+    name = "an energy" if kind == "energy" else "a mass"
+    try:
+        m = model.quantityRegex.match(s.strip().lower())
+        if m:
+            isEnergy = m.group(2) in energyUnits
+            value = float(m.group(1)) * model.unitFactors[m.group(2)]
+        else:
+            value = model.parseQuantity(s)
+            isEnergy = isinstance(q.fromStr(s), q.Energy)
+    except ValueError:
+        raise ValueError("'{}' is not {}".format(s, name))
+    if isEnergy != (kind == "energy"):
+        raise ValueError("'{}' is not {}".format(s, name))
+    return value
+
+def parseQuantity(s, kind):
+    if not isinstance(s, str):
+        raise ValueError("{} is not a quantity".format(json.dumps(s)))
+    return parseQuantityStr(s, kind)
+
+@functools.lru_cache(maxsize=None)
+def getKind(key):
+    return "energy" if nutrients.get(key).unit == "kcal" else "mass"
+
+def parseTime(s):
+    if not isinstance(s, str):
+        raise ValueError("{} is not a time".format(json.dumps(s)))
+    try:
+        return model.decodeTime(s)
+    except ValueError:
+        raise ValueError("'{}' is not a time".format(s))
+
+# Returns the amount and nutritional information (SI units) of a food item or total and the repaired item.
+# Values that can not be parsed are removed from the nutritional information, the item is removed (None) if its amount can not be.
+def checkFoodItem(item, path, report):
+    if not isinstance(item, dict):
+        report(path, "is not a food item", "removed")
+        return None, None, None
+    try:
+        amount = parseQuantity(item.get("amount"), "mass")
+    except ValueError as e:
+        report(path + ".amount", str(e), "the food item is removed")
+        return None, None, None
+    nutriInfo = odict()
+    repaired = item
+    rawNutriInfo = item.get("nutriInfo")
+    if not isinstance(rawNutriInfo, dict):
+        report(path + ".nutriInfo", "is missing", "set to empty")
+        rawNutriInfo = odict()
+        repaired = odict(item)
+        repaired["nutriInfo"] = rawNutriInfo
+    for key, value in rawNutriInfo.items():
+        try:
+            nutriInfo[key] = parseQuantity(value, getKind(key))
+        except ValueError as e:
+            report("{}.nutriInfo.{}".format(path, key), str(e), "removed")
+            if repaired is item:
+                repaired = odict(item)
+                repaired["nutriInfo"] = odict(rawNutriInfo)
+            del repaired["nutriInfo"][key]
+    return amount, nutriInfo, repaired
+
+# Sums up the parts of a meal (see checkMeal). getSource returns the sum of the food items of the meal
+# at a time or None if there is none. Returns (amount, nutritional information, number of food items).
+def sumParts(parts, getSource):
+    amount, nutriInfo, count = 0.0, odict(), 0
+    for part in parts:
+        if part[0] == "food":
+            amount += part[1]
+            model.addNutriInfo(nutriInfo, part[2])
+            count += 1
+        else:
+            sourceAmount, sourceNutriInfo, sourceCount = getSource(part[1])
+            amount += sourceAmount * part[2]
+            model.addNutriInfo(nutriInfo, model.scaleNutriInfo(sourceNutriInfo, part[2]))
+            count += sourceCount
+    return amount, nutriInfo, count
+
+def totalJson(amount, nutriInfo):
+    return model.FoodItem(None, amount, nutriInfo).toJson()
+
+# Every check function returns the time of an entry and the repaired entry (the entry itself if nothing was repaired
+# or None if it has to be removed). report(path, message, repair) reports a problem at a path inside the entry.
+
+def checkWeight(entry, report, info):
+    try:
+        parseQuantity(entry.get("weight"), "mass")
+    except ValueError as e:
+        report("weight", str(e), "the weight is removed")
+        return None
+    return entry
+
+def checkWorkout(entry, report, info):
+    if not isinstance(entry.get("name"), str):
+        report("name", "is missing", "the workout is removed")
+        return None
+    try:
+        q.Duration(entry.get("duration"))
+    except (ValueError, TypeError, AttributeError):
+        report("duration", "{} is not a duration".format(json.dumps(entry.get("duration"))), "the workout is removed")
+        return None
+    if "energy" in entry:
+        try:
+            parseQuantity(entry["energy"], "energy")
+        except ValueError as e:
+            report("energy", str(e), "removed")
+            entry = odict((key, value) for key, value in entry.items() if key != "energy")
+    return entry
+
+# Fills info with the parts of the meal in order (("food", amount, nutritional information) for food items and
+# ("leftovers", source time, factor, index in the food items) for leftovers), the total (amount, nutritional information)
+# if it is stored and valid, whether the food items were repaired and whether the total has to be recomputed
+def checkMeal(entry, report, info):
+    food = entry.get("food")
+    if not isinstance(food, list):
+        report("food", "is missing", "the meal is removed")
+        return None
+
+    parts, repairedFood = [], []
+    for i, item in enumerate(food):
+        path = "food[{}]".format(i)
+        if isinstance(item, dict) and "leftovers" in item:
+            try:
+                source = parseTime(item["leftovers"])
+                factor = float(item.get("factor"))
+            except (ValueError, TypeError):
+                report(path, "is not a valid reference to leftovers", "removed")
+                continue
+            parts.append(("leftovers", source, factor, i))
+            repairedFood.append(item)
+        else:
+            amount, nutriInfo, repairedItem = checkFoodItem(item, path, report)
+            if repairedItem == None:
+                continue
+            parts.append(("food", amount, nutriInfo))
+            repairedFood.append(repairedItem)
+    if len(food) > 0 and len(repairedFood) == 0:
+        report("food", "has no valid food items", "the meal is removed")
+        return None
+
+    changed = len(repairedFood) != len(food) or any(a is not b for a, b in zip(food, repairedFood))
+    info["parts"] = parts
+    info["changed"] = changed
+    info["total"] = None
+    info["recompute"] = changed
+    if "total" in entry:
+        totalProblems = []
+        amount, nutriInfo, repairedTotal = checkFoodItem(entry["total"], "total", lambda *args: totalProblems.append(args))
+        if len(totalProblems) > 0:
+            report("total", "can not be read", "recomputed")
+            info["recompute"] = True
+        else:
+            info["total"] = (amount, nutriInfo)
+
+    # Totals of meals with leftovers are checked when the meals they refer to are known (see checkLeftovers)
+    if info["total"] and not changed and all(part[0] == "food" for part in parts):
+        amount, nutriInfo, count = sumParts(parts, None)
+        stored = model.FoodItem(None, info["total"][0], info["total"][1])
+        if not model.totalMatches(stored, model.FoodItem(None, amount, nutriInfo), count):
+            report("total", "does not match the food items", "recomputed")
+            info["recompute"] = True
+
+    if info["recompute"] and all(part[0] == "food" for part in parts):
+        entry = odict(entry)
+        entry["food"] = repairedFood
+        entry["total"] = totalJson(*sumParts(parts, None)[:2])
+        info["recompute"] = False
+    elif changed:
+        entry = odict(entry)
+        entry["food"] = repairedFood
+    return entry
+
+checkFunctions = odict([
+    ("weight", checkWeight),
+    ("workout", checkWorkout),
+    ("meals", checkMeal),
+])
+
+def newProblem(section, index, path, message, repair):
+    return odict([("section", section), ("index", index), ("time", None), ("path", path), ("message", message), ("repair", repair)])
+
+# Checks a chunk of the entries of a section, starting at index 'start'. Runs in a worker process,
+# so it only receives and returns plain (picklable) data.
+# Returns the problems, the time of every entry, index -> repaired entry (or None) for the repaired entries
+# and index -> info for meals (see checkMeal).
+def checkChunk(section, start, entries):
+    result = odict([("problems", []), ("times", []), ("repaired", {}), ("meals", {})])
+    checkFunction = checkFunctions[section]
+    for index, entry in enumerate(entries, start):
+        problems = []
+        report = lambda path, message, repair=None: problems.append(newProblem(section, index, path, message, repair))
+        time, repaired = None, None
+        if not isinstance(entry, dict):
+            report("", "is not an object", "removed")
+        else:
+            try:
+                time = parseTime(entry.get("time"))
+            except ValueError as e:
+                report("time", str(e), "the entry is removed")
+            if time:
+                info = {}
+                repaired = checkFunction(entry, report, info)
+                if section == "meals" and repaired != None:
+                    result["meals"][index] = info
+        for problem in problems:
+            problem["time"] = time
+        result["problems"].extend(problems)
+        result["times"].append(time if repaired != None else None)
+        if repaired is not entry:
+            result["repaired"][index] = repaired
+    return result
+
+def checkConfig(data, problems, repaired):
+    config = data.get("config")
+    if not isinstance(config, dict):
+        problems.append(newProblem("config", None, "", "is missing", "set to empty"))
+        repaired["config"] = odict()
+        return
+    for key, value in config.items():
+        cls = configTypes.get(key)
+        if cls == None:
+            continue
+        try:
+            valid = isinstance(value, str) and isinstance(q.fromStr(value), cls)
+        except ValueError:
+            valid = False
+        if not valid:
+            problems.append(newProblem("config", None, key, "{} is not a {}".format(json.dumps(value), cls.__name__.lower()), "removed"))
+            repaired.setdefault("config", odict(config)).pop(key)
+
+# Reports leftovers that refer to meals that neither exist in the data file nor in its archive and
+# totals of meals with leftovers that do not match. Returns index -> (total amount, nutritional information)
+# of the meals whose totals have to be recomputed and index -> indices of the removed leftovers
+# (None if the meal has no food items left and is removed).
+def checkLeftovers(path, data, meals, problems):
+    # Meal time -> sum of its food items, leftovers refer to the first meal at a time (see DataWrapper.getMealAt)
+    sources = {}
+    changedSources = set()
+    for index in sorted(meals):
+        info = meals[index]
+        if info["time"] not in sources:
+            sources[info["time"]] = sumParts([part for part in info["parts"] if part[0] == "food"], None)
+            if info["changed"]:
+                changedSources.add(info["time"])
+
+    archivedUntil = None
+    if isinstance(data.get("archive"), dict):
+        try:
+            archivedUntil = parseTime(data["archive"].get("until"))
+        except ValueError:
+            pass
+    segments = archive.Archive(path + ".archive")
+
+    def getSource(time):
+        if time not in sources:
+            sources[time] = None
+            if archivedUntil and time < archivedUntil:
+                for meal in segments.getItems("meals", time, time + timedelta(seconds=1)):
+                    if meal.time == time:
+                        sources[time] = sumParts([("food", item.amount, item.nutriInfo) for item in meal.food
+                            if isinstance(item, model.FoodItem)], None)
+                        break
+        return sources[time]
+
+    totals, removed = {}, {}
+    for index in sorted(meals):
+        info = meals[index]
+        if all(part[0] == "food" for part in info["parts"]):
+            continue
+        parts = []
+        for i, part in enumerate(info["parts"]):
+            if part[0] == "leftovers" and getSource(part[1]) == None:
+                problem = newProblem("meals", index, "food[{}]".format(part[3]),
+                    "refers to leftovers of a meal @ {} that does not exist".format(model.formatTime(part[1])), "removed")
+                problem["time"] = info["time"]
+                problems.append(problem)
+                removed.setdefault(index, []).append(i)
+            else:
+                parts.append(part)
+        if len(parts) == 0:
+            problem = newProblem("meals", index, "food", "has no valid food items", "the meal is removed")
+            problem["time"] = info["time"]
+            problems.append(problem)
+            removed[index] = None
+            continue
+        amount, nutriInfo, count = sumParts(parts, getSource)
+        if index in removed or info["recompute"]:
+            totals[index] = (amount, nutriInfo)
+        elif any(part[0] == "leftovers" and part[1] in changedSources for part in parts):
+            problem = newProblem("meals", index, "total", "includes leftovers of a meal that is repaired", "recomputed")
+            problem["time"] = info["time"]
+            problems.append(problem)
+            totals[index] = (amount, nutriInfo)
+        elif info["total"]:
+            stored = model.FoodItem(None, info["total"][0], info["total"][1])
+            if not model.totalMatches(stored, model.FoodItem(None, amount, nutriInfo), count):
+                problem = newProblem("meals", index, "total", "does not match the food items", "recomputed")
+                problem["time"] = info["time"]
+                problems.append(problem)
+                totals[index] = (amount, nutriInfo)
+    return totals, removed
+
+def formatProblem(problem):
+    location = problem["section"]
+    if problem["index"] != None:
+        location += "[{}]".format(problem["index"])
+    if problem["time"]:
+        location += " @ {}".format(model.formatTime(problem["time"]))
+    if problem["path"]:
+        location += " " + problem["path"]
+    ret = "{}: {}".format(location, problem["message"])
+    if problem["repair"]:
+        ret += " ({})".format(problem["repair"])
+    return ret
+
+# Checks every entry of a data file once, the sections in chunks that are checked in parallel by 'jobs' worker processes
+# (only if there is more than one chunk). Reports every problem with its location and if repair is given writes a
+# repaired copy of the data file to 'output' (<datafile>.repaired by default). The data file itself is never changed.
+def check(path, repair=False, output=None, jobs=None):
+    if not os.path.isfile(path):
+        raise model.WeloError("Data file '{}' could not be found.".format(path))
+    try:
+        with open(path) as f:
+            data = json.load(f, object_pairs_hook=odict)
+    except json.JSONDecodeError as e:
+        raise model.WeloError("'{}' is not valid JSON (line {}, column {}: {}). It can not be repaired automatically, "
+            "please fix it by hand or restore a backup.".format(path, e.lineno, e.colno, e.msg))
+    if not isinstance(data, dict):
+        raise model.WeloError("'{}' is not a welo data file.".format(path))
+
+    problems = []
+    # Top level key -> repaired value
+    repaired = odict()
+    if not isinstance(data.get("version", 1), int) or data.get("version", 1) > model.version:
+        raise model.WeloError("'{}' was written by a newer version of welo (version {}).".format(path, data["version"]))
+    checkConfig(data, problems, repaired)
+
+    chunks = []
+    for section in checkFunctions:
+        entries = data.get(section)
+        if not isinstance(entries, list):
+            problems.append(newProblem(section, None, "", "is missing", "set to empty"))
+            repaired[section] = []
+            continue
+        for start in range(0, len(entries), chunkSize):
+            chunks.append((section, start, entries[start:start + chunkSize]))
+
+    if len(chunks) > 1 and (jobs or os.cpu_count() or 1) > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(checkChunk, *zip(*chunks)))
+    else:
+        results = [checkChunk(*chunk) for chunk in chunks]
+
+    sectionResults = odict()
+    for (section, start, entries), result in zip(chunks, results):
+        problems.extend(result["problems"])
+        sectionResult = sectionResults.setdefault(section, odict([("times", []), ("repaired", {}), ("meals", {})]))
+        sectionResult["times"].extend(result["times"])
+        sectionResult["repaired"].update(result["repaired"])
+        sectionResult["meals"].update(result["meals"])
+
+    # Entries logged with an earlier time (e.g. 'welo eat --time') are appended after newer ones, so entries that are
+    # out of order are not a problem and only counted
+    now = datetime.now()
+    unsorted = odict()
+    for section, result in sectionResults.items():
+        previous = None
+        for index, time in enumerate(result["times"]):
+            if time == None:
+                continue
+            if previous and time < previous:
+                unsorted[section] = unsorted.get(section, 0) + 1
+            if time > now + timedelta(days=1):
+                problem = newProblem(section, index, "time", "is in the future", None)
+                problem["time"] = time
+                problems.append(problem)
+            previous = max(previous, time) if previous else time
+
+    if "meals" in sectionResults:
+        meals = sectionResults["meals"]
+        for index, info in meals["meals"].items():
+            info["time"] = meals["times"][index]
+        totals, removed = checkLeftovers(path, data, meals["meals"], problems)
+    else:
+        totals, removed = {}, {}
+
+    problems.sort(key=lambda problem: (list(checkFunctions).index(problem["section"]) if problem["section"] in checkFunctions else -1,
+        problem["index"] if problem["index"] != None else -1))
+    for problem in problems:
+        print(formatProblem(problem))
+    entryCount = sum(len(result["times"]) for result in sectionResults.values())
+    print("Checked {} entries, found {} problems.".format(entryCount, len(problems)))
+    if len(unsorted) > 0:
+        count = sum(unsorted.values())
+        print("Note: {} {} logged after newer ones (e.g. with --time), which is fine ({}).".format(
+            count, "entry was" if count == 1 else "entries were", ", ".join("{}: {}".format(section, count) for section, count in unsorted.items())))
+
+    if not repair:
+        if len(problems) > 0:
+            raise model.WeloError("Call 'welo check --repair' to write a repaired copy of the data file.")
+        return
+    if len(problems) == 0:
+        print("Nothing to repair.")
+        return
+
+    for section, result in sectionResults.items():
+        entries = list(data[section])
+        for index, entry in result["repaired"].items():
+            entries[index] = entry
+        if section == "meals":
+            for index in set(totals) | set(removed):
+                if index in removed and removed[index] == None:
+                    entries[index] = None
+                    continue
+                entry = odict(entries[index])
+                entry["food"] = [item for i, item in enumerate(entry["food"]) if i not in removed.get(index, [])]
+                entry["total"] = totalJson(*totals[index])
+                entries[index] = entry
+        repaired[section] = [entry for entry in entries if entry != None]
+
+    for key, value in repaired.items():
+        data[key] = value
+    # The persisted energy balance (see balance.py) and the hashes of the days (see sync.py) are computed from the entries,
+    # so they are computed again
+    data.pop("balance", None)
+    data.pop("dayHashes", None)
+    data["generation"] = data.get("generation", 0) + 1
+
+    output = output or path + ".repaired"
+    with open(output, "w") as f:
+        json.dump(data, f, indent=4)
+    print("Wrote the repaired data file to '{}'. Please check it and then replace '{}' with it.".format(output, path))
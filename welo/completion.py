@@ -0,0 +1,210 @@
+# This module is executed directly by the shell completion script on every TAB press,
+# so it must only import the standard library and must not import welo itself.
+import json
+import os
+import sys
+
+# Radix tree of nested dicts: edge label -> child node. An empty label marks the end of a word.
+def buildTrie(words):
+    root = {}
+    for word in words:
+        node = root
+        for c in word:
+            node = node.setdefault(c, {})
+        node[""] = 0
+    return compressTrie(root)
+
+def compressTrie(node):
+    ret = {}
+    for edge, child in node.items():
+        if edge == "":
+            ret[""] = 0
+            continue
+        while len(child) == 1 and "" not in child:
+            (nextEdge, nextChild), = child.items()
+            edge += nextEdge
+            child = nextChild
+        ret[edge] = compressTrie(child)
+    return ret
+
+def collectWords(node, prefix, out, limit):
+    for edge, child in sorted(node.items()):
+        if len(out) >= limit:
+            return
+        if edge == "":
+            out.append(prefix)
+        else:
+            collectWords(child, prefix + edge, out, limit)
+
+def findWords(trie, prefix, limit=200):
+    node, path = trie, ""
+    rest = prefix
+    while len(rest) > 0:
+        for edge, child in node.items():
+            if edge == "":
+                continue
+            if rest.startswith(edge):
+                node, path, rest = child, path + edge, rest[len(edge):]
+                break
+            elif edge.startswith(rest):
+                out = []
+                collectWords(child, path + edge, out, limit)
+                return out
+        else:
+            return []
+    out = []
+    collectWords(node, path, out, limit)
+    return out
+
+def getCompletionPath(dataPath):
+    return dataPath + ".completion"
+
+# If foods is None, the food names of the existing completion file are kept
+def writeCompletionFile(dataPath, foods, mealTimes):
+    path = getCompletionPath(dataPath)
+    if foods == None:
+        try:
+            with open(path) as f:
+                foodTrie = json.load(f)["foods"]
+        except (OSError, ValueError, KeyError):
+            foodTrie = {}
+    else:
+        foodTrie = buildTrie(foods)
+    tmpPath = path + ".tmp"
+    with open(tmpPath, "w") as f:
+        json.dump({"foods": foodTrie, "meals": buildTrie(mealTimes)}, f, separators=(",", ":"))
+    os.replace(tmpPath, path)
+
+# Returns the raw text (including quotes) of the word the cursor is in
+def getCurrentToken(line):
+    start = 0
+    quote = None
+    escape = False
+    for i, c in enumerate(line):
+        if escape:
+            escape = False
+        elif c == "\\" and quote != "'":
+            escape = True
+        elif quote:
+            if c == quote:
+                quote = None
+        elif c in "\"'":
+            quote = c
+        elif c.isspace():
+            start = i + 1
+    return line[start:]
+
+def unquote(token):
+    ret = ""
+    quote = None
+    escape = False
+    for c in token:
+        if escape:
+            ret += c
+            escape = False
+        elif c == "\\" and quote != "'":
+            escape = True
+        elif quote:
+            if c == quote:
+                quote = None
+            else:
+                ret += c
+        elif c in "\"'":
+            quote = c
+        else:
+            ret += c
+    return ret
+
+def quote(word, token):
+    if token[:1] in ["\"", "'"]:
+        return token[0] + word + token[0]
+    elif any(c in word for c in " \t\"'()\\$`&;|<>*?!#"):
+        return "\"" + "".join("\\" + c if c in "\"\\$`" else c for c in word) + "\""
+    else:
+        return word
+
+def getCandidates(completions, command, word):
+    if command not in ["eat", "nutriinfo"] or word[:1].isdigit() or word[:1] in ["-", "."]:
+        return []
+    if command == "eat" and word.startswith("leftovers"):
+        timePrefix = word[len("leftovers("):] if word.startswith("leftovers(") else ""
+        candidates = ["leftovers(" + time + ")" for time in findWords(completions["meals"], timePrefix)]
+        return ["leftovers"] + candidates if word == "leftovers" else candidates
+    candidates = findWords(completions["foods"], word)
+    if command == "eat" and "leftovers".startswith(word):
+        candidates.append("leftovers")
+    return candidates
+
+# Usage: completion.py <welo config path> <command> <line up to the cursor>
+# Prints the raw current token first (prefixed with '>', so it is never an empty line)
+# and then one (shell quoted) candidate per line.
+def main():
+    configPath, command, line = sys.argv[1:4]
+    token = getCurrentToken(line)
+    print(">" + token)
+    try:
+        with open(configPath) as f:
+            dataPath = json.load(f)["dataFile"]
+        with open(getCompletionPath(dataPath)) as f:
+            completions = json.load(f)
+    except (OSError, ValueError, KeyError):
+        return
+    for candidate in getCandidates(completions, command, unquote(token)):
+        print(quote(candidate, token))
+
+bashTemplate = """_welo() {
+    local cur="${COMP_WORDS[COMP_CWORD]}"
+    if [ "$COMP_CWORD" -eq 1 ]; then
+        COMPREPLY=( $(compgen -W "%(commands)s" -- "$cur") )
+        return
+    fi
+
+    local command="${COMP_WORDS[1]}"
+    if [[ "$cur" == -* ]]; then
+        local options=""
+        case "$command" in
+%(options)s
+        esac
+        COMPREPLY=( $(compgen -W "$options" -- "$cur") )
+        return
+    fi
+
+    case "$command" in
+        eat|nutriinfo)
+            local IFS=$'\\n'
+            local out=( $(%(python)s -S %(script)s %(config)s "$command" "${COMP_LINE:0:$COMP_POINT}") )
+            # The shell might have split the current word differently (e.g. at '(' or ':'),
+            # so only the part of every candidate that belongs to its current word is used.
+            local token="${out[0]#>}"
+            local strip="${token%%"$cur"}"
+            COMPREPLY=()
+            local candidate
+            for candidate in "${out[@]:1}"; do
+                if [[ "$candidate" == "$strip"* ]]; then
+                    COMPREPLY+=( "${candidate#"$strip"}" )
+                fi
+            done
+            ;;
+    esac
+}
+complete -F _welo welo
+"""
+
+def shellQuote(s):
+    return "'" + s.replace("'", "'\\''") + "'"
+
+def getScript(shell, commands, configPath):
+    options = "\n".join('            {}) options="{}" ;;'.format(command, " ".join(opts)) for command, opts in commands.items())
+    script = bashTemplate % {
+        "commands": " ".join(commands.keys()),
+        "options": options,
+        "python": shellQuote(sys.executable),
+        "script": shellQuote(os.path.abspath(__file__)),
+        "config": shellQuote(configPath),
+    }
+    if shell == "zsh":
+        script = "autoload -U +X bashcompinit && bashcompinit\n" + script
+    return script
+
+if __name__ == "__main__":
+    main()
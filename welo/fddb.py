@@ -3,7 +3,7 @@ from collections import OrderedDict as odict
 
 import requests
 
-from . import quantities as q
+from . import nutrients
 
 # exampmles from 16.05.2018
 """
@@ -31,36 +31,34 @@ from . import quantities as q
 <div style='background-color:#f0f5f9;padding:2px 4px;'><div class='sidrow'><span style=''>Water content</span></div><div>58%</div></div>
 """
 
-knownKeys = {
-    "Kalorien": "energy",
-    "Protein": "protein",
-    "Kohlenhydrate": "carbs",
-    "Fett": "fat",
-    "Ballaststoffe": "fiber",
-    "davon Zucker": "sugar",
-
-    "Calories": "energy",
-    "Carbohydrates": "carbs",
-    "Fat": "fat",
-    "Dietary fibre": "fiber",
-    "thereof Sugar": "sugar",
+# Names on fddb.info -> key (see nutrients.py)
+knownKeys = {name: nutrient.key for nutrient in nutrients.nutrients for name in nutrient.names}
+# Names of values that are converted to a nutrient -> (key, factor)
+derivedKeys = {
+    "Salz": ("sodium", 0.4),
+    "Salt": ("sodium", 0.4),
 }
 
-keyOrder = ["energy", "fat", "satFat", "carbs", "sugar", "fiber", "protein", "sodium"]
+keyOrder = nutrients.mainKeys
 
-def getNutriInfo(url):
-    r = requests.get(url)
+def getNutriInfo(url, timeout=None):
+    r = requests.get(url, timeout=timeout)
     fields = re.findall(r"<div class='sidrow'><a href='.*?' style='.*?'>(.*?)</a></div><div>(.*?)</div></div>", r.text)
     fields += re.findall(r"<div class='sidrow'><span style='.*?'>(.*?)</span></div><div>(.*?)</div></div>", r.text)
     fields = [(field[0], field[1].replace(",", ".")) for field in fields]
     nutriInfo = odict()
     for name, val in fields:
-        if name in knownKeys:
-            nutriInfo[knownKeys[name]] = str(q.fromStr(val))
-    for key in keyOrder:
-        if key in nutriInfo:
-            nutriInfo.move_to_end(key)
-    return nutriInfo
+        try:
+            if name in knownKeys:
+                key = knownKeys[name]
+                nutriInfo[key] = nutrients.formatValue(key, nutrients.parse(key, val))
+            elif name in derivedKeys and derivedKeys[name][0] not in nutriInfo:
+                key, factor = derivedKeys[name]
+                nutriInfo[key] = nutrients.formatValue(key, nutrients.parse(key, val) * factor)
+        except ValueError:
+            # Some values are not given (e.g. "k.A.")
+            pass
+    return nutrients.sort(nutriInfo)
 
 if __name__ == "__main__":
     print(getNutriInfo("https://fddb.info/db/de/lebensmittel/galbani_mozzarella/index.html"))
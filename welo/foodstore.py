@@ -0,0 +1,53 @@
+import json
+import sqlite3
+from collections import OrderedDict as odict
+
+def getPath(dataPath):
+    return dataPath + ".foods.sqlite"
+
+# The nutritional information (per 100g) of every food ever eaten, formerly the "nutriInfoCache"
+# section of the data file. It is stored in a sqlite file next to the data file, indexed by food name,
+# so that single foods can be read and written without loading (or rewriting) all of them.
+class FoodStore(object):
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS foods (name TEXT PRIMARY KEY, nutriInfo TEXT NOT NULL)")
+        # Whether any food was added or changed since opening the store
+        self.changed = False
+
+    def close(self):
+        self.connection.close()
+
+    def get(self, name):
+        row = self.connection.execute("SELECT nutriInfo FROM foods WHERE name = ?", (name,)).fetchone()
+        if row:
+            return json.loads(row[0], object_pairs_hook=odict)
+        else:
+            return None
+
+    def __contains__(self, name):
+        return self.connection.execute("SELECT 1 FROM foods WHERE name = ?", (name,)).fetchone() != None
+
+    def set(self, name, nutriInfo):
+        self.update([(name, nutriInfo)])
+
+    # If replace is False, foods that are already in the store are kept
+    def update(self, items, replace=True):
+        statement = "INSERT OR {} INTO foods (name, nutriInfo) VALUES (?, ?)".format("REPLACE" if replace else "IGNORE")
+        self.connection.executemany(statement, ((name, json.dumps(nutriInfo)) for name, nutriInfo in items))
+        self.connection.commit()
+        self.changed = True
+
+    def remove(self, name):
+        self.connection.execute("DELETE FROM foods WHERE name = ?", (name,))
+        self.connection.commit()
+        self.changed = True
+
+    # Only reads the index
+    def getNames(self):
+        return [row[0] for row in self.connection.execute("SELECT name FROM foods ORDER BY name")]
+
+    def items(self):
+        for name, nutriInfo in self.connection.execute("SELECT name, nutriInfo FROM foods ORDER BY name"):
+            yield name, json.loads(nutriInfo, object_pairs_hook=odict)
@@ -0,0 +1,256 @@
+import hashlib
+import json
+import math
+import os
+from collections import OrderedDict as odict
+from datetime import datetime, date, timedelta
+
+from . import quantities as q
+from . import balance
+from . import model
+
+# NumPy is only needed for this command (pip install welo[forecast]), so it is imported when it is used
+def importNumpy():
+    try:
+        import numpy
+        return numpy
+    except ImportError:
+        raise model.WeloError("'welo forecast' needs NumPy, please install it first (e.g. 'pip install numpy').")
+
+# How many days are simulated at most
+maxHorizon = 3 * 365
+# How many runs and days are simulated at once, which bounds the memory used (see simulate)
+chunkRuns = 2000
+blockDays = 64
+percentiles = [("median", 0.5), ("early", 0.1), ("late", 0.9)]
+# The Mifflin St Jeor equation (see DataWrapper.getBmr) adds 10 kcal/day per kg of body weight
+bmrPerKg = 10
+# How many results are kept in the cache file (e.g. for different intakes)
+maxCacheEntries = 8
+
+def getCachePath(dataPath):
+    return dataPath + ".forecast"
+
+def mean(values):
+    return sum(values) / len(values)
+
+def std(values):
+    m = mean(values)
+    return (sum((x - m) ** 2 for x in values) / max(len(values) - 1, 1)) ** 0.5
+
+# Exponentially smoothed trend (see plot.smooth). Returns the last trend value
+# and the standard deviation of the measurements around the trend before them.
+def fitNoise(weights, factor=0.1):
+    trend = None
+    residuals = []
+    for weight in weights:
+        if trend != None:
+            residuals.append(weight - trend)
+        trend = weight if trend == None else trend + factor * (weight - trend)
+    return trend, std(residuals)
+
+# Least squares line through (x, y). Returns the slope and its standard error.
+def fitSlope(xs, ys):
+    n = len(xs)
+    meanX, meanY = sum(xs) / n, sum(ys) / n
+    sxx = sum((x - meanX) ** 2 for x in xs)
+    slope = sum((x - meanX) * (y - meanY) for x, y in zip(xs, ys)) / sxx
+    intercept = meanY - slope * meanX
+    sse = sum((y - intercept - slope * x) ** 2 for x, y in zip(xs, ys))
+    return slope, (sse / max(n - 2, 1) / sxx) ** 0.5
+
+# Collects everything the simulation depends on from the last 'days' days.
+# Raises WeloError if there is not enough data.
+def getInputs(data, days, minWeights=5, minDays=7):
+    goalWeight = data.getConfig("goalWeight")
+    if goalWeight == None:
+        raise model.WeloError("Please set your goal weight first (see 'welo config --help').")
+    activity = data.getActivity()
+    if data.getBmr() == None or activity == None:
+        raise model.WeloError("Please configure your height, sex, birthday and activity first (see 'welo config --help').")
+
+    lastDay = date.today()
+    firstDay = lastDay - timedelta(days=days - 1)
+    weights = sorted(data.getLogs(balance.dayStart(firstDay), "weight", datetime.now()), key=lambda item: item.time)
+    loggedDays = [values for values in balance.computeDays(data, firstDay, lastDay) if values["days"] > 0]
+    if len(weights) < minWeights or len(loggedDays) < minDays:
+        raise model.WeloError("Not enough data. At least {} weight measurements and {} days with logged meals in the last {} days are needed.".format(
+            minWeights, minDays, days))
+
+    return odict([
+        ("firstDay", balance.dayStr(firstDay)),
+        ("today", balance.dayStr(lastDay)),
+        ("goalWeight", goalWeight.kg()),
+        ("activity", activity),
+        ("weights", [(model.encodeTime(item.time), item.weight) for item in weights]),
+        # Workouts are part of the expenditure (see balance.computeDays)
+        ("days", [(values["intake"], values["bmr"], values["expenditure"]) for values in loggedDays]),
+        ("bmr", [data.getBmr(q.Mass(weights[-1].weight)), data.getBmr(q.Mass(weights[-1].weight + 1))]),
+    ])
+
+# Fits the model to the inputs (see getInputs):
+# - the trend weight and the day-to-day noise of the measurements around it
+# - the mean and standard deviation of the daily intake
+# - the expenditure at the trend weight (BMR times activity plus the average workouts)
+# - the energy not accounted for by the logs (e.g. forgotten snacks or a wrong activity level) as the difference
+#   between the deficit from the logs and the deficit the weight trend shows, and the uncertainty of the latter
+def fit(inputs):
+    weights = [weight for time, weight in inputs["weights"]]
+    trend, noise = fitNoise(weights)
+
+    times = [model.decodeTime(time).timestamp() / 86400 for time, weight in inputs["weights"]]
+    slope, slopeError = fitSlope(times, weights)
+
+    intakes = [intake for intake, bmr, expenditure in inputs["days"]]
+    workouts = mean([expenditure - bmr * inputs["activity"] for intake, bmr, expenditure in inputs["days"]])
+    loggedDeficit = mean([expenditure - intake for intake, bmr, expenditure in inputs["days"]])
+    # The BMR (and with it the expenditure) is linear in the weight
+    bmr = inputs["bmr"][0] + (trend - weights[-1]) * bmrPerKg
+
+    return odict([
+        ("trend", trend),
+        ("noise", noise),
+        ("intake", mean(intakes)),
+        ("intakeStd", std(intakes)),
+        ("expenditure", bmr * inputs["activity"] + workouts),
+        ("unaccounted", loggedDeficit + slope * balance.kcalPerKg),
+        ("unaccountedStd", slopeError * balance.kcalPerKg),
+    ])
+
+# The trend follows w[t + 1] = r * w[t] + c (see simulate) at the mean intake and unaccounted energy.
+# Returns the number of days to simulate: three times the days until the trend reaches the goal weight,
+# or maxHorizon if it never does.
+def getHorizon(params, goalWeight, activity, intake):
+    r = 1 - activity * bmrPerKg / balance.kcalPerKg
+    c = (intake + params["unaccounted"] - params["expenditure"] + activity * bmrPerKg * params["trend"]) / balance.kcalPerKg
+    # The trend approaches c / (1 - r) exponentially
+    limit = c / (1 - r)
+    if (goalWeight - params["trend"]) * (limit - goalWeight) <= 0:
+        return maxHorizon
+    days = math.log((goalWeight - limit) / (params["trend"] - limit)) / math.log(r)
+    return min(maxHorizon, max(blockDays, int(math.ceil(3 * days))))
+
+# Simulates 'runs' trajectories of the weight trend from today on at a mean daily 'intake' (kcal) and returns
+# the number of days until the goal weight is first measured (trend plus noise) for every run (inf if it is not
+# within 'horizon' days). Every run draws its own unaccounted energy and every day its own intake. Since the
+# expenditure is linear in the weight, the trend follows w[t + 1] = r * w[t] + c[t] with r = 1 - activity * bmrPerKg / kcalPerKg,
+# which is w[t] = r^t * (w[0] + sum(c[s] / r^(s + 1) for s < t)), so a block of days is a single cumulative sum.
+# The runs are simulated in chunks of chunkRuns and blocks of blockDays (in single precision) and runs that reached
+# the goal are not simulated any further.
+def simulate(np, params, goalWeight, activity, intake, runs, seed, horizon):
+    rng = np.random.default_rng(seed)
+    r = 1 - activity * bmrPerKg / balance.kcalPerKg
+    # The expenditure at weight w is expenditure + activity * bmrPerKg * (w - trend), c is everything but the w part
+    base = (intake - params["expenditure"] + activity * bmrPerKg * params["trend"]) / balance.kcalPerKg
+    intakeStd = params["intakeStd"] / balance.kcalPerKg
+    powers = (r ** np.arange(1, blockDays + 1)).astype(np.float32)
+    lower = goalWeight < params["trend"]
+
+    days = np.full(runs, np.inf)
+    for first in range(0, runs, chunkRuns):
+        count = min(chunkRuns, runs - first)
+        unaccounted = rng.normal(params["unaccounted"], params["unaccountedStd"], count) / balance.kcalPerKg
+        offsets = (base + unaccounted).astype(np.float32)
+        trend = np.full(count, params["trend"], dtype=np.float32)
+        # The runs of this chunk that did not reach the goal yet
+        active = np.arange(count)
+        for day in range(0, horizon, blockDays):
+            length = min(blockDays, horizon - day)
+            c = offsets[active, None] + rng.standard_normal((len(active), length), dtype=np.float32) * np.float32(intakeStd)
+            blockTrend = powers[:length] * (trend[active, None] + np.cumsum(c / powers[:length], axis=1))
+            measured = blockTrend + rng.standard_normal((len(active), length), dtype=np.float32) * np.float32(params["noise"])
+            reached = measured <= goalWeight if lower else measured >= goalWeight
+            hit = reached.any(axis=1)
+            days[first + active[hit]] = day + reached[hit].argmax(axis=1) + 1
+            trend[active] = blockTrend[:, -1]
+            active = active[~hit]
+            if len(active) == 0:
+                break
+    return days
+
+# Returns the number of days of the percentiles (None if it is later than the horizon), the share of runs reaching the goal
+# and the horizon
+def summarize(np, days, horizon):
+    days = np.sort(days)
+    ret = odict([("horizon", horizon)])
+    for name, p in percentiles:
+        value = days[int(round(p * (len(days) - 1)))]
+        ret[name] = int(value) if np.isfinite(value) else None
+    ret["reached"] = float(np.isfinite(days).mean())
+    return ret
+
+def loadCache(path):
+    if os.path.isfile(path):
+        try:
+            with open(path) as f:
+                return json.load(f, object_pairs_hook=odict)
+        except ValueError:
+            pass
+    return odict()
+
+def saveCache(path, cache):
+    while len(cache) > maxCacheEntries:
+        cache.popitem(last=False)
+    with open(path, "w") as f:
+        json.dump(cache, f)
+
+# Returns the fitted model (see fit) and the results (see summarize) for the average intake and for 'intake' (kcal)
+# if it is given. The results are cached next to the data file until anything they depend on changes
+# (new weights or meals, the configuration or today's date).
+def getForecast(data, intake=None, days=56, runs=10000):
+    inputs = getInputs(data, days)
+    key = hashlib.sha1(json.dumps([inputs, intake, runs, maxHorizon, chunkRuns, blockDays]).encode("utf-8")).hexdigest()
+    cachePath = getCachePath(data.path)
+    cache = loadCache(cachePath)
+    if key in cache:
+        return cache[key]
+
+    np = importNumpy()
+    params = fit(inputs)
+    # The same data always gives the same forecast
+    seed = int(key[:16], 16)
+    scenarios = [("average", params["intake"])]
+    if intake != None:
+        scenarios.append(("given", intake))
+    results = []
+    for name, kcal in scenarios:
+        horizon = getHorizon(params, inputs["goalWeight"], inputs["activity"], kcal)
+        days = simulate(np, params, inputs["goalWeight"], inputs["activity"], kcal, runs, seed, horizon)
+        results.append(odict([("name", name), ("intake", kcal)] + list(summarize(np, days, horizon).items())))
+    result = odict([
+        ("trend", params["trend"]),
+        ("goalWeight", inputs["goalWeight"]),
+        ("weights", len(inputs["weights"])),
+        ("days", len(inputs["days"])),
+        ("params", params),
+        ("scenarios", results),
+    ])
+
+    cache[key] = result
+    saveCache(cachePath, cache)
+    return result
+
+def formatDay(days, horizon):
+    if days == None:
+        return "later than {}".format(formatDay(horizon, horizon))
+    return balance.dayStr(date.today() + timedelta(days=days))
+
+def printForecast(data, intake=None, days=56, runs=10000):
+    result = getForecast(data, intake.kcal() if intake else None, days, runs)
+    trend, goalWeight = q.Mass(result["trend"]), q.Mass(result["goalWeight"])
+    params = result["params"]
+    print("Forecast for reaching your goal of {} from your current trend of {}, based on the last {} days ({} weight measurements, {} days with logged meals):".format(
+        goalWeight, trend, days, result["weights"], result["days"]))
+    print("Day-to-day weight noise: {}".format(q.Mass(params["noise"])))
+    print("Expenditure at your current weight: {} kcal/day".format(round(params["expenditure"])))
+    print("Energy not accounted for by your logs: {:+} kcal/day (±{})".format(round(params["unaccounted"]), round(params["unaccountedStd"])))
+    for scenario in result["scenarios"]:
+        print()
+        if scenario["name"] == "average":
+            print("# At your average intake of {} kcal/day".format(round(scenario["intake"])))
+        else:
+            print("# At an intake of {} kcal/day".format(round(scenario["intake"])))
+        horizon = scenario["horizon"]
+        print("Median: {}".format(formatDay(scenario["median"], horizon)))
+        print("10%: {}, 90%: {}".format(formatDay(scenario["early"], horizon), formatDay(scenario["late"], horizon)))
+        print("{}% of the simulated runs reach your goal by {}.".format(round(scenario["reached"] * 100), formatDay(horizon, horizon)))
@@ -0,0 +1,331 @@
+import re
+from collections import OrderedDict as odict
+from datetime import datetime, date, timedelta
+
+from . import quantities as q
+from . import nutrients
+
+# The data file stores everything as strings with units (e.g. "500g", "347kcal").
+# These classes are converted from JSON once when a section is loaded and back once when saving,
+# so everything in between works on parsed times and floats in SI base units (kg, J, s).
+
+# The version of the data file format:
+# 1: times are stored as "%d.%m.%Y %H:%M" (no "version" in the data file)
+# 2: times are stored as ISO 8601 (e.g. "2018-05-17T13:00:00")
+# 3: leftovers are stored as references to the meal they are leftovers of (see Leftovers),
+#    days (of tags, the energy balance and the birthday) as ISO 8601 dates (e.g. "2018-05-17")
+version = 3
+
+# Errors caused by the user's input or data (e.g. an unknown meal time). The command line prints them and exits,
+# users of the library (see store.WeloStore) can catch them.
+class WeloError(Exception):
+    pass
+
+# Only used to show times and days
+timeFormat = "%d.%m.%Y %H:%M"
+dayFormat = "%d.%m.%Y"
+
+def formatTime(dt):
+    return dt.strftime(timeFormat)
+
+def encodeTime(dt):
+    return dt.isoformat(timespec="seconds")
+
+def decodeTime(s):
+    try:
+        return datetime.fromisoformat(s)
+    except ValueError:
+        # Version 1
+        return datetime.strptime(s, timeFormat)
+
+def encodeDay(d):
+    return d.isoformat()
+
+def decodeDay(s):
+    try:
+        return date.fromisoformat(s)
+    except ValueError:
+        # Before version 3
+        return datetime.strptime(s, dayFormat).date()
+
+def toTime(time=None):
+    return (time or q.Time()).datetime.replace(microsecond=0)
+
+# Fast path for the units welo writes itself, anything else is parsed by quantities.fromStr
+quantityRegex = re.compile(r"^(-?[0-9\.]+)\s*(g|kg|mg|µg|ug|mcg|kcal|kj|j)$")
+unitFactors = nutrients.units
+
+def parseQuantity(s):
+    m = quantityRegex.match(s.strip().lower())
+    if m:
+        return float(m.group(1)) * unitFactors[m.group(2)]
+    value = q.fromStr(s)
+    if isinstance(value, q.Energy):
+        return value.joules
+    elif isinstance(value, q.Mass):
+        return value.kilograms
+    else:
+        raise ValueError("'{}' is neither a mass nor an energy!".format(s))
+
+# Formats a nutrient in its unit (see nutrients.py)
+def formatNutrient(key, value):
+    return nutrients.formatValue(key, value)
+
+def parseNutriInfo(nutriInfo):
+    return odict((key, parseQuantity(value)) for key, value in nutriInfo.items())
+
+def formatNutriInfo(nutriInfo):
+    return odict((key, formatNutrient(key, value)) for key, value in nutriInfo.items())
+
+def scaleNutriInfo(nutriInfo, factor):
+    return odict((key, value * factor) for key, value in nutriInfo.items())
+
+def addNutriInfo(target, nutriInfo):
+    for key, value in nutriInfo.items():
+        target[key] = target.get(key, 0.0) + value
+    return target
+
+# The smallest difference that survives formatting (see nutrients.Nutrient.getPrecision)
+def formatPrecision(key, value):
+    return nutrients.getPrecision(key, value)
+
+# Whether two totals only differ by the rounding errors of summing up 'count' formatted values
+def totalMatches(a, b, count):
+    if list(a.nutriInfo.keys()) != list(b.nutriInfo.keys()):
+        return False
+    values = [("amount", a.amount, b.amount)] + [(key, a.nutriInfo[key], b.nutriInfo[key]) for key in a.nutriInfo]
+    for key, x, y in values:
+        if abs(x - y) > formatPrecision(key, max(abs(x), abs(y))) * (count + 1):
+            return False
+    return True
+
+class FoodItem(object):
+    __slots__ = ["name", "amount", "nutriInfo"]
+
+    def __init__(self, name, amount, nutriInfo):
+        self.name = name
+        self.amount = amount
+        self.nutriInfo = nutriInfo
+
+    @classmethod
+    def fromJson(cls, item):
+        return cls(item.get("name"), parseQuantity(item["amount"]), parseNutriInfo(item["nutriInfo"]))
+
+    def toJson(self):
+        ret = odict()
+        if self.name != None:
+            ret["name"] = self.name
+        ret["amount"] = str(q.Mass(self.amount))
+        ret["nutriInfo"] = formatNutriInfo(self.nutriInfo)
+        return ret
+
+    def scaled(self, factor):
+        return FoodItem(self.name, self.amount * factor, scaleNutriInfo(self.nutriInfo, factor))
+
+# Leftovers of another meal (the source, identified by its time) are stored as a reference to it and a factor
+# instead of scaled copies of its food items. The food items are only looked up when they are needed.
+# A reference only ever stands for the FoodItems of the source, leftovers of leftovers refer to the
+# original meal directly (see DataWrapper.getLeftovers), so resolving them never takes more than one step.
+class Leftovers(object):
+    __slots__ = ["source", "factor", "_food"]
+
+    def __init__(self, source, factor):
+        self.source = source
+        self.factor = factor
+        self._food = None
+
+    @classmethod
+    def fromJson(cls, item):
+        return cls(decodeTime(item["leftovers"]), float(item["factor"]))
+
+    def toJson(self):
+        return odict([
+            ("leftovers", encodeTime(self.source)),
+            ("factor", round(self.factor, 6)),
+        ])
+
+    def scaled(self, factor):
+        return Leftovers(self.source, self.factor * factor)
+
+    # getMeal returns the meal at a time or None (see DataWrapper.getMealAt). The result is cached.
+    def getFoodItems(self, getMeal):
+        if self._food == None:
+            meal = getMeal(self.source) if getMeal else None
+            if meal == None:
+                raise WeloError("The meal @ {} that leftovers refer to could not be found!".format(formatTime(self.source)))
+            self._food = [item.scaled(self.factor) for item in meal.food if isinstance(item, FoodItem)]
+        return self._food
+
+def foodItemFromJson(item):
+    if "leftovers" in item:
+        return Leftovers.fromJson(item)
+    else:
+        return FoodItem.fromJson(item)
+
+class Meal(object):
+    __slots__ = ["time", "name", "food", "notes", "total"]
+
+    def __init__(self, time, name=None, food=None, notes=None, total=None):
+        self.time = time
+        self.name = name
+        self.food = food or []
+        self.notes = notes
+        # A FoodItem without a name (see DataWrapper.getMealTotal)
+        self.total = total
+
+    @classmethod
+    def fromJson(cls, meal):
+        return cls(decodeTime(meal["time"]), meal.get("name"), [foodItemFromJson(item) for item in meal["food"]],
+            meal.get("notes"), FoodItem.fromJson(meal["total"]) if "total" in meal else None)
+
+    def toJson(self):
+        ret = odict()
+        ret["time"] = encodeTime(self.time)
+        if self.name:
+            ret["name"] = self.name
+        ret["food"] = [item.toJson() for item in self.food]
+        if self.notes:
+            ret["notes"] = self.notes
+        if self.total:
+            ret["total"] = self.total.toJson()
+        return ret
+
+    # The food items with leftovers replaced by the food items they refer to (see Leftovers.getFoodItems)
+    def getFoodItems(self, getMeal=None):
+        ret = []
+        for item in self.food:
+            if isinstance(item, Leftovers):
+                ret.extend(item.getFoodItems(getMeal))
+            else:
+                ret.append(item)
+        return ret
+
+    def computeTotal(self, getMeal=None):
+        food = self.getFoodItems(getMeal)
+        nutriInfo = odict()
+        for item in food:
+            addNutriInfo(nutriInfo, item.nutriInfo)
+        return FoodItem(None, sum(item.amount for item in food), nutriInfo)
+
+class WeightEntry(object):
+    __slots__ = ["time", "weight"]
+
+    def __init__(self, time, weight):
+        self.time = time
+        self.weight = weight
+
+    @classmethod
+    def fromJson(cls, entry):
+        return cls(decodeTime(entry["time"]), parseQuantity(entry["weight"]))
+
+    def toJson(self):
+        return odict([
+            ("time", encodeTime(self.time)),
+            ("weight", str(q.Mass(self.weight))),
+        ])
+
+class Workout(object):
+    __slots__ = ["time", "name", "duration", "energy", "notes"]
+
+    def __init__(self, time, name, duration, energy=None, notes=None):
+        self.time = time
+        self.name = name
+        self.duration = duration
+        self.energy = energy
+        self.notes = notes
+
+    @classmethod
+    def fromJson(cls, workout):
+        energy = parseQuantity(workout["energy"]) if "energy" in workout else None
+        return cls(decodeTime(workout["time"]), workout["name"], q.Duration(workout["duration"]).seconds,
+            energy, workout.get("notes"))
+
+    def toJson(self):
+        ret = odict()
+        ret["time"] = encodeTime(self.time)
+        ret["name"] = self.name
+        ret["duration"] = str(q.Duration(self.duration))
+        if self.energy != None:
+            ret["energy"] = str(q.Energy(self.energy))
+        if self.notes:
+            ret["notes"] = self.notes
+        return ret
+
+sectionClasses = odict([
+    ("weight", WeightEntry),
+    ("workout", Workout),
+    ("meals", Meal),
+])
+
+def fromJson(section, items):
+    cls = sectionClasses[section]
+    return [cls.fromJson(item) for item in items]
+
+def toJson(items):
+    return [item.toJson() for item in items]
+
+# Whether items are a copy of sourceItems scaled by factor (up to the rounding of the data file)
+def isScaledCopy(items, sourceItems, factor):
+    for item, sourceItem in zip(items, sourceItems):
+        if item.name != sourceItem.name or list(item.nutriInfo.keys()) != list(sourceItem.nutriInfo.keys()):
+            return False
+        values = [("amount", item.amount, sourceItem.amount)]
+        values += [(key, item.nutriInfo[key], sourceItem.nutriInfo[key]) for key in item.nutriInfo]
+        for key, value, sourceValue in values:
+            if abs(value - sourceValue * factor) > formatPrecision(key, abs(value)) * 2:
+                return False
+    return True
+
+# Before version 3, leftovers were stored as scaled copies of all the food items of the meal they were leftovers of.
+# Replaces every run of food items that is a scaled copy of all the food items of an earlier meal by a reference to it.
+# Only meals with at least two food items are considered, a single food is just eaten again most of the time.
+# Only meals of the last 'window' before a meal can be its source and at most all of a source can be eaten
+# (the factors of all its leftovers add up to at most 1), otherwise the same meal cooked again is not leftovers.
+# Returns the number of replaced runs.
+def shareLeftovers(meals, window=timedelta(days=3)):
+    # The names of the first two food items -> earlier meals (with at least two food items), the latest first
+    sources = {}
+    sourceTimes = set()
+    # Source time -> the factors of its leftovers so far
+    eaten = {}
+    count = 0
+    for meal in sorted(meals, key=lambda meal: meal.time):
+        food = []
+        i = 0
+        while i < len(meal.food):
+            item = meal.food[i]
+            replaced = False
+            nextItem = meal.food[i + 1] if i + 1 < len(meal.food) else None
+            if isinstance(item, FoodItem) and isinstance(nextItem, FoodItem):
+                for source in sources.get((item.name, nextItem.name), []):
+                    if meal.time - source.time > window:
+                        break
+                    sourceItems = [sourceItem for sourceItem in source.food if isinstance(sourceItem, FoodItem)]
+                    items = meal.food[i:i + len(sourceItems)]
+                    if len(items) < len(sourceItems) or not all(isinstance(x, FoodItem) for x in items):
+                        continue
+                    sourceAmount = sum(sourceItem.amount for sourceItem in sourceItems)
+                    if sourceAmount <= 0:
+                        continue
+                    factor = sum(x.amount for x in items) / sourceAmount
+                    # Leftovers of all of a source are stored rounded too
+                    if eaten.get(source.time, 0) + factor > 1.01:
+                        continue
+                    if isScaledCopy(items, sourceItems, factor):
+                        eaten[source.time] = eaten.get(source.time, 0) + factor
+                        food.append(Leftovers(source.time, factor))
+                        i += len(sourceItems)
+                        count += 1
+                        replaced = True
+                        break
+            if not replaced:
+                food.append(item)
+                i += 1
+        meal.food = food
+
+        # Leftovers refer to the first meal at a time (see DataWrapper.getMealAt)
+        plainItems = [item for item in meal.food if isinstance(item, FoodItem)]
+        if len(plainItems) >= 2 and meal.time not in sourceTimes:
+            sourceTimes.add(meal.time)
+            sources.setdefault((plainItems[0].name, plainItems[1].name), []).insert(0, meal)
+    return count
@@ -0,0 +1,147 @@
+import re
+from collections import OrderedDict as odict
+
+from . import quantities as q
+
+# The nutritional information of a food only contains the nutrients that are known for it (most foods only
+# have the main ones), both in the data file and parsed (see model.parseNutriInfo). So the nutrients below
+# can be extended without making data files larger or adding up totals slower.
+
+# Units nutrients are shown and stored in -> factor to the SI base unit (J or kg)
+units = odict([
+    ("kcal", 4184.0),
+    ("kj", 1000.0),
+    ("j", 1.0),
+    ("kg", 1.0),
+    ("g", 0.001),
+    ("mg", 0.000001),
+    ("µg", 0.000000001),
+    ("ug", 0.000000001),
+    ("mcg", 0.000000001),
+])
+# Digits after the decimal point for the units nutrients are stored in (besides kcal and g, see quantities)
+unitDigits = {"mg": 2, "µg": 1}
+
+quantityRegex = re.compile(r"^(-?[0-9\.]+)\s*(kcal|kj|j|kg|g|mg|µg|ug|mcg|%)$")
+
+class Nutrient(object):
+    __slots__ = ["index", "key", "unit", "label", "mandatory", "names"]
+
+    # label is shown when prompting for the main nutrients (None for all others),
+    # names are the names of the nutrient on fddb.info (German and English)
+    def __init__(self, key, unit, label=None, mandatory=False, names=[]):
+        self.index = None
+        self.key = key
+        self.unit = unit
+        self.label = label
+        self.mandatory = mandatory
+        self.names = names
+
+    def parse(self, s):
+        m = quantityRegex.match(s.strip().lower())
+        if m:
+            value, unit = float(m.group(1)), m.group(2)
+            # Percent of the reference amount of 100g (e.g. the water content on fddb.info)
+            if unit == "%":
+                return value * units["g"]
+            if (unit in ["kcal", "kj", "j"]) != (self.unit == "kcal"):
+                raise ValueError("'{}' is not a quantity of {}!".format(s, self.key))
+            return value * units[unit]
+        value = q.fromStr(s)
+        if self.unit == "kcal" and isinstance(value, q.Energy):
+            return value.joules
+        elif self.unit != "kcal" and isinstance(value, q.Mass):
+            return value.kilograms
+        raise ValueError("'{}' is not a quantity of {}!".format(s, self.key))
+
+    def format(self, value):
+        if self.unit == "kcal":
+            return str(q.Energy(value))
+        elif self.unit == "g":
+            return str(q.Mass(value))
+        else:
+            return "{}{}".format(q.roundStr(value / units[self.unit], unitDigits[self.unit]), self.unit)
+
+    # The smallest difference that survives formatting
+    def getPrecision(self, value):
+        if self.unit == "kcal":
+            return units["kcal"]
+        elif self.unit == "g":
+            return 0.1 if abs(value) >= 1 else 0.0001
+        else:
+            return units[self.unit] * 10 ** -unitDigits[self.unit]
+
+nutrients = [
+    Nutrient("energy", "kcal", "energy", True, ["Kalorien", "Calories"]),
+    Nutrient("fat", "g", "fat", True, ["Fett", "Fat"]),
+    Nutrient("satFat", "g", "saturated fats (of that fat)", False, ["gesättigte Fettsäuren", "davon gesättigte Fettsäuren", "Saturated fat", "thereof saturated fat"]),
+    Nutrient("carbs", "g", "carbohydrates", True, ["Kohlenhydrate", "Carbohydrates"]),
+    Nutrient("sugar", "g", "sugar (of those carbs)", False, ["davon Zucker", "thereof Sugar"]),
+    Nutrient("fiber", "g", "fiber (of those carbs)", False, ["Ballaststoffe", "Dietary fibre"]),
+    Nutrient("protein", "g", "protein", True, ["Protein"]),
+    Nutrient("sodium", "g", "sodium", False, ["Natrium", "Sodium"]),
+    Nutrient("cholesterol", "mg", names=["Cholesterin", "Cholesterol"]),
+    Nutrient("water", "g", names=["Wassergehalt", "Water content"]),
+    Nutrient("alcohol", "g", names=["Alkohol", "Alcohol"]),
+    Nutrient("vitaminA", "µg", names=["Vitamin A"]),
+    Nutrient("vitaminB1", "mg", names=["Vitamin B1"]),
+    Nutrient("vitaminB2", "mg", names=["Vitamin B2"]),
+    Nutrient("vitaminB6", "mg", names=["Vitamin B6"]),
+    Nutrient("vitaminB12", "µg", names=["Vitamin B12"]),
+    Nutrient("vitaminC", "mg", names=["Vitamin C"]),
+    Nutrient("vitaminD", "µg", names=["Vitamin D"]),
+    Nutrient("vitaminE", "mg", names=["Vitamin E"]),
+    Nutrient("vitaminK", "µg", names=["Vitamin K"]),
+    Nutrient("folate", "µg", names=["Folsäure", "Folic acid"]),
+    Nutrient("potassium", "mg", names=["Kalium", "Potassium"]),
+    Nutrient("calcium", "mg", names=["Calcium"]),
+    Nutrient("magnesium", "mg", names=["Magnesium"]),
+    Nutrient("iron", "mg", names=["Eisen", "Iron"]),
+    Nutrient("zinc", "mg", names=["Zink", "Zinc"]),
+    Nutrient("phosphorus", "mg", names=["Phosphor", "Phosphorus"]),
+    Nutrient("iodine", "µg", names=["Jod", "Iodine"]),
+]
+
+byKey = odict()
+for i, nutrient in enumerate(nutrients):
+    nutrient.index = i
+    byKey[nutrient.key] = nutrient
+
+# The nutrients that are prompted for (and the columns of the offline food database)
+mainKeys = [nutrient.key for nutrient in nutrients if nutrient.label]
+
+# Keys that are not in the registry (e.g. from food files) are masses in grams
+def get(key):
+    return byKey.get(key) or Nutrient(key, "g")
+
+def parse(key, s):
+    return get(key).parse(s)
+
+def formatValue(key, value):
+    return get(key).format(value)
+
+def getPrecision(key, value):
+    return get(key).getPrecision(value)
+
+# Sorts the keys of nutritional information by their index, unknown keys last
+def sort(nutriInfo):
+    return odict(sorted(nutriInfo.items(), key=lambda item: byKey[item[0]].index if item[0] in byKey else len(nutrients)))
+
+# Brings nutritional information (strings with units, e.g. from a food file) into the units of the nutrients
+def normalize(nutriInfo):
+    return sort(odict((key, formatValue(key, parse(key, value))) for key, value in nutriInfo.items()))
+
+# Parses a list of nutrients like "cholesterol 46mg, vitaminC 12mg" (keys are case insensitive)
+# Returns an odict: key -> value (SI units)
+def parseList(s):
+    keys = {key.lower(): key for key in byKey}
+    ret = odict()
+    for part in s.split(","):
+        if len(part.strip()) == 0:
+            continue
+        words = part.split()
+        if len(words) < 2 or words[0].lower() not in keys:
+            raise ValueError("'{}' is not a nutrient and its amount!".format(part.strip()))
+        key = keys[words[0].lower()]
+        ret[key] = parse(key, "".join(words[1:]))
+    return ret
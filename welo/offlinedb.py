@@ -0,0 +1,176 @@
+import csv
+import os
+import sqlite3
+import sys
+import time
+from collections import OrderedDict as odict
+
+import appdirs
+
+from . import quantities as q
+from . import fddb
+from . import model
+
+# Nutrient columns of an Open Food Facts CSV export (values per 100g) and how to convert them
+# to the SI base units stored in the database
+columnMap = odict([
+    ("energy", [("energy-kcal_100g", 4184.0), ("energy_100g", 1000.0)]),
+    ("fat", [("fat_100g", 0.001)]),
+    ("satFat", [("saturated-fat_100g", 0.001)]),
+    ("carbs", [("carbohydrates_100g", 0.001)]),
+    ("sugar", [("sugars_100g", 0.001)]),
+    ("fiber", [("fiber_100g", 0.001)]),
+    ("protein", [("proteins_100g", 0.001)]),
+    ("sodium", [("sodium_100g", 0.001), ("salt_100g", 0.001 * 0.4)]),
+])
+nameColumns = ["product_name", "generic_name"]
+brandColumn = "brands"
+
+batchSize = 10000
+
+def getDefaultPath():
+    return os.path.join(appdirs.user_data_dir("welo", False), "foods.sqlite")
+
+def normalizeName(name):
+    return " ".join(name.strip().lower().split())
+
+def toQuantity(key, value):
+    if key == "energy":
+        return q.Energy(value)
+    else:
+        return q.Mass(value)
+
+# A large food database (e.g. an Open Food Facts dump) stored in an indexed sqlite file,
+# so that single foods can be found without loading all of it. The words of the names are
+# indexed as well (a full text index with prefixes, see search).
+class OfflineFoodDb(object):
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+
+    def close(self):
+        self.connection.close()
+
+    def createTable(self):
+        nutrientColumns = ", ".join("{} REAL".format(key) for key in fddb.keyOrder)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS foods (id INTEGER PRIMARY KEY, name TEXT NOT NULL, "
+            "key TEXT NOT NULL, brand TEXT, {})".format(nutrientColumns))
+
+    def hasSearchIndex(self):
+        return self.connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'foods_words'").fetchone() != None
+
+    # The words of the keys of all foods, the table only stores the index and refers to the foods by id
+    def buildSearchIndex(self):
+        self.connection.execute("DROP TABLE IF EXISTS foods_words")
+        self.connection.execute("CREATE VIRTUAL TABLE foods_words USING fts5(key, content='foods', content_rowid='id', prefix='2 3')")
+        self.connection.execute("INSERT INTO foods_words (foods_words) VALUES ('rebuild')")
+        self.connection.commit()
+
+    def importCsv(self, csvPath, append=False, delimiter=None):
+        startTime = time.time()
+        csv.field_size_limit(sys.maxsize)
+
+        self.connection.execute("PRAGMA journal_mode = OFF")
+        self.connection.execute("PRAGMA synchronous = OFF")
+        if not append:
+            self.connection.execute("DROP TABLE IF EXISTS foods")
+            self.connection.execute("DROP TABLE IF EXISTS foods_words")
+        self.createTable()
+        # Building the index once after inserting everything is a lot faster than updating it for every row
+        self.connection.execute("DROP INDEX IF EXISTS foods_key")
+
+        insert = "INSERT INTO foods (name, key, brand, {}) VALUES ({})".format(
+            ", ".join(fddb.keyOrder), ", ".join("?" * (len(fddb.keyOrder) + 3)))
+
+        count = 0
+        with open(csvPath, newline="", encoding="utf-8", errors="replace") as f:
+            header = f.readline().rstrip("\r\n")
+            if delimiter == None:
+                delimiter = "\t" if "\t" in header else ","
+            # Open Food Facts exports are tab separated and not quoted at all
+            quoting = csv.QUOTE_NONE if delimiter == "\t" else csv.QUOTE_MINIMAL
+            header = next(csv.reader([header], delimiter=delimiter, quoting=quoting))
+            columnIndex = {name: i for i, name in enumerate(header)}
+
+            nameIndices = [columnIndex[name] for name in nameColumns if name in columnIndex]
+            if len(nameIndices) == 0:
+                raise model.WeloError("'{}' has none of the columns {}.".format(csvPath, ", ".join(nameColumns)))
+            brandIndex = columnIndex.get(brandColumn)
+            nutrientIndices = [[(columnIndex[column], factor) for column, factor in columns if column in columnIndex]
+                for columns in columnMap.values()]
+
+            batch = []
+            for row in csv.reader(f, delimiter=delimiter, quoting=quoting):
+                name = None
+                for i in nameIndices:
+                    if i < len(row) and row[i].strip():
+                        name = row[i].strip()
+                        break
+                if name == None:
+                    continue
+
+                values = []
+                for indices in nutrientIndices:
+                    value = None
+                    for i, factor in indices:
+                        if i < len(row) and row[i]:
+                            try:
+                                value = float(row[i]) * factor
+                                break
+                            except ValueError:
+                                pass
+                    values.append(value)
+                if values[0] == None:
+                    continue
+
+                brand = row[brandIndex].strip() if brandIndex != None and brandIndex < len(row) else ""
+                batch.append([name, normalizeName(name), brand or None] + values)
+                if len(batch) >= batchSize:
+                    self.connection.executemany(insert, batch)
+                    count += len(batch)
+                    batch = []
+                    print("\rImported {} foods..".format(count), end="", file=sys.stderr)
+            self.connection.executemany(insert, batch)
+            count += len(batch)
+
+        self.connection.execute("CREATE INDEX foods_key ON foods (key)")
+        self.connection.commit()
+        self.buildSearchIndex()
+        print("\rImported {} foods in {:.1f}s.".format(count, time.time() - startTime), file=sys.stderr)
+        return count
+
+    def rowToNutriInfo(self, row):
+        nutriInfo = odict()
+        for key, value in zip(fddb.keyOrder, row):
+            if value != None:
+                nutriInfo[key] = str(toQuantity(key, value))
+        return nutriInfo
+
+    def get(self, name):
+        row = self.connection.execute("SELECT {} FROM foods WHERE key = ? ORDER BY id LIMIT 1".format(
+            ", ".join(fddb.keyOrder)), (normalizeName(name),)).fetchone()
+        if row:
+            return self.rowToNutriInfo(row)
+        else:
+            return None
+
+    # Returns (name, brand) of foods with words starting with all the words of 'query', shortest names first
+    def search(self, query, limit=10):
+        words = normalizeName(query).split()
+        if len(words) == 0:
+            return []
+        # Databases imported by older versions of welo do not have the index yet
+        if not self.hasSearchIndex():
+            print("Building the search index of the offline food database..", file=sys.stderr)
+            self.buildSearchIndex()
+        # Every word is a quoted prefix query, so characters like '-' or '*' in it are not operators
+        match = " AND ".join('"{}"*'.format(word.replace('"', '""')) for word in words)
+        return self.connection.execute("SELECT DISTINCT name, brand FROM foods WHERE id IN "
+            "(SELECT rowid FROM foods_words WHERE foods_words MATCH ?) ORDER BY length(key), name LIMIT ?", (match, limit)).fetchall()
+
+def openDb(path=None):
+    path = path or getDefaultPath()
+    if os.path.isfile(path):
+        return OfflineFoodDb(path)
+    else:
+        return None
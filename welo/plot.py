@@ -0,0 +1,231 @@
+import shutil
+import sys
+from datetime import datetime, date, timedelta
+
+from . import quantities as q
+from . import balance
+from . import model
+
+kinds = ["weight", "energy", "balance"]
+
+# Largest-Triangle-Three-Buckets (Steinarsson 2013): keeps the first and the last point and of every
+# bucket in between the point spanning the largest triangle with the previously kept point and the
+# average of the next bucket. This keeps peaks and dips, unlike averaging or taking every n-th point.
+def lttb(points, threshold):
+    if threshold >= len(points) or threshold < 3:
+        return list(points)
+
+    ret = [points[0]]
+    bucketSize = (len(points) - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * bucketSize) + 1
+        end = int((i + 1) * bucketSize) + 1
+        nextEnd = min(int((i + 2) * bucketSize) + 1, len(points))
+        nextBucket = points[end:nextEnd]
+        avgX = sum(p[0] for p in nextBucket) / len(nextBucket)
+        avgY = sum(p[1] for p in nextBucket) / len(nextBucket)
+
+        ax, ay = points[a]
+        maxArea, maxIndex = -1, start
+        for j in range(start, end):
+            area = abs((ax - avgX) * (points[j][1] - ay) - (ax - points[j][0]) * (avgY - ay))
+            if area > maxArea:
+                maxArea, maxIndex = area, j
+        ret.append(points[maxIndex])
+        a = maxIndex
+    ret.append(points[-1])
+    return ret
+
+# Exponentially smoothed moving average, see "The Hacker's Diet" by John Walker
+def smooth(points, factor=0.1):
+    ret = []
+    trend = None
+    for x, y in points:
+        trend = y if trend == None else trend + factor * (y - trend)
+        ret.append((x, trend))
+    return ret
+
+def toX(dt):
+    return dt.timestamp()
+
+def fromX(x):
+    return datetime.fromtimestamp(x)
+
+# Returns a list of (x, y) sorted by x and the unit of y
+def getSeries(data, kind, startTime, endTime):
+    if kind == "weight":
+        weights = data.getLogs(startTime, "weight", endTime)
+        return [(toX(item.time), item.weight) for item in weights], "kg"
+
+    elif kind == "energy":
+        days = {}
+        for meal in data.getMeals(startTime, endTime):
+            nutriInfo = data.getMealTotal(meal).nutriInfo
+            day = meal.time.date()
+            days[day] = days.get(day, 0.0) + q.Energy(nutriInfo.get("energy", 0.0)).kcal()
+        return [(toX(balance.dayStart(day)), kcal) for day, kcal in sorted(days.items())], "kcal"
+
+    elif kind == "balance":
+        if data.getBmr() == None or data.getActivity() == None:
+            raise model.WeloError("Please configure your height, sex, birthday and activity first (see 'welo config --help').")
+        firstDay = max(startTime.date(), balance.getFirstDay(data) or date.today())
+        lastDay = min((endTime - timedelta(minutes=1)).date(), date.today())
+        points = []
+        for day, values in zip(balance.dayRange(firstDay, lastDay), balance.computeDays(data, firstDay, lastDay)):
+            if values["days"] > 0:
+                points.append((toX(balance.dayStart(day)), values["expenditure"] - values["intake"]))
+        return points, "kcal deficit"
+
+class Scale(object):
+    def __init__(self, seriesList):
+        xs = [x for name, points in seriesList for x, y in points]
+        ys = [y for name, points in seriesList for x, y in points]
+        self.xMin, self.xMax = min(xs), max(xs)
+        self.yMin, self.yMax = min(ys), max(ys)
+        if self.xMax == self.xMin:
+            self.xMin, self.xMax = self.xMin - 1, self.xMax + 1
+        padding = (self.yMax - self.yMin) * 0.05 or 1.0
+        self.yMin, self.yMax = self.yMin - padding, self.yMax + padding
+
+    # Maps to [0, width] x [0, height] with y pointing down
+    def map(self, x, y, width, height):
+        return ((x - self.xMin) / (self.xMax - self.xMin) * width,
+            (self.yMax - y) / (self.yMax - self.yMin) * height)
+
+def formatValue(y, unit):
+    if unit == "kg":
+        return "{}kg".format(round(y, 1))
+    else:
+        return "{}".format(int(round(y)))
+
+def formatDay(x):
+    return fromX(x).strftime("%d.%m.%Y")
+
+# Dot (column, row) of a braille character -> bit
+brailleBits = [[0x01, 0x08], [0x02, 0x10], [0x04, 0x20], [0x40, 0x80]]
+colors = {"series": "", "trend": "\033[36m", "goal": "\033[31m"}
+
+def renderBraille(seriesList, unit, width, height, color=False):
+    scale = Scale(seriesList)
+    cells = [[0] * width for i in range(height)]
+    cellColors = [[None] * width for i in range(height)]
+    dotsX, dotsY = width * 2 - 1, height * 4 - 1
+
+    def setDot(x, y, name):
+        x, y = int(round(x)), int(round(y))
+        if 0 <= x <= dotsX and 0 <= y <= dotsY:
+            cells[y // 4][x // 2] |= brailleBits[y % 4][x % 2]
+            # The measured values are drawn over everything else
+            if cellColors[y // 4][x // 2] != "series":
+                cellColors[y // 4][x // 2] = name
+
+    # Drawn in reverse, so the first series ends up on top
+    for name, points in reversed(seriesList):
+        mapped = [scale.map(x, y, dotsX, dotsY) for x, y in points]
+        for (x0, y0), (x1, y1) in zip(mapped, mapped[1:]):
+            steps = int(max(abs(x1 - x0), abs(y1 - y0))) + 1
+            for i in range(steps + 1):
+                setDot(x0 + (x1 - x0) * i / steps, y0 + (y1 - y0) * i / steps, name)
+        if len(mapped) == 1:
+            setDot(mapped[0][0], mapped[0][1], name)
+
+    labels = {0: formatValue(scale.yMax, unit), height - 1: formatValue(scale.yMin, unit),
+        height // 2: formatValue((scale.yMin + scale.yMax) / 2, unit)}
+    labelWidth = max(len(label) for label in labels.values())
+    lines = []
+    for row in range(height):
+        line = labels.get(row, "").rjust(labelWidth) + " ┤"
+        for col in range(width):
+            c = chr(0x2800 + cells[row][col])
+            if color and cells[row][col] and colors.get(cellColors[row][col]):
+                c = colors[cellColors[row][col]] + c + "\033[0m"
+            line += c
+        lines.append(line)
+    start, end = formatDay(scale.xMin), formatDay(scale.xMax)
+    lines.append(" " * (labelWidth + 2) + start + end.rjust(width - len(start)))
+    return lines
+
+sparkChars = "▁▂▃▄▅▆▇█"
+
+def renderSparkline(points, width):
+    points = lttb(points, width)
+    ys = [y for x, y in points]
+    yMin, yMax = min(ys), max(ys)
+    span = (yMax - yMin) or 1.0
+    return "".join(sparkChars[int((y - yMin) / span * (len(sparkChars) - 1) + 0.5)] for y in ys)
+
+svgColors = {"series": "#1f77b4", "trend": "#ff7f0e", "goal": "#d62728"}
+
+def renderSvg(seriesList, unit, title, width, height):
+    scale = Scale(seriesList)
+    left, right, top, bottom = 70, 20, 30, 30
+    plotWidth, plotHeight = width - left - right, height - top - bottom
+
+    def coords(points):
+        ret = []
+        for x, y in points:
+            px, py = scale.map(x, y, plotWidth, plotHeight)
+            ret.append("{:.1f},{:.1f}".format(left + px, top + py))
+        return " ".join(ret)
+
+    parts = []
+    parts.append('<svg xmlns="http://www.w3.org/2000/svg" width="{}" height="{}" viewBox="0 0 {} {}" font-family="sans-serif" font-size="12">'.format(
+        width, height, width, height))
+    parts.append('<rect width="100%" height="100%" fill="white"/>')
+    parts.append('<text x="{}" y="20" font-size="14">{}</text>'.format(left, title))
+    parts.append('<rect x="{}" y="{}" width="{}" height="{}" fill="none" stroke="#ccc"/>'.format(left, top, plotWidth, plotHeight))
+    for i in range(5):
+        y = scale.yMin + (scale.yMax - scale.yMin) * i / 4
+        py = top + scale.map(scale.xMin, y, plotWidth, plotHeight)[1]
+        parts.append('<line x1="{}" y1="{:.1f}" x2="{}" y2="{:.1f}" stroke="#eee"/>'.format(left, py, left + plotWidth, py))
+        parts.append('<text x="{}" y="{:.1f}" text-anchor="end">{}</text>'.format(left - 5, py + 4, formatValue(y, unit)))
+    parts.append('<text x="{}" y="{}">{}</text>'.format(left, height - 10, formatDay(scale.xMin)))
+    parts.append('<text x="{}" y="{}" text-anchor="end">{}</text>'.format(left + plotWidth, height - 10, formatDay(scale.xMax)))
+    for name, points in reversed(seriesList):
+        dash = ' stroke-dasharray="6,4"' if name == "goal" else ""
+        parts.append('<polyline points="{}" fill="none" stroke="{}" stroke-width="{}"{}/>'.format(
+            coords(points), svgColors[name], 2 if name == "trend" else 1.5, dash))
+    parts.append("</svg>")
+    return "\n".join(parts) + "\n"
+
+# The series are downsampled to (about) one point per pixel or braille dot before rendering,
+# so rendering takes as long for ten years of data as it does for a month.
+def plot(data, kind, start=None, end=None, output=None, width=None, height=None, sparkline=False, smoothing=0.1):
+    startTime = start.datetime if start else datetime.min
+    endTime = end.datetime if end else datetime.max
+    points, unit = getSeries(data, kind, startTime, endTime)
+    if len(points) == 0:
+        raise model.WeloError("There is no data to plot in that time frame.")
+
+    if sparkline:
+        width = width or max(shutil.get_terminal_size().columns - 30, 10)
+        ys = [y for x, y in points]
+        print("{} {} ({} to {})".format(renderSparkline(points, width), kind,
+            formatValue(min(ys), unit), formatValue(max(ys), unit)))
+        return
+
+    if output:
+        width, height = width or 800, height or 400
+        resolution = width
+    else:
+        width = width or max(shutil.get_terminal_size().columns - 12, 20)
+        height = height or 15
+        resolution = width * 2
+
+    seriesList = [("series", lttb(points, resolution))]
+    if len(points) > 2:
+        seriesList.append(("trend", lttb(smooth(points, smoothing), resolution)))
+    goalWeight = data.getConfig("goalWeight")
+    if kind == "weight" and goalWeight:
+        seriesList.append(("goal", [(points[0][0], goalWeight.kg()), (points[-1][0], goalWeight.kg())]))
+
+    title = "{} ({})".format(kind, unit)
+    if output:
+        with open(output, "w") as f:
+            f.write(renderSvg(seriesList, unit, title, width, height))
+        print("Wrote {} points of {} to '{}'.".format(len(seriesList[0][1]), kind, output))
+    else:
+        print(title)
+        for line in renderBraille(seriesList, unit, width, height, sys.stdout.isatty()):
+            print(line)
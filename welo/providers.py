@@ -0,0 +1,270 @@
+import concurrent.futures
+import json
+import os
+import re
+import time
+from collections import OrderedDict as odict
+
+import requests
+
+from . import fddb
+from . import offlinedb
+from . import nutrients
+
+# A provider either looks up nutritional information (per 100g) for a reference the user entered
+# (e.g. a link or a path) or searches for it by food name without asking the user at all.
+class Provider(object):
+    name = "provider"
+    timeout = 10.0
+
+    def canLookup(self, reference):
+        return False
+
+    def lookup(self, reference):
+        return None
+
+    def search(self, name):
+        return None
+
+class OpenFoodFactsProvider(Provider):
+    name = "openfoodfacts.org"
+    apiUrl = "https://world.openfoodfacts.org/api/v0/product/{}.json"
+
+    def getBarcode(self, reference):
+        m = re.match(r"^https?://[^/]*openfoodfacts\.org/product/([0-9]+)", reference) or re.match(r"^([0-9]{8,14})$", reference)
+        return m.group(1) if m else None
+
+    def canLookup(self, reference):
+        return self.getBarcode(reference) != None
+
+    def lookup(self, reference):
+        r = requests.get(self.apiUrl.format(self.getBarcode(reference)), timeout=self.timeout)
+        r.raise_for_status()
+        nutriments = r.json().get("product", {}).get("nutriments", {})
+        nutriInfo = odict()
+        for key, columns in offlinedb.columnMap.items():
+            for column, factor in columns:
+                if column in nutriments:
+                    nutriInfo[key] = str(offlinedb.toQuantity(key, float(nutriments[column]) * factor))
+                    break
+        return nutriInfo if "energy" in nutriInfo else None
+
+# Any other link is assumed to be a fddb.info page
+class FddbProvider(Provider):
+    name = "fddb.info"
+
+    def canLookup(self, reference):
+        return reference.startswith("http")
+
+    def lookup(self, reference):
+        return fddb.getNutriInfo(reference, self.timeout) or None
+
+def parseNutriInfo(nutriInfo):
+    return nutrients.normalize(nutriInfo)
+
+# JSON files containing either the nutritional information of a single food or an object of
+# food names and their nutritional information, e.g. {"tomato": {"energy": "18kcal", "fat": "0.2g"}}.
+class LocalFileProvider(Provider):
+    name = "local file"
+
+    def __init__(self, paths=[]):
+        self.paths = paths
+        self._foods = None
+
+    @staticmethod
+    def load(path):
+        with open(os.path.expanduser(path)) as f:
+            return json.load(f, object_pairs_hook=odict)
+
+    def canLookup(self, reference):
+        return reference.endswith(".json") and os.path.isfile(os.path.expanduser(reference))
+
+    def lookup(self, reference):
+        return parseNutriInfo(self.load(reference))
+
+    def search(self, name):
+        if self._foods == None:
+            self._foods = odict()
+            for path in self.paths:
+                for foodName, nutriInfo in self.load(path).items():
+                    self._foods.setdefault(foodName, nutriInfo)
+        if name in self._foods:
+            return parseNutriInfo(self._foods[name])
+        return None
+
+class OfflineDbProvider(Provider):
+    name = "offline food database"
+
+    def __init__(self, path):
+        self.path = path
+
+    # Every lookup runs in its own thread and sqlite connections can't be shared between threads
+    def search(self, name):
+        db = offlinedb.OfflineFoodDb(self.path)
+        try:
+            return db.get(name)
+        finally:
+            db.close()
+
+def getProviders(foodFiles=[]):
+    ret = [LocalFileProvider(foodFiles)]
+    if os.path.isfile(offlinedb.getDefaultPath()):
+        ret.append(OfflineDbProvider(offlinedb.getDefaultPath()))
+    ret.append(OpenFoodFactsProvider())
+    ret.append(FddbProvider())
+    return ret
+
+def canLookup(providers, reference):
+    return any(provider.canLookup(reference) for provider in providers)
+
+def mergeNutriInfos(nutriInfos):
+    merged = odict()
+    for nutriInfo in nutriInfos:
+        for key, value in nutriInfo.items():
+            merged.setdefault(key, value)
+    return nutrients.sort(merged)
+
+# jobs is a list of (key, provider, function, argument). All functions are called concurrently and
+# the result for every key is either the first good (non-empty) result or, if merge is True, all
+# good results merged in the order of the jobs (fields of earlier jobs win).
+# Returns an odict: key -> (nutriInfo, names of the providers used)
+def run(jobs, merge=False):
+    keys = list(odict((job[0], None) for job in jobs).keys())
+    if len(jobs) == 0:
+        return odict()
+
+    goodResults = {key: [] for key in keys}
+    pending = {key: 0 for key in keys}
+    for job in jobs:
+        pending[job[0]] += 1
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=min(32, len(jobs)))
+    futures = {}
+    for priority, (key, provider, func, arg) in enumerate(jobs):
+        futures[executor.submit(func, arg)] = (priority, key, provider)
+    # Every provider enforces its own timeout on its requests, this only guards against hanging ones
+    timeout = max(job[1].timeout for job in jobs) + 1.0
+    try:
+        for future in concurrent.futures.as_completed(futures, timeout=timeout):
+            priority, key, provider = futures[future]
+            pending[key] -= 1
+            try:
+                nutriInfo = future.result()
+            except Exception as e:
+                print("Lookup of '{}' using {} failed: {}".format(key, provider.name, e))
+                nutriInfo = None
+            if nutriInfo:
+                goodResults[key].append((priority, provider.name, nutriInfo))
+
+            if merge:
+                done = all(count == 0 for count in pending.values())
+            else:
+                done = all(len(goodResults[key]) > 0 or pending[key] == 0 for key in keys)
+            if done:
+                break
+    except concurrent.futures.TimeoutError:
+        print("Some lookups timed out.")
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    ret = odict()
+    for key in keys:
+        results = goodResults[key]
+        if len(results) == 0:
+            ret[key] = None
+        elif merge:
+            results.sort(key=lambda result: result[0])
+            ret[key] = (mergeNutriInfos(result[2] for result in results), [result[1] for result in results])
+        else:
+            ret[key] = (results[0][2], [results[0][1]])
+    return ret
+
+# names -> odict: name -> (nutriInfo, provider names) or None
+def searchAll(providers, names):
+    return run([(name, provider, provider.search, name) for name in names for provider in providers
+        if type(provider).search != Provider.search], merge=True)
+
+# references is an odict: name -> reference
+def lookupAll(providers, references):
+    jobs = []
+    for name, reference in references.items():
+        for provider in providers:
+            if provider.canLookup(reference):
+                jobs.append((name, provider, provider.lookup, reference))
+                break
+    return run(jobs)
+
+if __name__ == "__main__":
+    # Test against local stand-in servers that take a while to respond
+    import http.server
+    import threading
+
+    delay = 0.5
+    fddbPage = ("<div class='sidrow'><span style='font-weight:bold;'>Calories</span></div><div>263 kcal</div></div>"
+        "<div class='sidrow'><span style='font-weight:bold;'>Fat</span></div><div>21 g</div></div>")
+    offProduct = json.dumps({"product": {"nutriments": {"energy-kcal_100g": 18, "fat_100g": 0.2, "salt_100g": 1}}})
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(delay)
+            if self.path.startswith("/api/"):
+                body = offProduct
+            elif self.path.startswith("/fddb/"):
+                body = fddbPage
+            else:
+                self.send_response(404)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.end_headers()
+            self.wfile.write(body.encode("utf-8"))
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    baseUrl = "http://127.0.0.1:{}".format(server.server_address[1])
+
+    off = OpenFoodFactsProvider()
+    off.apiUrl = baseUrl + "/api/{}.json"
+    testProviders = [off, FddbProvider()]
+
+    references = odict()
+    for i in range(5):
+        references["fddb{}".format(i)] = "{}/fddb/{}".format(baseUrl, i)
+    references["off"] = "4008400401621"
+    references["missing"] = baseUrl + "/missing"
+
+    start = time.time()
+    results = lookupAll(testProviders, references)
+    duration = time.time() - start
+    assert results["fddb0"][0] == odict([("energy", "263kcal"), ("fat", "21g")]), results["fddb0"]
+    assert results["off"][0] == odict([("energy", "18kcal"), ("fat", "0.2g"), ("sodium", "0.4g")]), results["off"]
+    assert results["missing"] == None
+    assert duration < delay * 3, "Lookups did not run concurrently ({:.2f}s)".format(duration)
+
+    slow = FddbProvider()
+    slow.timeout = delay / 5
+    start = time.time()
+    results = lookupAll([slow], odict([("slow", baseUrl + "/fddb/slow")]))
+    assert results["slow"] == None
+    assert time.time() - start < delay * 2
+
+    class StaticProvider(Provider):
+        def __init__(self, name, foods):
+            self.name = name
+            self.foods = foods
+
+        def search(self, name):
+            return self.foods.get(name)
+
+    results = searchAll([StaticProvider("a", {"tomato": odict([("energy", "18kcal")])}),
+        StaticProvider("b", {"tomato": odict([("energy", "20kcal"), ("fat", "0.2g")]), "pasta": odict([("energy", "147kcal")])})],
+        ["tomato", "pasta", "unknown"])
+    assert results["tomato"] == (odict([("energy", "18kcal"), ("fat", "0.2g")]), ["a", "b"]), results["tomato"]
+    assert results["pasta"][1] == ["b"]
+    assert results["unknown"] == None
+
+    server.shutdown()
+    print("All tests passed!")
@@ -1,5 +1,5 @@
 import re
-from datetime import datetime, date, time
+from datetime import datetime, date, time, timedelta
 
 def splitUnit(s):
     matches = re.findall(r"(\-?[0-9\.]+)\s*([A-z\"'\(\)]+)", s)
@@ -7,11 +7,13 @@ def splitUnit(s):
         raise ValueError
     return [(float(m[0]), m[1].strip().lower()) for m in matches]
 
+# Rounds first, so values that only differ by floating point errors (e.g. sums) are shown the same way
 def roundStr(v, digits=0):
+    v = round(v, digits)
     if v == int(v):
         return str(int(v))
     else:
-        return str(round(v, digits))
+        return str(v)
 
 # internal data is always SI base units
 
@@ -70,12 +72,14 @@ class Time(object):
             self.datetime = datetime.now()
         elif isinstance(s, Time):
             self.datetime = s.datetime
+        elif isinstance(s, datetime):
+            self.datetime = s
         elif s == "today" or s == "yesterday":
             self.datetime = datetime.combine(date.today(), time(0, 0))
             if s == "yesterday":
                 self.datetime -= timedelta(hours=24)
         else:
-            formats = ["%d.%m.%Y %H:%M", "%d.%m.%Y", "%Y.%m.%d %H:%M", "%Y.%m.%d"]
+            formats = ["%d.%m.%Y %H:%M", "%d.%m.%Y", "%Y.%m.%d %H:%M", "%Y.%m.%d", "%Y-%m-%d %H:%M", "%Y-%m-%d"]
             for fmt in formats:
                 try:
                     self.datetime = datetime.strptime(s, fmt)
@@ -94,9 +98,9 @@ class Time(object):
             raise ValueError("'{}' is not a time!".format(s))
 
     # https://stackoverflow.com/questions/2217488/age-from-birthdate-in-python/9754466#9754466
-    def getAge(self):
+    def getAge(self, today=None):
         born = self.datetime
-        today = date.today()
+        today = today or date.today()
         age = today.year - born.year
         if today.month < born.month or (today.month == born.month and today.day - born.day):
             age -= 1
@@ -265,7 +269,8 @@ class Energy(object):
         return self.joules * 0.000239006
 
     def __str__(self):
-        return "{}kcal".format(int(self.kcal()))
+        # Only the floating point errors are rounded away, the rest is cut off
+        return "{}kcal".format(int(round(self.kcal(), 6)))
 
     def __mul__(self, factor):
         assert isinstance(factor, float) or isinstance(factor, int)
@@ -402,6 +407,7 @@ if __name__ == "__main__":
     assertEqual(str(Mass(112.5)), "112.5kg")
     assertEqual(str(Mass(112.55)), "112.5kg")
     assertEqual(str(Mass(0.5)), "500g")
+    assertEqual(str(Mass(0.05 + 0.1)), "150g")
 
     assertEqual(fromStr("1000 kcal").joules, 4184000)
     assertEqual(fromStr("1000000 cal").joules, 4184000)
@@ -414,6 +420,7 @@ if __name__ == "__main__":
     assertEqual(fromStr("27.02.1992 18:30").datetime, datetime(1992, 2, 27, hour=18, minute=30))
     assertEqual(fromStr("1992.02.27").datetime, datetime(1992, 2, 27))
     assertEqual(fromStr("1992.02.27 18:30").datetime, datetime(1992, 2, 27, hour=18, minute=30))
+    assertEqual(fromStr("1992-02-27").datetime, datetime(1992, 2, 27))
     print("Check if this is now yourself:", str(Time()))
 
     print("All tests passed!")
@@ -0,0 +1,109 @@
+import concurrent.futures
+import csv
+import glob
+import json
+import os
+import sys
+from collections import OrderedDict as odict
+from datetime import datetime, date, timedelta, time
+
+from . import quantities as q
+from . import welo
+from . import model
+
+columns = ["client", "weekStart", "weekEnd", "mealDays", "intake", "dailyIntake", "totalEnergyExpenditure",
+    "deficit", "startWeight", "endWeight", "weightChange", "error"]
+
+def findDataFiles(pattern):
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, "*.json")
+    return sorted(path for path in glob.glob(pattern) if os.path.isfile(path))
+
+def weekReport(data, weekStart):
+    weekEnd = weekStart + timedelta(days=7)
+
+    row = odict()
+    row["weekStart"] = weekStart.strftime("%d.%m.%Y")
+    row["weekEnd"] = (weekEnd - timedelta(days=1)).strftime("%d.%m.%Y")
+
+    meals = list(data.getMeals(weekStart, weekEnd))
+    intake = q.Energy(0)
+    mealDays = set()
+    for meal in meals:
+        nutriInfo = data.getMealTotal(meal).nutriInfo
+        if "energy" in nutriInfo:
+            intake += q.Energy(nutriInfo["energy"])
+        mealDays.add(meal.time.date())
+    row["mealDays"] = len(mealDays)
+    row["intake"] = round(intake.kcal())
+    # Days without any logged meals are most likely days that were not logged, not days of fasting
+    row["dailyIntake"] = round(intake.kcal() / len(mealDays)) if len(mealDays) > 0 else None
+
+    totalEnergyExpenditure = data.getTotalEnergyExpenditure()
+    row["totalEnergyExpenditure"] = totalEnergyExpenditure
+    if totalEnergyExpenditure and len(mealDays) > 0:
+        row["deficit"] = totalEnergyExpenditure * len(mealDays) - row["intake"]
+    else:
+        row["deficit"] = None
+
+    weights = list(data.getLogs(weekStart, "weight", weekEnd))
+    if len(weights) > 0:
+        startWeight, endWeight = q.Mass(weights[0].weight), q.Mass(weights[-1].weight)
+        row["startWeight"] = round(startWeight.kg(), 1)
+        row["endWeight"] = round(endWeight.kg(), 1)
+        row["weightChange"] = round((endWeight - startWeight).kg(), 1)
+    else:
+        row["startWeight"] = row["endWeight"] = row["weightChange"] = None
+
+    return row
+
+# Runs in a worker process, so it only receives and returns plain (picklable) data
+def clientReport(path, start, weeks):
+    client = os.path.splitext(os.path.basename(path))[0]
+    try:
+        with open(path) as f:
+            data = welo.DataWrapper(json.load(f, object_pairs_hook=odict), path)
+        rows = []
+        for week in range(weeks):
+            row = odict([("client", client)])
+            row.update(weekReport(data, start + timedelta(days=7 * week)))
+            row["error"] = None
+            rows.append(row)
+        return rows
+    except Exception as e:
+        return [odict([("client", client), ("error", "{}: {}".format(type(e).__name__, e))])]
+
+def report(pattern, start=None, weeks=1, outputFormat="csv", output=None, jobs=None):
+    paths = findDataFiles(pattern)
+    if len(paths) == 0:
+        raise model.WeloError("No data files found for '{}'.".format(pattern))
+
+    if start:
+        start = datetime.combine(start.datetime.date(), time(0, 0))
+    else:
+        # The last complete weeks, ending yesterday
+        start = datetime.combine(date.today(), time(0, 0)) - timedelta(days=7 * weeks)
+
+    results = {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(clientReport, path, start, weeks): path for path in paths}
+        for i, future in enumerate(concurrent.futures.as_completed(futures)):
+            path = futures[future]
+            results[path] = future.result()
+            status = "error" if any(row["error"] for row in results[path]) else "done"
+            print("[{}/{}] {} ({})".format(i + 1, len(paths), path, status), file=sys.stderr)
+
+    rows = [row for path in paths for row in results[path]]
+
+    f = open(output, "w", newline="") if output else sys.stdout
+    try:
+        if outputFormat == "json":
+            json.dump(rows, f, indent=4)
+            f.write("\n")
+        else:
+            writer = csv.DictWriter(f, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(rows)
+    finally:
+        if output:
+            f.close()
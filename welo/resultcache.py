@@ -0,0 +1,125 @@
+import json
+import os
+import sqlite3
+from collections import OrderedDict as odict
+from datetime import datetime
+
+from . import model
+
+def getPath(dataPath):
+    return dataPath + ".results.sqlite"
+
+# Changes whenever the data file is written
+def getFileState(dataPath):
+    stat = os.stat(dataPath)
+    return [stat.st_size, stat.st_mtime_ns]
+
+# Model objects and times in results are stored with their type, so they are decoded to the same objects again
+resultClasses = odict([
+    ("meal", model.Meal),
+    ("workout", model.Workout),
+    ("weight", model.WeightEntry),
+    ("foodItem", model.FoodItem),
+])
+
+# getFoodItems and getMealTotal resolve the leftovers and totals of meals (see DataWrapper), so cached meals
+# can be shown without the meals they refer to
+def encode(value, getFoodItems, getMealTotal):
+    if isinstance(value, model.Meal):
+        value = model.Meal(value.time, value.name, getFoodItems(value), value.notes, getMealTotal(value))
+    for name, cls in resultClasses.items():
+        if isinstance(value, cls):
+            return odict([("$" + name, value.toJson())])
+    if isinstance(value, datetime):
+        return odict([("$time", model.encodeTime(value))])
+    if isinstance(value, dict):
+        return odict((key, encode(x, getFoodItems, getMealTotal)) for key, x in value.items())
+    if isinstance(value, (list, tuple)):
+        return [encode(x, getFoodItems, getMealTotal) for x in value]
+    return value
+
+def decode(value):
+    if isinstance(value, dict):
+        if len(value) == 1:
+            key, x = next(iter(value.items()))
+            if key == "$time":
+                return model.decodeTime(x)
+            if key[1:] in resultClasses:
+                return resultClasses[key[1:]].fromJson(x)
+        return odict((key, decode(x)) for key, x in value.items())
+    if isinstance(value, list):
+        return [decode(x) for x in value]
+    return value
+
+# The results of read-only commands (e.g. 'welo summary'), stored in a sqlite file next to the data file.
+# Every result is stored with the generation of the data file it was computed from, which DataWrapper.save increments.
+# The size and modification time of the data file at that generation are stored too, so the generation of an unchanged
+# data file is known without loading it. If the data file changed without a new generation (e.g. it was edited by hand),
+# all results are dropped. The least recently used results are dropped once there are more than maxEntries or
+# they are larger than maxSize bytes together.
+class ResultCache(object):
+    def __init__(self, path, maxEntries=100, maxSize=16 * 1024 * 1024):
+        self.path = path
+        self.maxEntries = maxEntries
+        self.maxSize = maxSize
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, generation INTEGER NOT NULL, "
+            "value TEXT NOT NULL, size INTEGER NOT NULL, used INTEGER NOT NULL)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def close(self):
+        self.connection.close()
+
+    def getMeta(self, key):
+        row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def setMeta(self, key, value):
+        self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+    # The generation of the data file if it did not change since setGeneration, otherwise None
+    def getGeneration(self, fileState):
+        if self.getMeta("fileState") == fileState:
+            return self.getMeta("generation")
+        return None
+
+    # fileState is the state of the data file (see getFileState) the generation was loaded from
+    def setGeneration(self, fileState, generation):
+        if self.getMeta("fileState") == fileState and self.getMeta("generation") == generation:
+            return
+        # Results of other generations are never used again
+        if self.getMeta("generation") == generation:
+            self.connection.execute("DELETE FROM results")
+        else:
+            self.connection.execute("DELETE FROM results WHERE generation != ?", (generation,))
+        self.setMeta("fileState", fileState)
+        self.setMeta("generation", generation)
+        self.connection.commit()
+
+    def nextUse(self):
+        row = self.connection.execute("SELECT MAX(used) FROM results").fetchone()
+        return (row[0] or 0) + 1
+
+    # Returns the decoded result or None
+    def get(self, key, generation):
+        row = self.connection.execute("SELECT value FROM results WHERE key = ? AND generation = ?", (key, generation)).fetchone()
+        if row == None:
+            return None
+        self.connection.execute("UPDATE results SET used = ? WHERE key = ?", (self.nextUse(), key))
+        self.connection.commit()
+        return decode(json.loads(row[0], object_pairs_hook=odict))
+
+    # value has to be encoded (see encode)
+    def set(self, key, generation, value):
+        value = json.dumps(value)
+        self.connection.execute("INSERT OR REPLACE INTO results (key, generation, value, size, used) VALUES (?, ?, ?, ?, ?)",
+            (key, generation, value, len(value), self.nextUse()))
+        count, size = self.connection.execute("SELECT COUNT(*), SUM(size) FROM results").fetchone()
+        rows = self.connection.execute("SELECT key, size FROM results ORDER BY used").fetchall()
+        for oldKey, oldSize in rows:
+            if count <= self.maxEntries and size <= self.maxSize:
+                break
+            self.connection.execute("DELETE FROM results WHERE key = ?", (oldKey,))
+            count -= 1
+            size -= oldSize
+        self.connection.commit()
@@ -0,0 +1,139 @@
+import re
+import sqlite3
+from collections import OrderedDict as odict
+
+from . import quantities as q
+from . import model
+
+def getPath(dataPath):
+    return dataPath + ".search.sqlite"
+
+def tokenize(text):
+    return re.findall(r"\w+", text.lower())
+
+# Positions of different fields (name, food items, notes) are far apart, so phrases never span two of them
+fieldGap = 100
+
+# Returns token -> positions of all the searchable text of a meal. food are its food items with leftovers resolved.
+def getTokens(meal, food):
+    fields = [meal.name or ""] + [item.name for item in food] + [meal.notes or ""]
+    tokens = odict()
+    for i, field in enumerate(fields):
+        for j, token in enumerate(tokenize(field)):
+            tokens.setdefault(token, []).append(i * fieldGap + j)
+    return tokens
+
+# What is shown for a search result, so results don't have to be looked up in the data file
+def getSummary(meal, food):
+    summary = "'{}': {}".format(meal.name or "meal", " + ".join('{} "{}"'.format(q.Mass(item.amount), item.name) for item in food))
+    if meal.notes:
+        summary += " ({})".format(meal.notes)
+    return summary
+
+# A query term is a list of (word, isPrefix), e.g. "olive oi*" -> [("olive", False), ("oi", True)].
+# All words of a term have to follow each other (a phrase).
+def parseTerm(s):
+    ret = []
+    for word in s.split():
+        isPrefix = word.endswith("*")
+        for token in tokenize(word):
+            ret.append((token, False))
+        if isPrefix and len(ret) > 0:
+            ret[-1] = (ret[-1][0], True)
+    return ret
+
+# An inverted index (token -> meals and positions) of the names, food names and notes of all meals,
+# stored in a sqlite file next to the data file. Meals are identified by their time.
+class SearchIndex(object):
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS postings (token TEXT NOT NULL, time TEXT NOT NULL, positions TEXT NOT NULL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS postings_token ON postings (token, time)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS postings_time ON postings (time)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS docs (time TEXT NOT NULL, summary TEXT NOT NULL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS docs_time ON docs (time)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)")
+
+    def close(self):
+        self.connection.close()
+
+    # The number of indexed meals, to notice changes that were made without updating the index
+    def getMealCount(self):
+        row = self.connection.execute("SELECT value FROM meta WHERE key = 'meals'").fetchone()
+        return row[0] if row else None
+
+    def setMealCount(self, count):
+        self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('meals', ?)", (count,))
+        self.connection.commit()
+
+    def clear(self):
+        for table in ["postings", "docs", "meta"]:
+            self.connection.execute("DELETE FROM {}".format(table))
+
+    # getMeal is used to resolve leftovers (see model.Leftovers)
+    def addMeals(self, meals, getMeal=None):
+        postings, docs = [], []
+        for meal in meals:
+            time = model.encodeTime(meal.time)
+            food = meal.getFoodItems(getMeal)
+            for token, positions in getTokens(meal, food).items():
+                postings.append((token, time, " ".join(str(p) for p in positions)))
+            docs.append((time, getSummary(meal, food)))
+        self.connection.executemany("INSERT INTO postings (token, time, positions) VALUES (?, ?, ?)", postings)
+        self.connection.executemany("INSERT INTO docs (time, summary) VALUES (?, ?)", docs)
+
+    def removeTime(self, time):
+        time = model.encodeTime(time)
+        self.connection.execute("DELETE FROM postings WHERE time = ?", (time,))
+        self.connection.execute("DELETE FROM docs WHERE time = ?", (time,))
+
+    def commit(self):
+        self.connection.commit()
+
+    # Returns time -> set of positions of a token (or all tokens starting with it)
+    def getPostings(self, token, isPrefix, condition, params):
+        if isPrefix:
+            rows = self.connection.execute("SELECT time, positions FROM postings WHERE token >= ? AND token < ?" + condition,
+                [token, token + "\uffff"] + params)
+        else:
+            rows = self.connection.execute("SELECT time, positions FROM postings WHERE token = ?" + condition, [token] + params)
+        ret = {}
+        for time, positions in rows:
+            ret.setdefault(time, set()).update(int(p) for p in positions.split())
+        return ret
+
+    def matchTerm(self, term, condition, params):
+        postings = [self.getPostings(token, isPrefix, condition, params) for token, isPrefix in term]
+        times = set(postings[0])
+        for other in postings[1:]:
+            times &= set(other)
+        ret = set()
+        for time in times:
+            for start in postings[0][time]:
+                if all(start + i in postings[i][time] for i in range(1, len(term))):
+                    ret.add(time)
+                    break
+        return ret
+
+    # Returns (number of matching meals, list of (time, summary) of the last 'last' of them, newest first)
+    def search(self, terms, startTime=None, endTime=None, last=10):
+        condition, params = "", []
+        if startTime:
+            condition += " AND time >= ?"
+            params.append(model.encodeTime(startTime))
+        if endTime:
+            condition += " AND time < ?"
+            params.append(model.encodeTime(endTime))
+
+        times = None
+        for term in terms:
+            matches = self.matchTerm(term, condition, params)
+            times = matches if times == None else times & matches
+        times = sorted(times or [], reverse=True)
+
+        results = []
+        for time in times[:last]:
+            for row in self.connection.execute("SELECT summary FROM docs WHERE time = ?", (time,)):
+                results.append((model.decodeTime(time), row[0]))
+        return len(times), results
@@ -0,0 +1,164 @@
+import json
+import os
+from collections import OrderedDict as odict
+from datetime import datetime, date, timedelta, time
+
+from . import quantities as q
+from . import model
+from . import nutrients
+from . import welo
+from . import forecast
+from .model import WeloError
+
+# Times may be given as datetimes or strings like on the command line (e.g. "17.05.2018 13:00" or "13:00"),
+# quantities as strings with units (e.g. "500g"), quantity objects or numbers in SI base units (kg, J, s).
+def toTime(value):
+    return q.Time(value) if value != None else None
+
+def toDatetime(value):
+    return q.Time(value).datetime if value != None else None
+
+def toStartOfDay(value):
+    return datetime.combine(q.Time(value).datetime.date(), time(0, 0))
+
+# A list of weight and food name pairs, either flat like on the command line or as tuples
+def toFood(food):
+    if len(food) > 0 and isinstance(food[0], (tuple, list)):
+        food = [x for pair in food for x in pair]
+    return [str(q.Mass(x)) if i % 2 == 0 and not isinstance(x, str) else x for i, x in enumerate(food)]
+
+# The library interface of welo, e.g.:
+#
+#     with WeloStore() as store:
+#         store.eat([("500g", "pasta"), ("200g", "tomato sauce")], name="lunch")
+#         store.addWeight("81.5kg")
+#         print(store.getMealTotals("today")["deficit"])
+#
+# Queries return model objects (see model.py) and odicts instead of printing them and errors raise WeloError.
+# Mutations only change the data in memory until commit() writes all of them to the data file at once.
+# Nutritional information of foods (setNutriInfo) is written to the food store immediately.
+class WeloStore(object):
+    # Without a path the current data file of the command line (see 'welo config') is used
+    def __init__(self, path=None, foodFiles=None):
+        if path == None:
+            configPath = welo.getConfigPath()
+            if not os.path.isfile(configPath):
+                raise WeloError("Please call 'welo config <datafile>' on first start!")
+            with open(configPath) as f:
+                config = json.load(f, object_pairs_hook=odict)
+            path = config["dataFile"]
+            if foodFiles == None:
+                foodFiles = config.get("foodFiles", [])
+        self.path = path
+        self.foodFiles = foodFiles or []
+        self.data = welo.openDataFile(self.path, self.foodFiles)
+        # The number of mutations since the last commit
+        self.pending = 0
+
+    def __enter__(self):
+        return self
+
+    # Commits when the block is left without an exception
+    def __exit__(self, excType, excValue, traceback):
+        if excType == None:
+            self.commit()
+        return False
+
+    def commit(self):
+        if self.pending > 0:
+            self.data.save()
+            self.pending = 0
+
+    # Discards all mutations since the last commit
+    def rollback(self):
+        self.data = welo.openDataFile(self.path, self.foodFiles)
+        self.pending = 0
+
+    def getConfig(self, name):
+        return self.data.getConfig(name)
+
+    def setConfig(self, name, value):
+        self.data.setConfig(name, value)
+        self.pending += 1
+
+    # end defaults to 24h after start
+    def getMeals(self, start, end=None):
+        return list(self.data.getMeals(toDatetime(start), toDatetime(end)))
+
+    def getWorkouts(self, start, end=None):
+        return list(self.data.getWorkouts(toDatetime(start), toDatetime(end)))
+
+    def getWeights(self, start=None, end=None):
+        return list(self.data.getLogs(toDatetime(start) or datetime.min, "weight", toDatetime(end) or datetime.max))
+
+    # See DataWrapper.getMealTotals
+    def getMealTotals(self, start, end=None):
+        startTime = toDatetime(start)
+        endTime = toDatetime(end) or startTime + timedelta(hours=24)
+        return self.data.getMealTotals(self.data.getMeals(startTime, endTime), startTime, endTime)
+
+    # See DataWrapper.getSummary
+    def getSummary(self, start, end=None):
+        startTime = toDatetime(start)
+        return self.data.getSummary(startTime, toDatetime(end) or startTime + timedelta(hours=24))
+
+    # The energy balance of whole days, end defaults to today (see DataWrapper.getBalance)
+    def getBalance(self, start, end=None):
+        return self.data.getBalance(toStartOfDay(start).date(), toStartOfDay(end).date() if end != None else date.today())
+
+    # intake is an additional daily energy intake to forecast for (see forecast.getForecast, needs NumPy)
+    def getForecast(self, intake=None, days=56, runs=10000):
+        return forecast.getForecast(self.data, q.Energy(intake).kcal() if intake != None else None, days, runs)
+
+    # terms is a string (every word has to match) or a list of terms like for 'welo search'.
+    # Returns (number of matching meals, list of (time, summary) of the last 'last' of them).
+    def search(self, terms, start=None, end=None, last=10):
+        if isinstance(terms, str):
+            terms = terms.split()
+        return self.data.findMeals(terms, toDatetime(start), toDatetime(end), last)
+
+    # The nutritional information per 100g in SI units or None if the food is unknown
+    def getNutriInfo(self, name):
+        nutriInfo = self.data.getNutriInfo(name)
+        return model.parseNutriInfo(nutriInfo) if nutriInfo else None
+
+    # See DataWrapper.lookupFood
+    def lookupFood(self, name):
+        return self.data.lookupFood(name)
+
+    def getUnknownFoods(self, food):
+        return self.data.getUnknownFoods(toFood(food))
+
+    # nutriInfo is per 100g, e.g. {"energy": "18kcal", "fat": "0.2g", "vitaminC": "14mg"} or in SI units (see nutrients.py)
+    def setNutriInfo(self, name, nutriInfo):
+        nutriInfo = odict((key, nutrients.parse(key, value) if isinstance(value, str) else value) for key, value in nutriInfo.items())
+        self.data.getFoodStore().set(name, model.formatNutriInfo(nutrients.sort(nutriInfo)))
+
+    # Returns the result of DataWrapper.logWeight
+    def addWeight(self, weight, time=None):
+        self.pending += 1
+        return self.data.logWeight(q.Mass(weight), toTime(time))
+
+    # All foods have to be known (see getUnknownFoods and setNutriInfo). Returns the logged meal.
+    def eat(self, food, name=None, time=None, notes=None, portion=None):
+        meal = self.data.createMeal(name, toFood(food), toTime(time), notes, portion)
+        self.data.logMeal(meal)
+        self.pending += 1
+        return meal
+
+    # Removes the last meal or the one at time and returns it
+    def undoMeal(self, time=None):
+        meal = self.data.removeMeal(toTime(time))
+        self.pending += 1
+        return meal
+
+    # portion is a 'portion' like for 'welo eat --resize'. Returns the meal before and after resizing it.
+    def resizeMeal(self, portion, time=None):
+        ret = self.data.scaleMeal(str(portion), toTime(time))
+        self.pending += 1
+        return ret
+
+    def addWorkout(self, name, duration, energy=None, time=None, notes=None):
+        workout = self.data.logWorkout(name, q.Duration(duration), q.Energy(energy) if energy != None else None, toTime(time), notes)
+        self.pending += 1
+        return workout
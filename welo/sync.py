@@ -0,0 +1,246 @@
+import hashlib
+import json
+from collections import OrderedDict as odict
+from datetime import datetime
+
+from . import quantities as q
+from . import model
+from . import balance
+
+sections = list(model.sectionClasses.keys())
+
+# Returns ISO 8601 day -> section -> list of entries. Both files are in the current version (see sync),
+# so the day of an entry is the start of its time and does not have to be parsed.
+def groupDays(data):
+    days = {}
+    for section in sections:
+        for entry in data.get(section, []):
+            day = entry["time"][:10]
+            if day not in days:
+                days[day] = odict((s, []) for s in sections)
+            days[day][section].append(entry)
+    return days
+
+# The hash of the entries of a day as they are stored, so comparing unchanged days only needs this
+def hashDay(day):
+    h = hashlib.sha1()
+    for section in sections:
+        h.update(section.encode("utf-8"))
+        for entry in sorted(json.dumps(entry) for entry in day[section]):
+            h.update(entry.encode("utf-8"))
+    return h.hexdigest()[:16]
+
+# The hashes are stored in the data file and dropped when a day is changed (see DataWrapper.invalidate),
+# so only the days changed since the last sync are hashed again. Returns the number of hashed days.
+def updateDayHashes(data, days):
+    hashes = data.setdefault("dayHashes", odict())
+    missing = [day for day in days if day not in hashes]
+    for day in missing:
+        hashes[day] = hashDay(days[day])
+    return len(missing)
+
+# Entries are compared in their canonical form, so that e.g. "145.0g" and "145g" are the same
+def sortKey(section, entry):
+    item = model.sectionClasses[section].fromJson(entry)
+    return (item.time, json.dumps(item.toJson()))
+
+# Merges the entries of a and b at the same time. Identical entries are only kept once, the remaining ones are
+# paired up as conflicts (e.g. a meal edited in one of the files), for which the entry of a is kept.
+def mergeTime(a, b):
+    ret, onlyA, onlyB = [], [], list(b)
+    for key, entry in a:
+        match = next((index for index, (keyB, entryB) in enumerate(onlyB) if keyB == key), None)
+        if match == None:
+            onlyA.append((key, entry))
+        else:
+            ret.append((key, entry))
+            del onlyB[match]
+    conflicts = [(entryA, entryB) for (keyA, entryA), (keyB, entryB) in zip(onlyA, onlyB)]
+    ret.extend(onlyA)
+    ret.extend(onlyB[len(onlyA):])
+    return ret, conflicts
+
+# Merges two time ordered lists of (key, entry), where the key starts with the time of the entry.
+# Returns the merged list and the conflicts (list of (entry a, entry b), see mergeTime).
+def mergeJoin(a, b):
+    ret, conflicts = [], []
+    i, j = 0, 0
+    while i < len(a) and j < len(b):
+        timeA, timeB = a[i][0][0], b[j][0][0]
+        if timeA < timeB:
+            ret.append(a[i])
+            i += 1
+        elif timeB < timeA:
+            ret.append(b[j])
+            j += 1
+        else:
+            endA, endB = i, j
+            while endA < len(a) and a[endA][0][0] == timeA:
+                endA += 1
+            while endB < len(b) and b[endB][0][0] == timeB:
+                endB += 1
+            merged, timeConflicts = mergeTime(a[i:endA], b[j:endB])
+            ret.extend(merged)
+            conflicts.extend(timeConflicts)
+            i, j = endA, endB
+    ret.extend(a[i:])
+    ret.extend(b[j:])
+    return ret, conflicts
+
+# Returns the merged day and the conflicts (list of (section, entry a, entry b))
+def mergeDay(a, b):
+    ret, conflicts = odict(), []
+    for section in sections:
+        keyedA = sorted(((sortKey(section, entry), entry) for entry in a[section]), key=lambda x: x[0])
+        keyedB = sorted(((sortKey(section, entry), entry) for entry in b[section]), key=lambda x: x[0])
+        merged, sectionConflicts = mergeJoin(keyedA, keyedB)
+        ret[section] = [entry for key, entry in merged]
+        conflicts.extend((section, entryA, entryB) for entryA, entryB in sectionConflicts)
+    return ret, conflicts
+
+class MergeResult(object):
+    def __init__(self):
+        # section -> list of entries, sorted by time
+        self.sections = odict((section, []) for section in sections)
+        self.comparedDays = 0
+        self.changedDays = []
+        # The number of entries that were added to a and b respectively
+        self.addedToA = 0
+        self.addedToB = 0
+        # Entries that differ in both files at the same time: list of (section, entry a, entry b), a's entry is kept
+        self.conflicts = []
+        # ISO 8601 day -> hash of the merged entries of every compared day
+        self.dayHashes = odict()
+        # Whether days of a and b had to be hashed, because they changed since the last sync
+        self.hashedA = False
+        self.hashedB = False
+
+# a and b are the (JSON) data of two data files. Only days before 'since' (e.g. archived days) are ignored.
+def merge(a, b, since=None):
+    daysA, daysB = groupDays(a), groupDays(b)
+    result = MergeResult()
+    result.hashedA = updateDayHashes(a, daysA) > 0
+    result.hashedB = updateDayHashes(b, daysB) > 0
+    hashesA, hashesB = a["dayHashes"], b["dayHashes"]
+    sinceDay = model.encodeDay(since) if since else None
+    empty = odict((section, []) for section in sections)
+
+    for day in sorted(set(daysA) | set(daysB)):
+        if sinceDay and day < sinceDay:
+            continue
+        result.comparedDays += 1
+        if hashesA.get(day) == hashesB.get(day):
+            dayData = daysA[day]
+            result.dayHashes[day] = hashesA[day]
+        else:
+            dayA, dayB = daysA.get(day, empty), daysB.get(day, empty)
+            dayData, conflicts = mergeDay(dayA, dayB)
+            result.conflicts.extend(conflicts)
+            result.dayHashes[day] = hashDay(dayData)
+            countA = sum(len(entries) for entries in dayA.values())
+            countB = sum(len(entries) for entries in dayB.values())
+            count = sum(len(entries) for entries in dayData.values())
+            if count != countA or count != countB or len(conflicts) > 0:
+                result.changedDays.append(model.decodeDay(day))
+                result.addedToA += count - countA
+                result.addedToB += count - countB
+        for section in sections:
+            result.sections[section].extend(dayData[section])
+
+    # ISO 8601 times sort like the times themselves
+    for section in sections:
+        result.sections[section].sort(key=lambda entry: entry["time"])
+    return result
+
+# The union of two odicts of lists (e.g. the tags of every day)
+def mergeTags(a, b):
+    ret = odict((day, list(tagList)) for day, tagList in a.items())
+    for day, tagList in b.items():
+        dayTags = ret.setdefault(day, [])
+        for tag in tagList:
+            if tag not in dayTags:
+                dayTags.append(tag)
+    return ret
+
+# Copies the foods that are only in one of the stores into the other one. Foods with different
+# nutritional information in both stores are conflicts, storeA's version is used for both.
+# Returns (copied to a, copied to b, conflicts: list of (name, nutriInfo a, nutriInfo b))
+def mergeFoods(storeA, storeB, dry=False):
+    namesA, namesB = set(storeA.getNames()), set(storeB.getNames())
+    toA = [(name, storeB.get(name)) for name in sorted(namesB - namesA)]
+    toB = [(name, storeA.get(name)) for name in sorted(namesA - namesB)]
+    conflicts = []
+    for name in sorted(namesA & namesB):
+        nutriInfoA, nutriInfoB = storeA.get(name), storeB.get(name)
+        if nutriInfoA != nutriInfoB:
+            conflicts.append((name, nutriInfoA, nutriInfoB))
+            toB.append((name, nutriInfoA))
+    if not dry:
+        if len(toA) > 0:
+            storeA.update(toA)
+        if len(toB) > 0:
+            storeB.update(toB)
+    return len(toA), len(toB) - len(conflicts), conflicts
+
+def getArchiveStart(data):
+    if "archive" in data.data:
+        return data.getArchivedUntil().date()
+    else:
+        return None
+
+# a and b are DataWrappers. Both of them end up with the same meals, weights, workouts, tags and foods.
+def sync(a, b, dry=False):
+    # Entries of both files have to be in the same format to be compared
+    a.upgrade()
+    b.upgrade()
+
+    archiveStarts = [day for day in [getArchiveStart(a), getArchiveStart(b)] if day]
+    since = max(archiveStarts) if len(archiveStarts) > 0 else None
+    if since:
+        print("Days before {} are archived in at least one of the files and will not be synced.".format(balance.dayStr(since)))
+
+    result = merge(a.data, b.data, since)
+    print("Compared {} days, {} differ.".format(result.comparedDays, len(result.changedDays)))
+    for day in result.changedDays:
+        print("Merged {}".format(balance.dayStr(day)))
+
+    tagsChanged = a.data.get("tags", {}) != b.data.get("tags", {})
+    for section, entryA, entryB in result.conflicts:
+        print("Conflict: the entry of {} in '{}' differs, using the one of '{}'.".format(
+            model.formatTime(model.decodeTime(entryA["time"])), section, a.path))
+
+    # The conflicting entries of b are replaced by the ones of a
+    changed = []
+    for data, added, replaced in [(a, result.addedToA, 0), (b, result.addedToB, len(result.conflicts))]:
+        # Both files have the same entries on every compared day afterwards
+        data.data["dayHashes"].update(result.dayHashes)
+        if added == 0 and replaced == 0 and not tagsChanged:
+            continue
+        print("{} entries will be added to '{}'.".format(added, data.path))
+        if replaced > 0:
+            print("{} entries will be replaced in '{}'.".format(replaced, data.path))
+        changed.append(data)
+        if dry:
+            continue
+        for section in sections:
+            kept = [] if since == None else [entry for entry in data.data[section] if entry["time"][:10] < model.encodeDay(since)]
+            data.data[section] = kept + result.sections[section]
+        data.data["tags"] = mergeTags(a.data.get("tags", odict()), b.data.get("tags", odict()))
+        if len(data.data["weight"]) > 0:
+            data.setConfig("weight", q.Mass(model.parseQuantity(data.data["weight"][-1]["weight"])))
+        if len(result.changedDays) > 0:
+            balance.invalidate(data, datetime.combine(result.changedDays[0], datetime.min.time()))
+
+    copiedToA, copiedToB, conflicts = mergeFoods(a.getFoodStore(), b.getFoodStore(), dry)
+    print("{} foods copied to '{}', {} foods copied to '{}'.".format(copiedToA, a.path, copiedToB, b.path))
+    for name, nutriInfoA, nutriInfoB in conflicts:
+        print("Conflict: '{}' differs ({} vs. {}), using the one of '{}'.".format(name,
+            ", ".join("{}: {}".format(k, v) for k, v in nutriInfoA.items()),
+            ", ".join("{}: {}".format(k, v) for k, v in nutriInfoB.items()), a.path))
+
+    if not dry:
+        for data in [a, b]:
+            # Saving also updates the food names for shell completion and stores the day hashes for the next sync
+            hashed = result.hashedA if data is a else result.hashedB
+            if data in changed or hashed or data.getFoodStore().changed:
+                data.save()
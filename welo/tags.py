@@ -0,0 +1,78 @@
+import math
+import re
+from collections import OrderedDict as odict
+
+# Tags are stored by day as ISO 8601 dates (see model.encodeDay), dt is a date or a datetime
+def dayKey(dt):
+    return dt.strftime("%Y-%m-%d")
+
+def parseTag(s):
+    m = re.match(r"^\s*([^()]+?)\s*(?:\((.*)\))?\s*$", s)
+    if not m:
+        raise ValueError("'{}' is not a tag!".format(s))
+    name = m.group(1).lower()
+    params = [param.strip() for param in m.group(2).split(",")] if m.group(2) else []
+    return name, params
+
+def formatTag(name, params):
+    if len(params) > 0:
+        return "{}({})".format(name, ", ".join(params))
+    else:
+        return name
+
+# A tag with a numeric first parameter (e.g. 'sleep(6.5)') is a feature with that value,
+# any other tag (e.g. 'pizza' or 'stress(work)') is a feature with the value 1.
+def tagFeature(tag):
+    name, params = parseTag(tag)
+    if len(params) > 0:
+        try:
+            return name, float(params[0])
+        except ValueError:
+            return formatTag(name, params), 1.0
+    return name, 1.0
+
+def buildFeatureMatrix(dayTags, dayTargets):
+    # Rows are all days that have a target value (untagged days are the baseline),
+    # columns are stored sparsely as lists of (row, value) pairs per feature.
+    days = sorted(dayTargets)
+    targets = [dayTargets[day] for day in days]
+    columns = odict()
+    for row, day in enumerate(days):
+        for tag in dayTags.get(day, []):
+            feature, value = tagFeature(tag)
+            columns.setdefault(feature, []).append((row, value))
+    return days, targets, columns
+
+class FeatureStats(object):
+    def __init__(self, feature, days, correlation, slope, meanTarget):
+        self.feature = feature
+        self.days = days
+        self.correlation = correlation
+        self.slope = slope
+        self.meanTarget = meanTarget
+
+# Pearson correlation and least squares slope of every feature against the targets.
+# Only sums over the non-zero entries of each column are needed, so this is O(non-zeros).
+def correlate(targets, columns, minDays=3):
+    n = len(targets)
+    sy = sum(targets)
+    syy = sum(y * y for y in targets)
+    varY = n * syy - sy * sy
+
+    stats = []
+    for feature, column in columns.items():
+        if len(column) < minDays:
+            continue
+        sx = sxx = sxy = 0.0
+        for row, x in column:
+            y = targets[row]
+            sx += x
+            sxx += x * x
+            sxy += x * y
+        varX = n * sxx - sx * sx
+        if varX <= 0 or varY <= 0:
+            continue
+        cov = n * sxy - sx * sy
+        meanTarget = sum(targets[row] for row, x in column) / len(column)
+        stats.append(FeatureStats(feature, len(column), cov / math.sqrt(varX * varY), cov / varX, meanTarget))
+    return stats
@@ -0,0 +1,161 @@
+import json
+import os
+import sys
+import time
+from collections import Counter, OrderedDict as odict
+from datetime import datetime, date
+
+from . import quantities as q
+from . import model
+from . import welo
+
+def diffItems(old, new):
+    # Logs are mostly appended to, so everything up to the first difference is unchanged
+    n = 0
+    limit = min(len(old), len(new))
+    while n < limit and old[n] == new[n]:
+        n += 1
+    oldKeys = Counter(json.dumps(item) for item in old[n:])
+    newKeys = Counter(json.dumps(item) for item in new[n:])
+    return oldKeys - newKeys, newKeys - oldKeys
+
+# Keeps today's meals and workouts and their totals and only parses the entries that were
+# added or removed since the last update.
+class TodayLogs(object):
+    def __init__(self, section, day):
+        self.section = section
+        self.day = day
+        self.rawItems = []
+        # JSON of an entry -> list of model objects (the same entry may be logged more than once)
+        self.items = {}
+        self.totals = odict()
+        # Used to resolve leftovers of meals without a stored total
+        self.data = None
+
+    def getTotal(self, item):
+        if self.section == "meals":
+            return self.data.getMealTotal(item).nutriInfo
+        else:
+            return {"energy": item.energy or 0.0}
+
+    def update(self, rawItems, data):
+        self.data = data
+        removed, added = diffItems(self.rawItems, rawItems)
+        for key, count in removed.items():
+            for i in range(count):
+                if key in self.items:
+                    item = self.items[key].pop()
+                    model.addNutriInfo(self.totals, model.scaleNutriInfo(self.getTotal(item), -1.0))
+                    if len(self.items[key]) == 0:
+                        del self.items[key]
+        for key, count in added.items():
+            rawItem = json.loads(key, object_pairs_hook=odict)
+            if model.decodeTime(rawItem["time"]).date() != self.day:
+                continue
+            item = model.sectionClasses[self.section].fromJson(rawItem)
+            for i in range(count):
+                self.items.setdefault(key, []).append(item)
+                model.addNutriInfo(self.totals, self.getTotal(item))
+        if len(self.items) == 0:
+            # Don't keep the rounding errors of adding and subtracting
+            self.totals = odict()
+        self.rawItems = rawItems
+        return len(removed) + len(added)
+
+    def getItems(self):
+        return sorted((item for items in self.items.values() for item in items), key=lambda item: item.time)
+
+class Dashboard(object):
+    def __init__(self, path):
+        self.path = path
+        self.signature = None
+        self.day = None
+        self.data = None
+        self.logs = {}
+        self.lastChanges = 0
+
+    # Returns True if the data file changed (or the day is over) since the last call
+    def poll(self):
+        st = os.stat(self.path)
+        signature = (st.st_mtime_ns, st.st_size)
+        today = date.today()
+        if signature == self.signature and today == self.day:
+            return False
+
+        try:
+            with open(self.path) as f:
+                raw = json.load(f, object_pairs_hook=odict)
+        except ValueError:
+            # Most likely the file is being written right now, try again next time
+            return False
+
+        if today != self.day:
+            self.day = today
+            self.logs = {section: TodayLogs(section, today) for section in ["meals", "workout"]}
+        self.signature = signature
+        self.data = welo.DataWrapper(raw, self.path)
+        self.lastChanges = sum(logs.update(raw[section], self.data) for section, logs in self.logs.items())
+        return True
+
+    def render(self, out=sys.stdout):
+        lines = []
+        lines.append("welo watch - {} - updated {} ({} changed entries)".format(
+            self.path, datetime.now().strftime("%H:%M:%S"), self.lastChanges))
+        lines.append("")
+
+        meals = self.logs["meals"]
+        lines.append("# Meals of {}".format(self.day.strftime("%d.%m.%Y")))
+        for meal in meals.getItems():
+            total = self.data.getMealTotal(meal)
+            energy = q.Energy(total.nutriInfo["energy"]) if "energy" in total.nutriInfo else "unknown energy"
+            lines.append("{} '{}': {}, {}".format(meal.time.strftime("%H:%M"), meal.name or "meal", q.Mass(total.amount), energy))
+        if len(meals.items) == 0:
+            lines.append("You haven't eaten today yet.")
+        lines.append("")
+
+        workouts = self.logs["workout"]
+        for workout in workouts.getItems():
+            energy = q.Energy(workout.energy) if workout.energy != None else "unknown energy"
+            lines.append("{} workout '{}': {}, {}".format(workout.time.strftime("%H:%M"), workout.name, q.Duration(workout.duration), energy))
+        if len(workouts.items) > 0:
+            lines.append("")
+
+        lines.append("# Total")
+        for key, value in meals.totals.items():
+            lines.append("{}: {}".format(key, model.formatNutrient(key, value)))
+        intake = q.Energy(meals.totals.get("energy", 0.0)).kcal()
+        workoutEnergy = q.Energy(workouts.totals.get("energy", 0.0)).kcal()
+
+        # The same expenditure as in 'welo eat' (see balance.computeDays), from the latest weight instead of the whole history
+        weights = self.data.data["weight"]
+        last = model.WeightEntry.fromJson(weights[-1]) if len(weights) > 0 else None
+        bmr = self.data.getBmr(q.Mass(last.weight) if last else None, self.day)
+        activity = self.data.getActivity()
+        if bmr and activity:
+            budget = bmr * activity + workoutEnergy
+            lines.append("")
+            lines.append("Total energy expenditure: {} kcal ({} kcal/day + {} kcal of workouts)".format(
+                round(budget), round(budget - workoutEnergy), round(workoutEnergy)))
+            remaining = round(budget - intake)
+            if remaining >= 0:
+                lines.append("Remaining: {} kcal".format(remaining))
+            else:
+                lines.append("Over budget by {} kcal".format(-remaining))
+
+        if last:
+            lines.append("")
+            lines.append("Latest weight: {} ({})".format(q.Mass(last.weight), model.formatTime(last.time)))
+
+        # Clear the screen and move the cursor to the top left
+        out.write("\033[H\033[J" + "\n".join(lines) + "\n")
+        out.flush()
+
+def watch(path, interval=1.0):
+    dashboard = Dashboard(path)
+    try:
+        while True:
+            if dashboard.poll():
+                dashboard.render()
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print()
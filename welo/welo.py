@@ -1,16 +1,37 @@
 import argparse
 from collections import OrderedDict as odict
 from datetime import datetime, date, timedelta, time
+import itertools
 import json
 import os
 import re
+import shlex
+import sys
 
 import appdirs
 
 from . import quantities as q
-from . import fddb
-
-def promptNutriInfoField(name, target, key, typeClass, factor, optional):
+from . import archive
+from . import report
+from . import tags
+from . import balance
+from . import offlinedb
+from . import completion
+from . import providers
+from . import model
+from . import watch
+from . import foodstore
+from . import sync
+from . import plot
+from . import search
+from . import nutrients
+from . import forecast
+from . import resultcache
+from . import check
+
+leftoversRegex = r"^leftovers(?:\((.*?)\))?$"
+
+def promptNutriInfoField(name, target, key, factor, optional):
     while True:
         s = input(name + "> ").strip()
         if len(s) == 0:
@@ -20,23 +41,29 @@ def promptNutriInfoField(name, target, key, typeClass, factor, optional):
                 print("This property is mandatory.")
         else:
             try:
-                q = typeClass(s) * factor
-                target[key] = str(q)
+                target[key] = model.formatNutrient(key, nutrients.parse(key, s) * factor)
                 break
             except ValueError:
-                print("Could not parse as {}".format(typeClass.__name__))
+                print("Could not parse as {} ({})".format(key, nutrients.get(key).unit))
+
+# All nutrients besides the main ones are entered in a single (optional) line
+def promptOtherNutrients(target, factor):
+    while True:
+        s = input("other nutrients (e.g. 'cholesterol 46mg, vitaminC 12mg')> ").strip()
+        try:
+            for key, value in nutrients.parseList(s).items():
+                target[key] = model.formatNutrient(key, value * factor)
+            break
+        except ValueError as e:
+            print(e)
+            print("Known nutrients: {}".format(", ".join(key for key in nutrients.byKey if key not in nutrients.mainKeys)))
 
-def promptNutriInfo(name):
+def promptReference(name):
     print("Please enter the nutritional information for '{}' (per 100g)".format(name))
-    reference = input("reference amount (leave empty for 100g)> ").strip()
+    return input("reference amount (leave empty for 100g)> ").strip()
+
+def promptNutriInfo(reference):
     if len(reference) > 0:
-        if reference.startswith("http"):
-            nutriInfo = fddb.getNutriInfo(reference)
-            print("--- Downloaded nutritional information for '{}':".format(name))
-            for key in nutriInfo:
-                print("{}: {}".format(key, nutriInfo[key]))
-            print("---")
-            return nutriInfo
         reference = q.Mass(reference)
     else:
         reference = q.Mass(0.1)
@@ -44,16 +71,12 @@ def promptNutriInfo(name):
 
     data = odict()
 
-    promptNutriInfoField("energy", data, "energy", q.Energy, factor, False)
-    promptNutriInfoField("fat", data, "fat", q.Mass, factor, False)
-    promptNutriInfoField("saturated fats (of that fat)", data, "satFat", q.Mass, factor, True)
-    promptNutriInfoField("carbohydrates", data, "carbs", q.Mass, factor, False)
-    promptNutriInfoField("sugar (of those carbs)", data, "sugar", q.Mass, factor, True)
-    promptNutriInfoField("fiber (of those carbs)", data, "fiber", q.Mass, factor, True)
-    promptNutriInfoField("protein", data, "protein", q.Mass, factor, False)
-    promptNutriInfoField("sodium", data, "sodium", q.Mass, factor, True)
+    for key in nutrients.mainKeys:
+        nutrient = nutrients.byKey[key]
+        promptNutriInfoField(nutrient.label, data, key, factor, not nutrient.mandatory)
     if not "sodium" in data:
-        promptNutriInfoField("salt", data, "sodium", q.Mass, factor * 0.4, True)
+        promptNutriInfoField("salt", data, "sodium", factor * 0.4, True)
+    promptOtherNutrients(data, factor)
 
     print("--- You entered:")
     for key in data:
@@ -72,17 +95,14 @@ class NutriInfoAccumulator(object):
         for item in it:
             self += item
 
+    # nutriInfo is parsed (see model.parseNutriInfo)
     def __iadd__(self, nutriInfo):
-        for field in nutriInfo:
-            v = q.fromStr(nutriInfo[field])
-            if field in self.info:
-                self.info[field] += v
-            else:
-                self.info[field] = v
+        model.addNutriInfo(self.info, nutriInfo)
         return self
 
+    # In the order of nutrients.nutrients
     def getTotal(self):
-        return self.info
+        return nutrients.sort(self.info)
 
 def bmi(weight, height):
     return weight / (height*height)
@@ -103,16 +123,120 @@ def datetime2str(dt):
     return dt.strftime("%d.%m.%Y %H:%M")
 
 class DataWrapper(object):
+    # Without data the data file is loaded when it is first used (see the data property)
     def __init__(self, data, path):
-        self.data = data
+        self._data = data
         self.path = path
+        # The size and modification time of the data file when it was loaded or saved (see resultcache.getFileState)
+        self._fileState = None
+        self._archive = None
+        self._offlineDb = False
+        self.foodFiles = []
+        self._providers = None
+        self._sections = {}
+        self._foodStore = None
+        # Meals that were added or removed since the last save, the search index is updated when saving
+        self._indexAdded = []
+        self._indexRemoved = []
+        # Meal time -> meal, see getMealAt
+        self._mealIndex = None
+
+    # Cached results (see getCachedResult) are shown without loading the data file
+    @property
+    def data(self):
+        if self._data == None:
+            self._fileState = resultcache.getFileState(self.path)
+            with open(self.path) as f:
+                self._data = json.load(f, object_pairs_hook=odict)
+        return self._data
+
+    # The logs are converted from JSON to model objects once when they are first used
+    # and only converted back when saving
+    def getSection(self, section):
+        if section not in self._sections:
+            self._sections[section] = model.fromJson(section, self.data[section])
+        return self._sections[section]
+
+    # Converts the entries of data files of older versions (see model.version), which are then
+    # saved in the current format. Returns whether anything had to be converted.
+    def upgrade(self):
+        version = self.data.get("version", 1)
+        if version >= model.version:
+            return False
+        for section in model.sectionClasses:
+            items = self._sections[section] if section in self._sections else model.fromJson(section, self.data[section])
+            if section == "meals" and version < 3:
+                model.shareLeftovers(items)
+                self._mealIndex = None
+            if section not in self._sections:
+                self.data[section] = model.toJson(items)
+        if "archive" in self.data:
+            self.data["archive"]["until"] = model.encodeTime(self.getArchivedUntil())
+        if version < 3:
+            self.upgradeDays()
+        self.data["version"] = model.version
+        self.data.move_to_end("version", last=False)
+        return True
+
+    # Before version 3, days were stored as "%d.%m.%Y"
+    def upgradeDays(self):
+        if "tags" in self.data:
+            days = odict()
+            for day, dayTags in self.data["tags"].items():
+                key = model.encodeDay(model.decodeDay(day))
+                if key in days:
+                    # The same day may have been stored in both formats
+                    days[key].extend(tag for tag in dayTags if tag not in days[key])
+                else:
+                    days[key] = dayTags
+            self.data["tags"] = days
+        if "balance" in self.data:
+            self.data["balance"]["start"] = model.encodeDay(model.decodeDay(self.data["balance"]["start"]))
+        birthday = self.data["config"].get("birthday")
+        if birthday:
+            self.data["config"]["birthday"] = model.encodeDay(q.Time(birthday).datetime.date())
 
     def save(self):
+        self.upgrade()
+        # Data files of older versions contain the food store
+        if "nutriInfoCache" in self.data:
+            self.getFoodStore()
+
+        # Queries only extend the energy balance in memory (see balance.update), it is persisted here
+        balance.update(self)
+        # Every save is a new generation of the data file (see resultcache.ResultCache)
+        self.data["generation"] = self.data.get("generation", 0) + 1
+        data = odict((key, model.toJson(self._sections[key]) if key in self._sections else value)
+            for key, value in self.data.items())
         with open(self.path, "w") as f:
-            json.dump(self.data, f, indent=4)
+            json.dump(data, f, indent=4)
+        self._fileState = resultcache.getFileState(self.path)
+        self.flushSearchIndex()
+        if "meals" in self._sections:
+            mealTimes = (model.formatTime(meal.time) for meal in self._sections["meals"])
+        else:
+            mealTimes = (model.formatTime(model.decodeTime(meal["time"])) for meal in self.data["meals"])
+        # The food names are only written again if the food store was changed
+        foods = None
+        if (self._foodStore and self._foodStore.changed) or not os.path.isfile(completion.getCompletionPath(self.path)):
+            foods = self.getFoodStore().getNames()
+        completion.writeCompletionFile(self.path, foods, mealTimes)
+
+    # Something changed on the day of 'time': the energy balance from that day on and the hash of the day
+    # (see sync.updateDayHashes) have to be computed again
+    def invalidate(self, time):
+        balance.invalidate(self, time)
+        if "dayHashes" in self.data:
+            self.data["dayHashes"].pop(model.encodeDay(q.Time(time).datetime.date()), None)
 
     def setConfig(self, name, value):
-        self.data["config"][name] = str(value)
+        if isinstance(value, q.Time):
+            # Only the day is stored (e.g. of the birthday)
+            self.data["config"][name] = model.encodeDay(value.datetime.date())
+        else:
+            self.data["config"][name] = str(value)
+        if name in ["height", "activity", "birthday", "sex"]:
+            self.data.pop("balance", None)
 
     def getConfig(self, name):
         if name in self.data["config"]:
@@ -128,20 +252,29 @@ class DataWrapper(object):
             return None
 
     # https://en.wikipedia.org/wiki/Physical_activity_level
+    # This is the activity level without the logged workouts
     def getActivity(self):
         a = self.getConfig("activity")
-        # TODO: add workout information
         if a:
             return a.activity
         else:
             return None
 
+    # The physical activity level including logged workouts
+    def getEffectiveActivity(self, days=14):
+        lastDay = date.today()
+        totals = balance.getRange(self, lastDay - timedelta(days=days - 1), lastDay)
+        if totals["bmr"] > 0:
+            return totals["expenditure"] / totals["bmr"]
+        else:
+            return None
+
     # https://en.wikipedia.org/wiki/Basal_metabolic_rate
-    def getBmr(self):
-        w, h, s, b = self.getConfig("weight"), self.getConfig("height"), self.getConfig("sex"), self.getConfig("birthday")
+    def getBmr(self, weight=None, day=None):
+        w, h, s, b = weight or self.getConfig("weight"), self.getConfig("height"), self.getConfig("sex"), self.getConfig("birthday")
         if w and h and s and b:
             # Mifflin St Jeor Equation
-            bmr = 10 * w.kg() + 6.25 * h.cm() - 5 * b.getAge()
+            bmr = 10 * w.kg() + 6.25 * h.cm() - 5 * b.getAge(day)
             if s == q.Sex("male"):
                 bmr += 5
             else:
@@ -158,36 +291,49 @@ class DataWrapper(object):
         else:
             return None
 
+    # Returns the new entry, the previous one (or None), whether it is the lowest weight so far, the BMI and the goal weight
+    def logWeight(self, weight, time=None):
+        weights = self.getSection("weight")
+        previous = weights[-1] if len(weights) > 0 else None
+
+        entry = model.WeightEntry(model.toTime(time), weight.kg())
+        weights.append(entry)
+        self.setConfig("weight", weight)
+        self.invalidate(entry.time)
+
+        isLowest = False
+        archivedLowest = self.data.get("archive", {}).get("lowestWeight")
+        if len(weights) > 1 or archivedLowest:
+            isLowest = all(other.weight >= entry.weight for other in weights)
+            if archivedLowest and q.Mass(archivedLowest).kg() < entry.weight:
+                isLowest = False
+
+        return odict([
+            ("entry", entry),
+            ("previous", previous),
+            ("isLowest", isLowest),
+            ("bmi", self.getBmi()),
+            ("goalWeight", self.getConfig("goalWeight")),
+        ])
+
     def addWeight(self, weight, time=None):
-        if len(self.data["weight"]) > 0:
-            last = self.data["weight"][-1]
-            delta = weight - q.fromStr(last["weight"])
+        result = self.logWeight(weight, time)
+        last = result["previous"]
+        if last:
+            delta = weight - q.Mass(last.weight)
+            lastTime = model.formatTime(last.time)
             if delta.kg() > 0:
-                print("You are up {} since your last measurement on {} @ {}".format(delta, last["time"], last["weight"]))
+                print("You are up {} since your last measurement on {} @ {}".format(delta, lastTime, q.Mass(last.weight)))
             else:
-                print("You are down {} since your last measurement on {} @ {}. Nice job!".format(-delta, last["time"], last["weight"]))
-
-        self.data["weight"].append(odict([
-            ("time", str(time or q.Time())),
-            ("weight", str(weight)),
-        ]))
-
-        self.setConfig("weight", weight)
+                print("You are down {} since your last measurement on {} @ {}. Nice job!".format(-delta, lastTime, q.Mass(last.weight)))
 
-        if len(self.data["weight"]) > 1:
-            lowestWeight = weight
-            for other in self.data["weight"]:
-                v = q.fromStr(other["weight"])
-                if v < weight:
-                    lowestWeight = v
-            if lowestWeight == weight:
-                print("This is your new lowest weight!")
+        if result["isLowest"]:
+            print("This is your new lowest weight!")
 
-        height = self.getConfig("height")
-        if height:
-            print("Your BMI is:", round(self.getBmi(), 2))
+        if result["bmi"] != None:
+            print("Your BMI is:", round(result["bmi"], 2))
 
-        goalWeight = self.getConfig("goalWeight")
+        goalWeight = result["goalWeight"]
         if goalWeight:
             delta = weight - goalWeight
             if delta.kg() > 0:
@@ -200,38 +346,231 @@ class DataWrapper(object):
         self.save()
 
     def printWeight(self, num=100):
-        for weight in self.data["weight"]:
-            print("{}: {}".format(q.Time(weight["time"]), q.Mass(weight["weight"])))
+        for weight in self.getSection("weight"):
+            print("{}: {}".format(model.formatTime(weight.time), q.Mass(weight.weight)))
+
+    # Returns None if no offline food database was imported
+    def getOfflineDb(self):
+        if self._offlineDb == False:
+            self._offlineDb = offlinedb.openDb()
+        return self._offlineDb
+
+    # Only opened by commands that need the nutritional information of foods
+    def getFoodStore(self):
+        if self._foodStore == None:
+            self._foodStore = foodstore.FoodStore(foodstore.getPath(self.path))
+            if "nutriInfoCache" in self.data:
+                self._foodStore.update(self.data.pop("nutriInfoCache").items(), replace=False)
+        return self._foodStore
+
+    # The number of meals including the archived ones
+    def getMealCount(self):
+        count = len(self._sections["meals"]) if "meals" in self._sections else len(self.data["meals"])
+        if "archive" in self.data:
+            count += sum(segment.get("meals", 0) for segment in self.getArchive().getManifest()["segments"])
+        return count
+
+    # Returns the result of compute() for key (a list, e.g. the command and its time frame), which is only
+    # computed if it was not cached for the current generation of the data file
+    def getCachedResult(self, key, compute):
+        cache = resultcache.ResultCache(resultcache.getPath(self.path))
+        key = json.dumps(key)
+        # Data that was not loaded from the data file is not cached
+        fileState = self._fileState if self._data != None else resultcache.getFileState(self.path)
+        generation = cache.getGeneration(fileState) if fileState else None
+        result = cache.get(key, generation) if generation != None else None
+        if result == None:
+            result = compute()
+            if self._fileState:
+                generation = self.data.get("generation", 0)
+                cache.setGeneration(self._fileState, generation)
+                cache.set(key, generation, resultcache.encode(result, self.getFoodItems, self.getMealTotal))
+        cache.close()
+        return result
+
+    # The index is built on the first search and rebuilt whenever the meals were changed without updating it
+    def getSearchIndex(self, rebuild=False):
+        index = search.SearchIndex(search.getPath(self.path))
+        if rebuild or index.getMealCount() != self.getMealCount():
+            print("Building the search index..")
+            index.clear()
+            index.addMeals(self.getItems("meals", datetime.min, datetime.max), self.getMealAt)
+            index.setMealCount(self.getMealCount())
+        return index
+
+    # Only updates an existing index that is up to date (see getSearchIndex)
+    def updateSearchIndex(self, added=[], removed=[]):
+        path = search.getPath(self.path)
+        if not os.path.isfile(path):
+            return
+        index = search.SearchIndex(path)
+        if index.getMealCount() == self.getMealCount() - len(added) + len(removed):
+            meals = self.getSection("meals")
+            # Meals that were added and removed again before saving are not indexed
+            added = [meal for meal in added if any(meal is other for other in meals)]
+            for time in set(meal.time for meal in removed):
+                index.removeTime(time)
+                # Other meals at the same time were removed too
+                index.addMeals((meal for meal in meals if meal.time == time and meal not in added), self.getMealAt)
+            index.addMeals(added, self.getMealAt)
+            index.setMealCount(self.getMealCount())
+        index.close()
+
+    # Changes that are not saved yet are indexed before searching as well.
+    # If they are never saved, the meal count of the index is off and it is rebuilt on the next search.
+    def flushSearchIndex(self):
+        if len(self._indexAdded) > 0 or len(self._indexRemoved) > 0:
+            self.updateSearchIndex(self._indexAdded, self._indexRemoved)
+            self._indexAdded, self._indexRemoved = [], []
+
+    # Returns (number of matching meals, list of (time, summary) of the last 'last' of them), see search.SearchIndex
+    def findMeals(self, terms, startTime=None, endTime=None, last=10):
+        terms = [term for term in (search.parseTerm(s) for s in terms) if len(term) > 0]
+        if len(terms) == 0:
+            raise model.WeloError("Please enter something to search for.")
+        self.flushSearchIndex()
+        index = self.getSearchIndex()
+        try:
+            return index.search(terms, startTime, endTime, last)
+        finally:
+            index.close()
+
+    def searchMeals(self, terms, start=None, end=None, last=10, rebuild=False):
+        if rebuild:
+            self.getSearchIndex(rebuild).close()
+            if len(terms) == 0:
+                return
+        count, results = self.findMeals(terms, start.datetime if start else None, end.datetime if end else None, last)
+        if count == 0:
+            print("No meals found.")
+            return
+        print("Found {} meals{}:".format(count, " (showing the last {})".format(len(results)) if count > len(results) else ""))
+        for time, summary in results:
+            print("{} {}".format(model.formatTime(time), summary))
+
+    def getArchive(self):
+        if self._archive == None:
+            self._archive = archive.Archive(self.path + ".archive")
+        return self._archive
+
+    def getArchivedUntil(self):
+        if "archive" in self.data:
+            return model.decodeTime(self.data["archive"]["until"])
+        else:
+            return None
 
-    def getLogs(self, startTime, items):
-        endTime = startTime + timedelta(hours=24)
-        filtered = (item for item in items if q.Time(item["time"]).inPeriod(startTime, endTime))
-        for item in sorted(filtered, key=lambda item: q.Time(item["time"]).datetime):
+    # Only ranges that reach back before the archive boundary have to open the archive
+    def getItems(self, section, startTime, endTime):
+        archivedUntil = self.getArchivedUntil()
+        if archivedUntil and startTime < archivedUntil:
+            return itertools.chain(self.getArchive().getItems(section, startTime, endTime), self.getSection(section))
+        else:
+            return self.getSection(section)
+
+    def getLogs(self, startTime, section, endTime=None):
+        endTime = endTime or startTime + timedelta(hours=24)
+        items = self.getItems(section, startTime, endTime)
+        filtered = (item for item in items if item.time > startTime and item.time < endTime)
+        for item in sorted(filtered, key=lambda item: item.time):
             yield item
 
-    def getMeals(self, startTime):
-        return self.getLogs(startTime, self.data["meals"])
+    def getMeals(self, startTime, endTime=None):
+        return self.getLogs(startTime, "meals", endTime)
+
+    # The first meal at exactly that time, including archived meals. Leftovers refer to meals by their time (see model.Leftovers).
+    def getMealAt(self, time):
+        if self._mealIndex == None:
+            self._mealIndex = {}
+            for meal in self.getSection("meals"):
+                self._mealIndex.setdefault(meal.time, meal)
+        if time in self._mealIndex:
+            return self._mealIndex[time]
+        archivedUntil = self.getArchivedUntil()
+        if archivedUntil and time < archivedUntil:
+            for meal in self.getArchive().getItems("meals", time, time + timedelta(seconds=1)):
+                if meal.time == time:
+                    return meal
+        return None
+
+    # The food items of a meal with leftovers resolved
+    def getFoodItems(self, meal):
+        return meal.getFoodItems(self.getMealAt)
 
+    # Leftovers of a meal are a reference to it and the leftovers it contains itself (with the factors multiplied),
+    # so chains of leftovers of leftovers always refer to the meals the food was originally logged with
+    def getLeftovers(self, source, factor):
+        if self.getMealAt(source.time) is not source:
+            # Another meal at the same time would be referred to instead
+            return self.multiplyFoodItems(self.getFoodItems(source), factor)
+        ret = []
+        reference = None
+        for item in source.food:
+            if isinstance(item, model.Leftovers):
+                ret.append(item.scaled(factor))
+            elif reference == None:
+                reference = model.Leftovers(source.time, factor)
+                ret.append(reference)
+        return ret
+
+    # Leftovers that refer to a meal that is about to be removed or changed get copies of its food items instead
+    def unshareLeftovers(self, source):
+        if self.getMealAt(source.time) is not source:
+            return
+        for meal in self.getSection("meals"):
+            if any(isinstance(item, model.Leftovers) and item.source == source.time for item in meal.food):
+                # The copies become food items of this meal, which leftovers of it must not include
+                self.unshareLeftovers(meal)
+                food = []
+                for item in meal.food:
+                    if isinstance(item, model.Leftovers) and item.source == source.time:
+                        food.extend(item.getFoodItems(self.getMealAt))
+                    else:
+                        food.append(item)
+                meal.food = food
+                self.invalidate(meal.time)
+
+    # The total is stored with the meal just like a food item (amount and nutriInfo),
+    # so that showing a meal does not have to sum up all of its food items again.
+    def computeMealTotal(self, meal):
+        return meal.computeTotal(self.getMealAt)
+
+    def getMealTotal(self, meal):
+        if meal.total:
+            return meal.total
+        else:
+            return self.computeMealTotal(meal)
+
+    def updateMealTotal(self, meal):
+        meal.total = self.computeMealTotal(meal)
+
+    # Portions are relative to the sum of the food items, since the stored total is rounded (e.g. to 100g above 1kg)
     def totalMealWeight(self, meal):
-        return sum((q.fromStr(item["amount"]) for item in meal["food"]), q.Mass(0))
+        return q.Mass(sum(item.amount for item in self.getFoodItems(meal)))
 
     def printMeal(self, meal):
-        name = meal.get("name", "meal")
-        print("# Eat '{}' @ {}".format(name, meal["time"]))
-        print(" + ".join('{} "{}"'.format(item["amount"], item["name"]) for item in meal["food"]))
-        if "notes" in meal:
-            print("Notes:", meal["notes"])
-        print("Total weight:", self.totalMealWeight(meal))
-        totalNutriInfo = NutriInfoAccumulator(item["nutriInfo"] for item in meal["food"]).getTotal()
-        for field in totalNutriInfo:
-            print("{}: {}".format(field, totalNutriInfo[field]))
+        print("# Eat '{}' @ {}".format(meal.name or "meal", model.formatTime(meal.time)))
+        print(" + ".join('{} "{}"'.format(q.Mass(item.amount), item.name) for item in self.getFoodItems(meal)))
+        if meal.notes:
+            print("Notes:", meal.notes)
+        total = self.getMealTotal(meal)
+        print("Total weight:", q.Mass(total.amount))
+        for field, value in total.nutriInfo.items():
+            print("{}: {}".format(field, model.formatNutrient(field, value)))
         print()
 
     def getMealByTime(self, time):
+        meals = self.getSection("meals")
         if time == None:
-            return -1, self.data["meals"][-1]
-        for i, meal in enumerate(self.data["meals"]):
-            if meal["time"] == str(time):
+            if len(meals) == 0:
+                return None, None
+            return -1, meals[-1]
+        time = q.Time(time).datetime
+        for i, meal in enumerate(meals):
+            if meal.time == time:
+                return i, meal
+        # Times entered by the user (e.g. for leftovers) only have minute resolution
+        for i, meal in enumerate(meals):
+            if meal.time.replace(second=0) == time:
                 return i, meal
         return None, None
 
@@ -249,116 +588,281 @@ class DataWrapper(object):
 
     @staticmethod
     def multiplyFoodItems(foodItems, factor):
-        ret = []
-        for item in foodItems:
-            _item = odict()
-            _item["name"] = item["name"]
-            _item["amount"] = str(q.fromStr(item["amount"]) * factor)
-            _item["nutriInfo"] = odict()
-            for field in item["nutriInfo"]:
-                _item["nutriInfo"][field] = str(q.fromStr(item["nutriInfo"][field]) * factor)
-            ret.append(_item)
-        return ret
+        return [item.scaled(factor) for item in foodItems]
+
+    def getProviders(self):
+        if self._providers == None:
+            self._providers = providers.getProviders(self.foodFiles)
+        return self._providers
+
+    def getNutriInfo(self, name):
+        return self.getFoodStore().get(name)
+
+    def getUnknownFoods(self, food):
+        unknown = []
+        for name in food[1::2]:
+            if not re.match(leftoversRegex, name) and name not in unknown and self.getNutriInfo(name) == None:
+                unknown.append(name)
+        return unknown
+
+    # Searches all providers for all unknown foods at once and returns the foods that are still unknown
+    def resolveUnknownFoods(self, names):
+        results = providers.searchAll(self.getProviders(), names)
+        remaining = []
+        for name in names:
+            if results.get(name):
+                nutriInfo, providerNames = results[name]
+                print("Using nutritional information for '{}' from the {}.".format(name, " and ".join(providerNames)))
+                self.getFoodStore().set(name, nutriInfo)
+            else:
+                remaining.append(name)
+        return remaining
+
+    # Links and files entered by the user are only looked up (concurrently) after all foods were prompted for
+    def promptUnknownFoods(self, names):
+        if len(names) == 0:
+            return
+
+        print("Some foods have unknown nutritional information. Please enter it below.")
+        print("You may leave the fields empty if you don't know or care.")
+        print("You may also paste a link to a fddb.info or openfoodfacts.org site, a barcode or the path to a JSON file in the first prompt.\n")
+
+        references = odict()
+        for name in names:
+            while True:
+                reference = promptReference(name)
+                if providers.canLookup(self.getProviders(), reference):
+                    references[name] = reference
+                    break
+                try:
+                    self.getFoodStore().set(name, promptNutriInfo(reference))
+                    break
+                except ValueError:
+                    print("'{}' is neither a reference amount nor something that can be looked up.".format(reference))
+
+        results = providers.lookupAll(self.getProviders(), references)
+        for name, reference in references.items():
+            if results.get(name):
+                nutriInfo, providerNames = results[name]
+                print("--- Downloaded nutritional information for '{}' from {}:".format(name, providerNames[0]))
+                for key in nutriInfo:
+                    print("{}: {}".format(key, nutriInfo[key]))
+                print("---")
+                self.getFoodStore().set(name, nutriInfo)
+            else:
+                print("Could not get the nutritional information for '{}' from '{}'. Please enter it manually.".format(name, reference))
+                self.getFoodStore().set(name, promptNutriInfo(""))
+
+    # All foods (except leftovers) need to be known (see getUnknownFoods)
+    def createMeal(self, name, food, time, notes, portion):
+        if len(food) % 2 != 0:
+            raise model.WeloError("Food has to be a list of weight and food name pairs!")
+        unknown = self.getUnknownFoods(food)
+        if len(unknown) > 0:
+            raise model.WeloError("Unknown nutritional information for {}.".format(", ".join("'{}'".format(name) for name in unknown)))
 
-    def eat(self, name, food, time, notes, dry, portion):
         portionFactor = 1.0
         if portion:
             totalWeight = sum((q.Mass(w) for w in food[::2]), q.Mass(0))
             portionFactor = self.getPortionFactor(portion, totalWeight)
 
-        meal = odict()
-        meal["time"] = str(time or q.Time())
-        if name:
-            meal["name"] = name
-        meal["food"] = []
-        if notes:
-            meal["notes"] = notes
+        meal = model.Meal(model.toTime(time), name or None, [], notes or None)
 
-        promptIntro = False
         for i in range(0, len(food), 2):
             weight = food[i+0]
             name = food[i+1]
 
-            leftoversMatch = re.match(r"^leftovers(?:\((.*?)\))?$", name)
+            leftoversMatch = re.match(leftoversRegex, name)
             if leftoversMatch:
                 leftoversTime = leftoversMatch.group(1)
-                i, leftoverMeal = self.getMealByTime(leftoversTime)
-                if i == None:
-                    quit("No meal found for that time!")
+                index, leftoverMeal = self.getMealByTime(leftoversTime)
+                if index == None:
+                    raise model.WeloError("No meal found for that time!")
 
                 factor = portionFactor
-                factor *= self.getPortionFactor(food[0], self.totalMealWeight(leftoverMeal))
-                meal["food"].extend(self.multiplyFoodItems(leftoverMeal["food"], factor))
+                factor *= self.getPortionFactor(weight, self.totalMealWeight(leftoverMeal))
+                meal.food.extend(self.getLeftovers(leftoverMeal, factor))
             else:
-                if name in self.data["nutriInfoCache"]:
-                    nutriInfo = self.data["nutriInfoCache"][name]
-                else:
-                    if not promptIntro:
-                        print("Some foods have unknown nutritional information. Please enter it below.")
-                        print("You may leave the fields empty if you don't know or care.")
-                        print("You may also paste a link to a fddb.info site in the first prompt.\n")
-                        promptIntro = True
-                    nutriInfo = promptNutriInfo(name)
-                    self.data["nutriInfoCache"][name] = nutriInfo
-
-                weight = q.Mass(weight)
-                factor = weight.g() / 100
-                totalNutriInfo = odict()
-                for field in nutriInfo:
-                    totalNutriInfo[field] = str(q.fromStr(nutriInfo[field]) * factor * portionFactor)
-
-                meal["food"].append(odict([
-                    ("name", name),
-                    ("amount", str(weight * portionFactor)),
-                    ("nutriInfo", totalNutriInfo)
-                ]))
+                # The cached nutritional information is per 100g
+                nutriInfo = model.parseNutriInfo(self.getNutriInfo(name))
+                amount = q.Mass(weight).kg() * portionFactor
+                meal.food.append(model.FoodItem(name, amount, model.scaleNutriInfo(nutriInfo, amount * 10)))
+
+        self.updateMealTotal(meal)
+        return meal
+
+    def logMeal(self, meal):
+        self.getSection("meals").append(meal)
+        self._mealIndex = None
+        self.invalidate(meal.time)
+        self._indexAdded.append(meal)
+
+    # Returns the removed meal
+    def removeMeal(self, time=None):
+        i, meal = self.getMealByTime(time)
+        if i == None:
+            raise model.WeloError("No meal found for that time!")
+        self.unshareLeftovers(meal)
+        self.getSection("meals").pop(i)
+        self._mealIndex = None
+        self.invalidate(meal.time)
+        self._indexRemoved.append(meal)
+        return meal
+
+    # Returns the meal before and after resizing it. If dry is True, the logged meal is not changed.
+    def scaleMeal(self, portion, time=None, dry=False):
+        i, meal = self.getMealByTime(time)
+        if i == None:
+            raise model.WeloError("No meal found for that time!")
+        factor = self.getPortionFactor(portion, self.totalMealWeight(meal))
+        resized = model.Meal(meal.time, meal.name, self.multiplyFoodItems(meal.food, factor), meal.notes)
+        self.updateMealTotal(resized)
+        if not dry:
+            self.unshareLeftovers(meal)
+            self.getSection("meals")[i] = resized
+            self._mealIndex = None
+            self.invalidate(meal.time)
+            # The amounts are part of the search results
+            self._indexAdded.append(resized)
+            self._indexRemoved.append(meal)
+        return meal, resized
+
+    def eat(self, name, food, time, notes, dry, portion):
+        self.promptUnknownFoods(self.resolveUnknownFoods(self.getUnknownFoods(food)))
+        try:
+            meal = self.createMeal(name, food, time, notes, portion)
+        except ValueError as e:
+            raise model.WeloError(str(e))
 
         self.printMeal(meal)
 
         if not dry:
-            self.data["meals"].append(meal)
+            self.logMeal(meal)
 
         self.save()
 
+    # Every line of the batch has the same arguments as 'welo eat' (e.g. '--time "17.05.2018 13:00" 500g pasta').
+    # Unknown foods of all meals are prompted for at once (if possible) before any meal is created.
+    def eatBatch(self, batch, parseLine, dry, skipUnknown):
+        if batch == "-":
+            lines = sys.stdin.read().splitlines()
+        else:
+            with open(batch) as f:
+                lines = f.read().splitlines()
+
+        entries = []
+        unknownFoods = odict()
+        for lineNumber, line in enumerate(lines, 1):
+            try:
+                words = shlex.split(line, comments=True)
+                if len(words) == 0:
+                    continue
+                args = parseLine(words)
+            except ValueError as e:
+                raise model.WeloError("Line {}: {}".format(lineNumber, e))
+            if len(args.food) == 0:
+                raise model.WeloError("Line {}: No food given!".format(lineNumber))
+            entries.append((lineNumber, args))
+            for name in self.getUnknownFoods(args.food):
+                unknownFoods.setdefault(name, []).append(lineNumber)
+
+        remaining = self.resolveUnknownFoods(list(unknownFoods.keys()))
+        unknownFoods = odict((name, lineNumbers) for name, lineNumbers in unknownFoods.items() if name in remaining)
+        if len(unknownFoods) > 0:
+            print("Unknown foods:")
+            for name, lineNumbers in unknownFoods.items():
+                print("'{}' ({} {})".format(name, "line" if len(lineNumbers) == 1 else "lines", ", ".join(str(n) for n in lineNumbers)))
+            print()
+            if skipUnknown:
+                print("Meals containing unknown foods will be skipped.\n")
+            elif batch != "-" and sys.stdin.isatty():
+                self.promptUnknownFoods(list(unknownFoods.keys()))
+                unknownFoods = odict()
+            else:
+                raise model.WeloError("Nothing was saved. Use --skipunknown to skip these meals or pass a file to enter their nutritional information.")
+
+        count = 0
+        for lineNumber, args in entries:
+            if any(name in unknownFoods for name in args.food[1::2]):
+                continue
+            try:
+                meal = self.createMeal(args.name, args.food, args.time, args.notes, args.portion)
+            except (ValueError, model.WeloError) as e:
+                raise model.WeloError("Line {}: {}".format(lineNumber, e))
+            total = meal.total
+            energy = q.Energy(total.nutriInfo["energy"]) if "energy" in total.nutriInfo else "unknown energy"
+            print("# Eat '{}' @ {}: {}, {}".format(meal.name or "meal", model.formatTime(meal.time), q.Mass(total.amount), energy))
+            # Leftovers in later lines refer to the meals of earlier lines, so they are logged even for a dry run
+            self.logMeal(meal)
+            count += 1
+
+        print("\n{} {} meals.".format("Checked" if dry else "Logged", count))
+        if not dry:
+            self.save()
+
     def eatUndo(self, time=None):
-        i, meal = self.getMealByTime(time)
-        self.data["meals"].pop(i)
+        self.removeMeal(time)
         self.save()
 
     def resizeMeal(self, newWeight, dry, time):
-        i, meal = self.getMealByTime(time)
+        meal, resized = self.scaleMeal(newWeight, time, dry)
 
         print("Before resizing:")
         self.printMeal(meal)
-
-        factor = self.getPortionFactor(newWeight, self.totalMealWeight(meal))
-        meal["food"] = self.multiplyFoodItems(meal["food"], factor)
-        self.printMeal(meal)
+        self.printMeal(resized)
 
         if not dry:
             self.save()
 
-    def printMealTotals(self, meals, printDeficit=True):
-        totalNutriInfo = NutriInfoAccumulator()
-        for meal in meals:
-            totalNutriInfo.add(food["nutriInfo"] for food in meal["food"])
-
+    # Returns the summed up nutritional information (SI units) of the meals, the intake and the expenditure (kcal)
+    # of the days from startTime to endTime (including workouts), the number of days and the deficit (kcal, negative for a surplus)
+    def getMealTotals(self, meals, startTime, endTime):
+        nutriInfo = NutriInfoAccumulator(self.getMealTotal(meal).nutriInfo for meal in meals).getTotal()
+        firstDay, lastDay = startTime.date(), (endTime - timedelta(minutes=1)).date()
+        totals = balance.getRange(self, firstDay, lastDay)
+        intake = q.Energy(nutriInfo["energy"]).kcal() if "energy" in nutriInfo else 0
+        expenditure = round(totals["expenditure"])
+        return odict([
+            ("nutriInfo", nutriInfo),
+            ("intake", intake),
+            ("expenditure", expenditure),
+            ("days", totals["days"]),
+            ("deficit", round(expenditure - intake) if expenditure else None),
+        ])
+
+    # totals are the result of getMealTotals
+    def printTotals(self, totals, printDeficit=True):
         print("# Total")
-        totalNutriInfo = totalNutriInfo.getTotal()
-        for key in totalNutriInfo:
-            print("{}: {}".format(key, totalNutriInfo[key]))
+        for key, value in totals["nutriInfo"].items():
+            print("{}: {}".format(key, model.formatNutrient(key, value)))
 
-        totalEnergyExpenditure = self.getTotalEnergyExpenditure()
-        kcalTotal = totalNutriInfo["energy"].kcal()
+        # Workouts of these days are included in the expenditure
+        totalEnergyExpenditure = totals["expenditure"]
         if printDeficit and totalEnergyExpenditure:
-            deficit = round(totalEnergyExpenditure - kcalTotal)
+            if totals["days"] > 1:
+                expenditureStr = "{} kcal over {} days".format(totalEnergyExpenditure, totals["days"])
+            else:
+                expenditureStr = "{} kcal/day".format(totalEnergyExpenditure)
+            deficit = totals["deficit"]
             print()
             if deficit > 0:
-                print("With your total energy expenditure being {} kcal/day, you are currently at a calorie deficit of {} kcal".format(
-                    totalEnergyExpenditure, deficit))
+                print("With your total energy expenditure being {}, you are currently at a calorie deficit of {} kcal".format(
+                    expenditureStr, deficit))
             else:
-                print("With your total energy expenditure being {} kcal/day, you are currently at a calorie surplus of {} kcal".format(
-                    totalEnergyExpenditure, -deficit))
+                print("With your total energy expenditure being {}, you are currently at a calorie surplus of {} kcal".format(
+                    expenditureStr, -deficit))
+
+    # Returns the meals of the 24h from startTime, their totals (see getMealTotals) and the time of the last meal
+    # if there are none
+    def getEatInfo(self, startTime):
+        endTime = startTime + timedelta(hours=24)
+        meals = list(self.getMeals(startTime, endTime))
+        lastMeals = self.getSection("meals")[-1:] if len(meals) == 0 else []
+        return odict([
+            ("meals", meals),
+            ("totals", self.getMealTotals(meals, startTime, endTime) if len(meals) > 0 else None),
+            ("lastMealTime", lastMeals[0].time if len(lastMeals) > 0 else None),
+        ])
 
     def eatInfo(self, startTime=None):
         if startTime:
@@ -366,66 +870,83 @@ class DataWrapper(object):
         else:
             startTime = datetime.combine(date.today(), time(0, 0))
 
-        meals = list(self.getMeals(startTime))
-
-        if len(meals) > 0:
+        info = self.getCachedResult(["eat", model.encodeTime(startTime)], lambda: self.getEatInfo(startTime))
+        if len(info["meals"]) > 0:
             print("Your meals since {}:\n".format(datetime2str(startTime)))
-            for meal in meals:
+            for meal in info["meals"]:
                 self.printMeal(meal)
-            self.printMealTotals(meals)
-        elif len(self.data["meals"]) > 0:
+            self.printTotals(info["totals"])
+        elif info["lastMealTime"]:
             print("You haven't eaten today yet.")
-            timeDelta = datetime.now() - q.Time(self.data["meals"][-1]["time"]).datetime
+            timeDelta = datetime.now() - info["lastMealTime"]
             print("Your last meal was {} ago.".format(timedeltaStr(timeDelta)))
 
-    def nutriInfo(self, foodItem):
+    # Returns the nutritional information (per 100g) of a food and where it was found ("foods" for the food store,
+    # "offline" for the offline food database or None) and otherwise the closest matches in both
+    def lookupFood(self, foodItem):
         foodItem = foodItem.strip().lower()
-        if foodItem in self.data["nutriInfoCache"]:
-            print("Nutritional information for 100g of '{}':".format(foodItem))
-            for field, val in self.data["nutriInfoCache"][foodItem].items():
-                print("{}: {}".format(field, val))
+        result = odict([("name", foodItem), ("source", None), ("nutriInfo", None), ("matches", []), ("offlineMatches", [])])
+        offlineDb = self.getOfflineDb()
+        nutriInfo = self.getNutriInfo(foodItem)
+        if nutriInfo:
+            result["source"], result["nutriInfo"] = "foods", nutriInfo
+        elif offlineDb and offlineDb.get(foodItem):
+            result["source"], result["nutriInfo"] = "offline", offlineDb.get(foodItem)
         else:
             # Find best matches
-            print("No exact matches found.")
-            print("Closest matches:")
-            match = {item: foodItemNameMatchScore(foodItem, item) for item in self.data["nutriInfoCache"].keys()}
-            displayMatches = []
+            match = {item: foodItemNameMatchScore(foodItem, item) for item in self.getFoodStore().getNames()}
             minMatch = max(2, len(foodItem) // 2)
             for item in sorted(match.keys(), key=lambda x: match[x], reverse=True):
                 if match[item] >= minMatch:
-                    displayMatches.append(item)
-                    if len(displayMatches) >= 5:
+                    result["matches"].append(item)
+                    if len(result["matches"]) >= 5:
                         break
-            for item in displayMatches:
+            if offlineDb:
+                result["offlineMatches"] = offlineDb.search(foodItem)
+        return result
+
+    def nutriInfo(self, foodItem):
+        result = self.lookupFood(foodItem)
+        if result["source"]:
+            print("Nutritional information for 100g of '{}'{}:".format(result["name"],
+                " (offline food database)" if result["source"] == "offline" else ""))
+            for field, val in result["nutriInfo"].items():
+                print("{}: {}".format(field, val))
+        else:
+            print("No exact matches found.")
+            print("Closest matches:")
+            for item in result["matches"]:
                 print(item)
 
+            if len(result["offlineMatches"]) > 0:
+                print()
+                print("Closest matches in the offline food database:")
+                for name, brand in result["offlineMatches"]:
+                    print("{} ({})".format(name, brand) if brand else name)
+
     def printWorkout(self, workout):
-        print("# Workout '{}' @ {}".format(workout["name"], workout["time"]))
-        print("Duration:", workout["duration"])
-        if "energy" in workout:
-            print("Energy:", workout["energy"], "Power:",
-                round(q.Energy(workout["energy"]).kcal() / q.Duration(workout["duration"]).h(), 1), "kcal/h")
-        if "notes" in workout:
-            print("Notes:", workout["notes"])
+        print("# Workout '{}' @ {}".format(workout.name, model.formatTime(workout.time)))
+        duration = q.Duration(workout.duration)
+        print("Duration:", duration)
+        if workout.energy != None:
+            energy = q.Energy(workout.energy)
+            print("Energy:", energy, "Power:", round(energy.kcal() / duration.h(), 1), "kcal/h")
+        if workout.notes:
+            print("Notes:", workout.notes)
         print()
 
+    def logWorkout(self, name, duration, energy=None, time=None, notes=None):
+        workout = model.Workout(model.toTime(time), name, duration.seconds, energy.joules if energy else None, notes or None)
+        self.getSection("workout").append(workout)
+        self.invalidate(workout.time)
+        return workout
+
     def addWorkout(self, name, duration, energy=None, time=None, notes=None):
-        workout = odict()
-        workout["time"] = str(time or q.Time())
-        workout["name"] = name
-        workout["duration"] = str(duration)
-        if energy:
-            workout["energy"] = str(energy)
-        if notes:
-            workout["notes"] = notes
-
-        self.printWorkout(workout)
-
-        self.data["workout"].append(workout)
+        self.printWorkout(self.logWorkout(name, duration, energy, time, notes))
         self.save()
 
-    def getWorkouts(self, startTime):
-        return self.getLogs(startTime, self.data["workout"])
+    def getWorkouts(self, startTime, endTime=None):
+        return self.getLogs(startTime, "workout", endTime)
 
     def workoutInfo(self, startTime=None):
         if startTime:
@@ -433,8 +954,7 @@ class DataWrapper(object):
         else:
             startTime = datetime.combine(date.today(), time(0, 0))
 
-        workouts = list(self.getWorkouts(startTime))
-
+        workouts = self.getCachedResult(["workout", model.encodeTime(startTime)], lambda: list(self.getWorkouts(startTime)))
         if len(workouts) > 0:
             print("Your workouts since {}:\n".format(datetime2str(startTime)))
             for workout in workouts:
@@ -442,32 +962,231 @@ class DataWrapper(object):
         else:
             print("You did not work out today.")
 
+    # Returns all meals, workouts and weights from startTime to endTime as a list of {"type", "data"} sorted by time
+    # and the totals of the meals (see getMealTotals) or None if there are none
+    def getSummary(self, startTime, endTime):
+        meals = list(self.getMeals(startTime, endTime))
+        workouts = list(self.getWorkouts(startTime, endTime))
+        weights = list(self.getLogs(startTime, "weight", endTime))
+
+        logs = []
+        logs.extend(map(lambda x: {'type': 'meal', 'data': x}, meals))
+        logs.extend(map(lambda x: {'type': 'workout', 'data': x}, workouts))
+        logs.extend(map(lambda x: {'type': 'weight', 'data': x}, weights))
+
+        return odict([
+            ("logs", sorted(logs, key=lambda x: x["data"].time)),
+            ("totals", self.getMealTotals(meals, startTime, endTime) if len(meals) > 0 else None),
+        ])
+
     def printSummary(self, startTime, endTime=None):
         startTime = startTime.datetime
         if endTime == None:
             endTime = startTime + timedelta(hours=24)
+        else:
+            endTime = endTime.datetime
 
         print("Summary from {} to {}".format(datetime2str(startTime), datetime2str(endTime)))
 
-        meals = list(self.getMeals(startTime))
-        workouts = list(self.getWorkouts(startTime))
-        weights = list(self.getLogs(startTime, self.data["weight"]))
-
-        logs = []
-        logs.extend(map(lambda x: {'type': 'meal', 'data': x}, meals))
-        logs.extend(map(lambda x: {'type': 'workout', 'data': x}, workouts))
-        logs.extend(map(lambda x: {'type': 'weight', 'data': x}, weights))
-
-        for log in sorted(logs, key=lambda x: q.Time(x["data"]["time"]).datetime):
+        summary = self.getCachedResult(["summary", model.encodeTime(startTime), model.encodeTime(endTime)],
+            lambda: self.getSummary(startTime, endTime))
+        for log in summary["logs"]:
             if log["type"] == "meal":
                 self.printMeal(log["data"])
             elif log["type"] == "workout":
                 self.printWorkout(log["data"])
             elif log["type"] == "weight":
-                print("# Weight @ {}: {}\n".format(log["data"]["time"], log["data"]["weight"]))
+                print("# Weight @ {}: {}\n".format(model.formatTime(log["data"].time), q.Mass(log["data"].weight)))
 
-        if len(meals) > 0:
-            self.printMealTotals(meals)
+        if summary["totals"]:
+            self.printTotals(summary["totals"])
+
+    def checkMealTotals(self, rebuild):
+        meals = self.getSection("meals")
+        mismatches = 0
+        for meal in meals:
+            total = self.computeMealTotal(meal)
+            # Everything is stored rounded, so the sum of the stored food items may be off by a little
+            if not meal.total or not model.totalMatches(meal.total, total, len(self.getFoodItems(meal))):
+                mismatches += 1
+                if meal.total:
+                    print("Meal @ {} has an outdated total.".format(model.formatTime(meal.time)))
+                else:
+                    print("Meal @ {} has no total.".format(model.formatTime(meal.time)))
+                if rebuild:
+                    meal.total = total
+                    self.invalidate(meal.time)
+
+        print("Checked {} meals, {} totals are missing or outdated.".format(len(meals), mismatches))
+        if rebuild and mismatches > 0:
+            print("Rebuilt {} meal totals.".format(mismatches))
+            self.save()
+
+    def archiveLogs(self, days=None, compression=None):
+        archiveInfo = self.data.get("archive", odict())
+        if days == None:
+            days = archiveInfo.get("days", 90)
+        compression = compression or archiveInfo.get("compression", "gzip")
+
+        # Only archive whole months, so every period usually ends up in a single segment
+        cutoff = datetime.combine(date.today(), time(0, 0)) - timedelta(days=days)
+        cutoff = archive.monthStart(cutoff)
+
+        items = odict()
+        for section in archive.sections:
+            items[section] = [item for item in self.getSection(section) if item.time < cutoff]
+            self._sections[section] = [item for item in self.getSection(section) if item.time >= cutoff]
+        self._mealIndex = None
+        # Archived days are not synced anymore
+        if "dayHashes" in self.data:
+            cutoffDay = model.encodeDay(cutoff.date())
+            self.data["dayHashes"] = odict((day, h) for day, h in self.data["dayHashes"].items() if day >= cutoffDay)
+
+        if sum(len(sectionItems) for sectionItems in items.values()) == 0:
+            print("There is nothing older than {} to archive.".format(datetime2str(cutoff)))
+            return
+
+        self.getArchive().addItems(items, compression)
+
+        lowestWeight = archiveInfo.get("lowestWeight")
+        for item in items["weight"]:
+            if lowestWeight == None or item.weight < q.Mass(lowestWeight).kg():
+                lowestWeight = str(q.Mass(item.weight))
+        archivedUntil = self.getArchivedUntil()
+        # The energy balance of the days after the archive starts with the last archived weight (see balance.getWeights)
+        if len(items["weight"]) > 0:
+            lastWeight = max(items["weight"], key=lambda item: item.time)
+            if not archivedUntil or lastWeight.time >= archivedUntil or "lastWeight" not in archiveInfo:
+                archiveInfo["lastWeight"] = str(q.Mass(lastWeight.weight))
+
+        archiveInfo["until"] = model.encodeTime(max(cutoff, archivedUntil) if archivedUntil else cutoff)
+        archiveInfo["days"] = days
+        archiveInfo["compression"] = compression
+        if lowestWeight:
+            archiveInfo["lowestWeight"] = lowestWeight
+        self.data["archive"] = archiveInfo
+        self.save()
+
+        print("Archived {} weights, {} workouts and {} meals older than {}.".format(
+            len(items["weight"]), len(items["workout"]), len(items["meals"]), datetime2str(cutoff)))
+
+    def migrate(self):
+        version = self.data.get("version", 1)
+        if self.upgrade():
+            self.save()
+            print("Converted '{}' from version {} to version {}.".format(self.path, version, model.version))
+            if version < 3:
+                count = sum(isinstance(item, model.Leftovers) for meal in self.getSection("meals") for item in meal.food)
+                print("{} leftovers that were stored as copies refer to their meals now.".format(count))
+        else:
+            print("'{}' already is version {}.".format(self.path, model.version))
+        if "archive" in self.data:
+            print("Converted {} archive segments.".format(self.getArchive().migrate()))
+
+    # ISO 8601 date -> list of tags, the days of data files of older versions are converted first (see upgradeDays)
+    def getTags(self):
+        if self.data.get("version", 1) < 3:
+            self.upgradeDays()
+        return self.data.setdefault("tags", odict())
+
+    def getDayTags(self, time=None):
+        day = tags.dayKey((time or q.Time()).datetime)
+        return day, self.getTags().setdefault(day, [])
+
+    def addTags(self, newTags, time=None):
+        day, dayTags = self.getDayTags(time)
+        for tag in newTags:
+            tag = tags.formatTag(*tags.parseTag(tag))
+            if tag not in dayTags:
+                dayTags.append(tag)
+        self.printTags(time)
+        self.save()
+
+    def removeTags(self, removeTags, time=None):
+        day, dayTags = self.getDayTags(time)
+        for tag in removeTags:
+            tag = tags.formatTag(*tags.parseTag(tag))
+            if tag in dayTags:
+                dayTags.remove(tag)
+            else:
+                print("'{}' is not a tag of {}".format(tag, balance.dayStr(model.decodeDay(day))))
+        if len(dayTags) == 0:
+            del self.getTags()[day]
+        self.printTags(time)
+        self.save()
+
+    def printTags(self, time=None):
+        day = tags.dayKey((time or q.Time()).datetime)
+        dayTags = self.getTags().get(day, [])
+        if len(dayTags) > 0:
+            print("Tags of {}: {}".format(balance.dayStr(model.decodeDay(day)), ", ".join(dayTags)))
+        else:
+            print("There are no tags for {}.".format(balance.dayStr(model.decodeDay(day))))
+
+    def analyzeTags(self, num=10, minDays=3):
+        # The first weight of every day (usually the morning weight) is compared to the first weight of the next day
+        dayWeights = odict()
+        weights = self.getItems("weight", datetime.min, datetime.max)
+        for weight in sorted(weights, key=lambda item: item.time):
+            day = weight.time.date()
+            if day not in dayWeights:
+                dayWeights[day] = weight.weight
+
+        dayTargets = {}
+        for day, weight in dayWeights.items():
+            nextDay = day + timedelta(days=1)
+            if nextDay in dayWeights:
+                dayTargets[tags.dayKey(day)] = dayWeights[nextDay] - weight
+
+        dayTags = odict((day, tagList) for day, tagList in self.getTags().items() if day in dayTargets)
+        days, targets, columns = tags.buildFeatureMatrix(dayTags, dayTargets)
+        stats = tags.correlate(targets, columns, minDays)
+        if len(stats) == 0:
+            raise model.WeloError("Not enough data. Tags have to be used on at least {} days that also have weight measurements on the day after.".format(minDays))
+
+        print("Analyzed {} days with {} tags. The average weight change to the next day is {:+.2f}kg.".format(
+            len(days), len(columns), sum(targets) / len(targets)))
+
+        def printStats(title, statList):
+            print()
+            print(title)
+            for stat in statList:
+                print("{}: correlation {:+.2f}, {:+.2f}kg per unit, {:+.2f}kg on average on {} days".format(
+                    stat.feature, stat.correlation, stat.slope, stat.meanTarget, stat.days))
+
+        stats.sort(key=lambda stat: stat.correlation)
+        printStats("# Tags followed by weight loss", [stat for stat in stats if stat.correlation < 0][:num])
+        printStats("# Tags followed by weight gain", [stat for stat in reversed(stats) if stat.correlation > 0][:num])
+
+    # Returns the intake, expenditure, BMR (kcal) and number of days with logged meals (see balance.getRange)
+    # and the deficit (kcal, negative for a surplus) and effective physical activity level if there are any
+    def getBalance(self, firstDay, lastDay):
+        if self.getBmr() == None or self.getActivity() == None:
+            raise model.WeloError("Please configure your height, sex, birthday and activity first (see 'welo config --help').")
+        totals = odict(balance.getRange(self, firstDay, lastDay))
+        totals["deficit"] = totals["expenditure"] - totals["intake"] if totals["days"] > 0 else None
+        totals["activity"] = totals["expenditure"] / totals["bmr"] if totals["days"] > 0 else None
+        return totals
+
+    def printBalance(self, start, end=None):
+        firstDay = start.datetime.date()
+        lastDay = end.datetime.date() if end else date.today()
+
+        totals = self.getBalance(firstDay, lastDay)
+        print("Energy balance from {} to {} ({} days with logged meals)".format(
+            balance.dayStr(firstDay), balance.dayStr(lastDay), totals["days"]))
+        if totals["days"] == 0:
+            return
+
+        days = totals["days"]
+        print("Intake: {} kcal ({} kcal/day)".format(round(totals["intake"]), round(totals["intake"] / days)))
+        print("Expenditure: {} kcal ({} kcal/day)".format(round(totals["expenditure"]), round(totals["expenditure"] / days)))
+        deficit = totals["deficit"]
+        if deficit > 0:
+            print("Deficit: {} kcal (~{})".format(round(deficit), q.Mass(deficit / balance.kcalPerKg)))
+        else:
+            print("Surplus: {} kcal (~{})".format(round(-deficit), q.Mass(-deficit / balance.kcalPerKg)))
+        print("Effective physical activity level: {}".format(q.Activity(totals["activity"])))
 
 # return longest substrings first
 def substrings(s, minLength=1):
@@ -486,6 +1205,17 @@ def foodItemNameMatchScore(ref, name):
             break
     return score
 
+class LineArgumentParser(argparse.ArgumentParser):
+    def error(self, message):
+        raise ValueError(message)
+
+def addMealArguments(parser):
+    parser.add_argument("food", nargs="*", help="A repeating list of weight and food name pairs. May also be 'leftovers' which represents the last logged meal or 'leftovers(time)' with time being the time of the meal which leftovers should reference. For leftovers the weight is a 'portion' (see epilog of this help text)")
+    parser.add_argument("--name", "-n", type=str, help="The name of the meal.")
+    parser.add_argument("--time", "-t", type=q.Time, help="The time of the meal.")
+    parser.add_argument("--portion", "-p", help="Only eat a portion of the meal. The parameter is a 'portion' ")
+    parser.add_argument("--notes", "-o", help="Additional notes.")
+
 def bmiStr(bmi):
     if bmi == None:
         return None
@@ -515,7 +1245,17 @@ def bmiStr(bmi):
         s += " (hyper obese)"
     return s
 
-def main():
+def getConfigPath():
+    return os.path.join(appdirs.user_config_dir("welo", False), "config.json")
+
+def openDataFile(path, foodFiles=[]):
+    if not os.path.isfile(path):
+        raise model.WeloError("Data file '{}' could not be found.".format(path))
+    data = DataWrapper(None, path)
+    data.foodFiles = foodFiles
+    return data
+
+def cli():
     parser = argparse.ArgumentParser(prog="welo", description="Weight and calorie tracker")
     subparsers = parser.add_subparsers(dest="command", help="")
     subparsers.required = True
@@ -523,10 +1263,11 @@ def main():
     configParser = subparsers.add_parser("config", description="Set the current data file or information about yourself, to enable extra output regarding BMI, BMR, caloric deficit, etc.")
     configParser.add_argument("datafile", nargs="?", type=str, help="This will set your current data file that welo will save its data to. If that file does not exist, it will be created.")
     configParser.add_argument("--height", "-e", type=q.Length, help="Your height.")
-    configParser.add_argument("--activity", "-a", type=q.Activity, help="Your physical activity level (PAL).")
+    configParser.add_argument("--activity", "-a", type=q.Activity, help="Your physical activity level (PAL) without the workouts you log.")
     configParser.add_argument("--birthday", "-b", type=q.Time, help="Your birthday to determine age.")
     configParser.add_argument("--sex", "-s", type=q.Sex, help="Your sex.")
     configParser.add_argument("--goalweight", "-g", type=q.Mass, help="Your goal weight.")
+    configParser.add_argument("--foodfile", "-f", action="append", help="Add a JSON file of food names and their nutritional information (per 100g), e.g. {\"tomato\": {\"energy\": \"18kcal\", \"fat\": \"0.2g\"}}, that unknown foods are looked up in. May be given multiple times.")
 
     eatParser = subparsers.add_parser("eat", description="Log or get info about the food you ate.", epilog="""
 'portion':
@@ -534,14 +1275,12 @@ May either be a weight, but also a unitless number, representing a factor which
 Both the weight and the factor can be negative in which case the portion represents the total amount of whatever it is referencing *minus* that portion.
 For a meal that has a total weight of 1000g '0.2' would represent a portion of 200g, '-0.2' would represent a portion of 800g, so would '-200g'.
 """)
-    eatParser.add_argument("food", nargs="*", help="A repeating list of weight and food name pairs. May also be 'leftovers' which represents the last logged meal or 'leftovers(time)' with time being the time of the meal which leftovers should reference. For leftovers the weight is a 'portion' (see epilog of this help text)")
-    eatParser.add_argument("--name", "-n", type=str, help="The name of the meal.")
-    eatParser.add_argument("--time", "-t", type=q.Time, help="The time of the meal.")
+    addMealArguments(eatParser)
     eatParser.add_argument("--dry", "-d", action="store_true", help="If given, the meal will not be saved, but only the output will be shown and nutritional information about the food items will be cached.")
     eatParser.add_argument("--undo", "-u", action="store_true", help="If given, undo last meal or the one at --time. Positional arguments (i.e. food) will be ignored.")
     eatParser.add_argument("--resize", "-r", help="Resize the last eaten meal or the one at --time. The parameter is a 'portion' (see epilog of this help text).")
-    eatParser.add_argument("--portion", "-p", help="Only eat a portion of the meal. The parameter is a 'portion' ")
-    eatParser.add_argument("--notes", "-o", help="Additional notes.")
+    eatParser.add_argument("--batch", "-b", help="Log many meals from a file ('-' for stdin). Every line has the same arguments as this command (food, --name, --time, --portion, --notes), e.g. '--time \"17.05.2018 13:00\" 500g pasta'. Lines starting with '#' are ignored.")
+    eatParser.add_argument("--skipunknown", "-k", action="store_true", help="For --batch: skip meals containing foods with unknown nutritional information instead of asking for it.")
 
     weightParser = subparsers.add_parser("weight", description="Log new weight or show last weight measurements.")
     weightParser.add_argument("weight", nargs="?", type=q.Mass, help="The new weight.")
@@ -553,51 +1292,156 @@ For a meal that has a total weight of 1000g '0.2' would represent a portion of 2
     workoutParser.add_argument("energy", nargs="?", type=q.Energy, help="The amount of energy used for the activity.")
     workoutParser.add_argument("--time", "-t", type=q.Time, help="The time of the workout.")
     workoutParser.add_argument("--notes", "-o", help="Additional notes")
-    # TODO: Use energy / duration to estimate physical activity level
 
     nutriInfoParser = subparsers.add_parser("nutriinfo", description="Show nutritional info about a food item or find similar food items.")
     nutriInfoParser.add_argument("fooditem", help="The food item to search for or get information about.")
 
     tagParser = subparsers.add_parser("tag", description="Add tags to days to include in potential analyses about your weight development.")
-    tagParser.add_argument("tags", nargs="*", type=str, help="A list of tags. You may add tag parameters in brackets: 'mytag(param, param)'.")
-    tagParser.add_argument("--time", "-t", type=q.Time, help="The time of the workout.")
+    tagParser.add_argument("tags", nargs="*", type=str, help="A list of tags. You may add tag parameters in brackets: 'mytag(param, param)'. If the first parameter is a number (e.g. 'sleep(6.5)') it is used as the value of that tag in the analysis. If no tags are given, the tags of the day are shown.")
+    tagParser.add_argument("--time", "-t", type=q.Time, help="A time on the day to tag. Defaults to today.")
+    tagParser.add_argument("--remove", "-r", action="store_true", help="If given, the tags are removed from the day instead.")
+    tagParser.add_argument("--analyze", "-a", action="store_true", help="Correlate all tags with the weight change to the next day and show the tags that were most often followed by weight loss or gain.")
+    tagParser.add_argument("--num", "-n", type=int, default=10, help="The number of tags to show for --analyze.")
+    tagParser.add_argument("--mindays", "-m", type=int, default=3, help="The number of days a tag has to be used on to be considered by --analyze.")
 
     summaryParser = subparsers.add_parser("summary", description="Prints a summary of all logged data in a specified timeframe.")
     summaryParser.add_argument("start", type=q.Time, help="The beginning of the time frame.")
     summaryParser.add_argument("end", nargs="?", type=q.Time, help="The end of the time frame. Default is 24h after 'from'.")
 
+    maintenanceParser = subparsers.add_parser("maintenance", description="Verify the totals that are stored with every meal.")
+    maintenanceParser.add_argument("--rebuild", "-r", action="store_true", help="If given, missing or outdated meal totals will be rebuilt and saved.")
+
+    archiveParser = subparsers.add_parser("archive", description="Move old weights, workouts and meals out of the data file into compressed archive segments. Summaries of archived time frames will still include them.")
+    archiveParser.add_argument("--days", "-y", type=int, help="Archive entries older than this many days (rounded down to whole months). Defaults to the last value used or 90.")
+    archiveParser.add_argument("--compression", "-c", choices=list(archive.compressions.keys()), help="The compression used for new segments. Defaults to the last value used or gzip.")
+
+    reportParser = subparsers.add_parser("report", description="Create weekly reports (intake, deficit and weight change) for many data files at once, e.g. one per client. The data files are processed in parallel and the current data file is not used.")
+    reportParser.add_argument("datafiles", help="A directory containing data files (*.json) or a glob pattern.")
+    reportParser.add_argument("--start", "-s", type=q.Time, help="The first day of the first week. Defaults to the last --weeks full weeks before today.")
+    reportParser.add_argument("--weeks", "-w", type=int, default=1, help="The number of weeks to report.")
+    reportParser.add_argument("--format", "-f", choices=["csv", "json"], default="csv", help="The output format.")
+    reportParser.add_argument("--output", "-o", help="The file to write the report to. Defaults to stdout.")
+    reportParser.add_argument("--jobs", "-j", type=int, help="The number of worker processes. Defaults to the number of processors.")
+
+    balanceParser = subparsers.add_parser("balance", description="Show your energy balance (intake vs. expenditure including logged workouts) and your effective physical activity level in a specified timeframe. Only days with logged meals are counted.")
+    balanceParser.add_argument("start", type=q.Time, help="The first day of the time frame.")
+    balanceParser.add_argument("end", nargs="?", type=q.Time, help="The last day of the time frame. Defaults to today.")
+
+    importFoodsParser = subparsers.add_parser("importfoods", description="Import a food database (e.g. an Open Food Facts CSV export) into a local offline database. 'eat' and 'nutriinfo' will look up unknown foods there by name.")
+    importFoodsParser.add_argument("csvfile", help="The CSV file to import. The columns are expected to be named like in Open Food Facts exports (e.g. product_name, energy-kcal_100g, fat_100g).")
+    importFoodsParser.add_argument("--append", "-a", action="store_true", help="If given, the foods are added to the existing offline database instead of replacing it.")
+    importFoodsParser.add_argument("--delimiter", "-d", help="The delimiter of the CSV file. Defaults to tab if the header contains tabs, otherwise comma.")
+
+    completionParser = subparsers.add_parser("completion", description="Print a shell completion script for subcommands, options, food names and leftovers. Add 'eval \"$(welo completion bash)\"' to your .bashrc (or the zsh equivalent to your .zshrc).")
+    completionParser.add_argument("shell", choices=["bash", "zsh"], help="The shell to generate the completion script for.")
+
+    watchParser = subparsers.add_parser("watch", description="Show a live dashboard of today's meals, workouts, totals, remaining energy budget and latest weight, which is updated whenever the data file changes. Quit with Ctrl+C.")
+    watchParser.add_argument("--interval", "-i", type=float, default=1.0, help="How often (in seconds) to check the data file for changes.")
+
+    syncParser = subparsers.add_parser("sync", description="Merge two data files (e.g. of two computers), so that both of them contain the meals, weights, workouts, tags and foods of both. Only days that differ are merged, identical entries are kept once. If a food has different nutritional information in both files, the one of the first file is used.")
+    syncParser.add_argument("datafiles", nargs=2, help="The two data files.")
+    syncParser.add_argument("--dry", "-d", action="store_true", help="If given, only show what would be merged without changing any file.")
+
+    plotParser = subparsers.add_parser("plot", description="Plot your weight, your daily energy intake or your daily energy balance (deficit) in the terminal or to an SVG file. A smoothed trend is drawn over the values and your goal weight over your weight. Long time frames are downsampled to the resolution of the output.")
+    plotParser.add_argument("kind", choices=plot.kinds, help="What to plot.")
+    plotParser.add_argument("start", nargs="?", type=q.Time, help="The beginning of the time frame. Defaults to the first logged entry.")
+    plotParser.add_argument("end", nargs="?", type=q.Time, help="The end of the time frame. Defaults to the last logged entry.")
+    plotParser.add_argument("--output", "-o", help="Write an SVG file instead of drawing in the terminal.")
+    plotParser.add_argument("--width", "-x", type=int, help="The width in characters (terminal) or pixels (SVG).")
+    plotParser.add_argument("--height", "-y", type=int, help="The height in characters (terminal) or pixels (SVG).")
+    plotParser.add_argument("--sparkline", "-s", action="store_true", help="Only print a single line sparkline.")
+    plotParser.add_argument("--smoothing", "-m", type=float, default=0.1, help="The smoothing factor of the trend (between 0 and 1, smaller is smoother).")
+
+    forecastParser = subparsers.add_parser("forecast", description="Estimate when you will reach your goal weight. The noise of your weight measurements, your intake and the energy your logs do not account for are fitted to the last days and thousands of future weight trajectories are simulated from them. The median and the 10% and 90% dates are shown for your average intake and optionally for another one. Needs NumPy.")
+    forecastParser.add_argument("--intake", "-i", type=q.Energy, help="Also forecast for this daily energy intake (e.g. 1800kcal).")
+    forecastParser.add_argument("--days", "-d", type=int, default=56, help="The number of past days to fit the model to.")
+    forecastParser.add_argument("--runs", "-r", type=int, default=10000, help="The number of simulated trajectories.")
+
+    checkParser = subparsers.add_parser("check", description="Check a data file for entries that welo can not read (e.g. after editing it by hand): quantities and times that can not be parsed, meal totals that do not match their food items, entries in the future and leftovers of meals that do not exist. Every problem is reported with its location. The data file itself is never changed.")
+    checkParser.add_argument("datafile", nargs="?", help="The data file to check. Defaults to the current data file.")
+    checkParser.add_argument("--repair", "-r", action="store_true", help="Write a repaired copy of the data file. Entries that can not be repaired are removed.")
+    checkParser.add_argument("--output", "-o", help="The file to write the repaired copy to. Defaults to '<datafile>.repaired'.")
+    checkParser.add_argument("--jobs", "-j", type=int, help="The number of worker processes for large data files. Defaults to the number of processors.")
+
+    migrateParser = subparsers.add_parser("migrate", description="Convert the data file and its archive to the current file format. Data files of older versions are otherwise converted the next time they are saved, archives only by this command.")
+
+    searchParser = subparsers.add_parser("search", description="Find meals by their name, food names or notes, newest first. Every argument has to match: words are matched exactly, several words in one argument (e.g. \"olive oil\") as a phrase and words ending in '*' as a prefix.")
+    searchParser.add_argument("terms", nargs="*", help="The words, phrases or prefixes to search for.")
+    searchParser.add_argument("--start", "-s", type=q.Time, help="Only find meals after this time.")
+    searchParser.add_argument("--end", "-e", type=q.Time, help="Only find meals before this time.")
+    searchParser.add_argument("--last", "-n", type=int, default=10, help="Only show the last n matching meals.")
+    searchParser.add_argument("--rebuild", "-r", action="store_true", help="Rebuild the search index.")
+
     args = parser.parse_args()
 
-    configPath = os.path.join(appdirs.user_config_dir("welo", False), "config.json")
+    if args.command == "report":
+        report.report(args.datafiles, args.start, args.weeks, args.format, args.output, args.jobs)
+        return
+
+    if args.command == "importfoods":
+        dbPath = offlinedb.getDefaultPath()
+        os.makedirs(os.path.dirname(dbPath), exist_ok=True)
+        db = offlinedb.OfflineFoodDb(dbPath)
+        db.importCsv(args.csvfile, args.append, args.delimiter)
+        db.close()
+        return
+
+    if args.command == "check" and args.datafile:
+        check.check(args.datafile, args.repair, args.output, args.jobs)
+        return
+
+    if args.command == "sync":
+        dataFiles = [openDataFile(path) for path in args.datafiles]
+        sync.sync(dataFiles[0], dataFiles[1], args.dry)
+        return
+
+    configPath = getConfigPath()
+
+    if args.command == "completion":
+        commands = odict()
+        for command, commandParser in subparsers.choices.items():
+            commands[command] = [option for action in commandParser._actions for option in action.option_strings]
+        print(completion.getScript(args.shell, commands, configPath))
+        return
+
     if os.path.isfile(configPath):
         with open(configPath) as f:
             config = json.load(f, object_pairs_hook=odict)
+    elif args.command == "config" and args.datafile:
+        config = odict()
     else:
-        quit("Please call 'welo config <datafile>' on first start!")
-
-    if args.command == "config" and args.datafile:
-        print("Set current data file to '{}'".format(args.datafile))
-        config["dataFile"] = os.path.abspath(args.datafile)
+        raise model.WeloError("Please call 'welo config <datafile>' on first start!")
+
+    if args.command == "config" and (args.datafile or args.foodfile):
+        if args.datafile:
+            print("Set current data file to '{}'".format(args.datafile))
+            config["dataFile"] = os.path.abspath(args.datafile)
+        for foodFile in args.foodfile or []:
+            print("Added food file '{}'".format(foodFile))
+            config.setdefault("foodFiles", []).append(os.path.abspath(foodFile))
         os.makedirs(os.path.dirname(configPath), exist_ok=True)
         with open(configPath, "w") as f:
             json.dump(config, f, indent=4)
 
-        if not os.path.isfile(config["dataFile"]):
+        if args.datafile and not os.path.isfile(config["dataFile"]):
             print("Creating new data file '{}'..".format(config["dataFile"]))
             data = DataWrapper(odict([
+                ("version", model.version),
                 ("config", odict()),
                 ("weight", []),
                 ("workout", []),
                 ("meals", []),
-                ("nutriInfoCache", odict()),
+                ("tags", odict()),
             ]), args.datafile)
             data.save()
 
-    if not os.path.isfile(config["dataFile"]):
-        quit("Data file could not be found.")
+    if args.command == "watch":
+        if not os.path.isfile(config["dataFile"]):
+            raise model.WeloError("Data file '{}' could not be found.".format(config["dataFile"]))
+        watch.watch(config["dataFile"], args.interval)
+        return
 
-    with open(config["dataFile"]) as f:
-        data = DataWrapper(json.load(f, object_pairs_hook=odict), config["dataFile"])
+    data = openDataFile(config["dataFile"], config.get("foodFiles", []))
 
     if args.command == "config":
         if args.height:
@@ -620,13 +1464,22 @@ For a meal that has a total weight of 1000g '0.2' would represent a portion of 2
         birthday = data.getConfig("birthday")
         print("age: {} years old".format(birthday.getAge() if birthday else None))
         print("activity: {}".format(data.getConfig("activity")))
+        effectiveActivity = data.getEffectiveActivity()
+        print("effective activity (last 14 days): {}".format(q.Activity(effectiveActivity) if effectiveActivity else None))
         print("weight: {}, bmi: {}".format(data.getConfig("weight"), bmiStr(data.getBmi())))
         print("goal weight: {}".format(data.getConfig("goalWeight")))
+        print("food files: {}".format(", ".join(data.foodFiles) or None))
         print()
         print("Basal metabolic rate: {} kcal/day".format(data.getBmr()))
         print("Total energy expenditure: {} kcal/day".format(data.getTotalEnergyExpenditure()))
 
     elif args.command == "eat":
+        if args.batch:
+            mealLineParser = LineArgumentParser(prog="line", add_help=False)
+            addMealArguments(mealLineParser)
+            data.eatBatch(args.batch, mealLineParser.parse_args, args.dry, args.skipunknown)
+            return
+
         if args.undo:
             data.eatUndo(args.time)
             return
@@ -650,18 +1503,55 @@ For a meal that has a total weight of 1000g '0.2' would represent a portion of 2
         data.nutriInfo(args.fooditem)
 
     elif args.command == "tag":
-        quit("Not implemented yet!")
-        pass
+        if args.analyze:
+            data.analyzeTags(args.num, args.mindays)
+        elif len(args.tags) == 0:
+            data.printTags(args.time)
+        elif args.remove:
+            data.removeTags(args.tags, args.time)
+        else:
+            data.addTags(args.tags, args.time)
 
     elif args.command == "workout":
         if args.name:
             if not args.duration:
-                quit("Please specify a duration")
+                raise model.WeloError("Please specify a duration")
             data.addWorkout(args.name, args.duration, args.energy, args.time, args.notes)
         else:
             data.workoutInfo(args.time)
     elif args.command == "summary":
         data.printSummary(args.start, args.end)
 
+    elif args.command == "maintenance":
+        data.checkMealTotals(args.rebuild)
+
+    elif args.command == "archive":
+        data.archiveLogs(args.days, args.compression)
+
+    elif args.command == "balance":
+        data.printBalance(args.start, args.end)
+
+    elif args.command == "search":
+        data.searchMeals(args.terms, args.start, args.end, args.last, args.rebuild)
+
+    elif args.command == "migrate":
+        data.migrate()
+
+    elif args.command == "plot":
+        plot.plot(data, args.kind, args.start, args.end, args.output, args.width, args.height, args.sparkline, args.smoothing)
+
+    elif args.command == "check":
+        check.check(data.path, args.repair, args.output, args.jobs)
+
+    elif args.command == "forecast":
+        forecast.printForecast(data, args.intake, args.days, args.runs)
+
+# Errors are only shown to the user here, everything else raises model.WeloError (see store.WeloStore)
+def main():
+    try:
+        cli()
+    except model.WeloError as e:
+        quit(str(e))
+
 if __name__ == "__main__":
     main()